@@ -11,6 +11,7 @@ BOOK_DOWNLOAD_PATH = "/root/shuku"  # 书籍下载路径
 if not os.path.exists(BOOK_DOWNLOAD_PATH):
     os.makedirs(BOOK_DOWNLOAD_PATH, exist_ok=True)
 ALLOWED_EXTENSIONS = ['.txt', '.epub']  # 允许下载的文件扩展名
+PREMIUM_BOOKS_DIR = 'shu'  # 精品书籍存储路径
 BOOK_POINT_REWARD = 10  # 上传新书获得的积分奖励
 
 # 管理员配置
@@ -24,6 +25,55 @@ DB_CONFIG = {
     'database': 'novel_bot_db'
 }
 
+# 数据库连接池配置
+DB_POOL_MIN_SIZE = 2  # 启动时预先建立的连接数
+DB_POOL_MAX_SIZE = 10  # 最大连接数
+DB_POOL_MAX_LIFETIME = 3600  # 连接最大存活时间（秒），超过后回收重建
+DB_POOL_PING_INTERVAL = 30  # 连接空闲超过多少秒后借出前先ping检查
+DB_POOL_TIMEOUT = 10  # 连接池满时等待连接的最长时间（秒）
+
+# 积分写回缓冲配置
+POINTS_FLUSH_INTERVAL_MS = 1000  # 水群奖励积分每隔多少毫秒批量写入一次数据库
+POINTS_FLUSH_THRESHOLD = 200  # 缓冲中待写入的用户数达到多少时立即写入
+EVENT_FLUSH_INTERVAL_MS = 5000  # 奇遇计数（user_events）每隔多少毫秒批量写入一次数据库
+EVENT_FLUSH_THRESHOLD = 500  # 奇遇计数缓冲中的用户数达到多少时立即写入
+
+# 用户信息缓存配置
+PROFILE_CACHE_SIZE = 5000  # 最多缓存多少条记录
+PROFILE_CACHE_TTL = 60  # 缓存有效期（秒），兜底其他进程（如脚本）直接改库的情况
+
+# 书籍下载调度配置
+DOWNLOAD_WORKERS = 4  # 同时下载的文件数（所有用户共享），按服务器带宽调整
+DOWNLOAD_MIN_FREE_MB = 1024  # 下载后磁盘剩余空间低于多少MB时拒绝收录
+UPLOAD_BURST_WINDOW = 5  # 同一用户上传间隔不超过多少秒的文件归为一批，整批统一写库和汇总
+UPLOAD_SUMMARY_INTERVAL = 3  # 批量上传汇总消息最快多少秒更新一次
+PROGRESS_UPDATE_INTERVAL = 3  # 下载进度消息在每个聊天中最快多少秒更新一次
+
+# 书籍压缩存储配置
+BOOK_COMPRESSION_ENABLED = False  # 是否压缩保存文本书籍（发送时自动解压）
+BOOK_COMPRESS_EXTENSIONS = ['.txt']  # 需要压缩的文件扩展名（epub本身已压缩）
+BOOK_COMPRESS_MIN_RATIO = 0.9  # 压缩后小于原大小的多少才保留压缩文件
+BOOK_COMPRESS_BATCH_SIZE = 50  # 后台转换已有书库时每批压缩多少个文件
+BOOK_COMPRESS_INTERVAL = 600  # 后台转换任务每隔多少秒执行一批
+
+# 精品书籍目录配置
+CATALOG_POLL_INTERVAL = 30  # 每隔多少秒检查一次精品书库目录是否有变化
+SEARCH_MAX_RESULTS = 200  # /sou 最多返回多少本书（按匹配程度和上传时间排序）
+SEARCH_CURSOR_SIZE = 1000  # 最多缓存多少次搜索结果供翻页使用
+SEARCH_CURSOR_TTL = 1800  # 搜索结果缓存多少秒，过期后翻页需要重新搜索
+
+# 书籍元数据提取配置
+METADATA_WORKERS = 2  # 后台提取书籍元数据（字数、章节、作者等）的worker数
+
+# 近似重复书籍检测配置
+NEAR_DUP_ENABLED = True  # 是否检测换编码、重新排版、加广告后重复上传的书籍
+NEAR_DUP_THRESHOLD = 0.85  # 与已收录书籍的相似度达到多少时视为重复（0~1）
+FINGERPRINT_MAX_CHARS = 2000000  # 计算指纹时最多读取的字符数
+FINGERPRINT_WORKERS = 2  # 计算指纹的进程数（纯CPU计算，不放在线程中以免拖慢事件循环）
+
+# 热配置注册表配置
+CONFIG_RELOAD_INTERVAL = 300  # 每隔多少秒从数据库重新加载授权群组、管理员和大乐透状态
+
 # 修仙境界配置
 CULTIVATION_STAGES = [
     "凡夫俗子", 
@@ -1,17 +1,24 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.handlers import MessageHandler
+from pyrogram.errors import FileIdInvalid, FileReferenceExpired, FileReferenceInvalid, MediaEmpty
 from bot.services.admin_service import admin_service
-from bot.services.db_service import db_service
+from bot.services.async_db_service import async_db_service
+from bot.services.config_registry import config_registry
+from bot.services.write_behind import points_buffer
+from bot.services.progress_reporter import progress_reporter
+from bot.services.compression_service import compression_service
+from bot.services.catalog_index import catalog_index
+from bot.services.search_cursors import search_cursors
+from bot.services.metadata_service import metadata_service
+from bot.config.config import PREMIUM_BOOKS_DIR, SEARCH_MAX_RESULTS
+from bot.handlers.command_router import command_router
 from datetime import datetime
 import os
-import glob
 import math
 import asyncio
 import re
-from typing import List, Dict
 from pyrogram.enums import ChatType
-import time
 
 # 自动删除消息的辅助函数
 async def auto_delete_messages(messages, delay=10):
@@ -32,57 +39,14 @@ async def auto_delete_messages(messages, delay=10):
         except Exception as e:
             print(f"删除消息失败: {e}")
 
-# 进度回调函数
-async def progress_callback(current, total, status_message, file_name, start_time):
-    """显示文件下载进度
-    
-    Args:
-        current: 当前已下载的字节数
-        total: 文件总字节数
-        status_message: 用于更新的状态消息
-        file_name: 文件名称
-        start_time: 开始时间
-    """
-    # 防止除零错误
-    if total <= 0:
-        total = 1  # 避免除零错误
-    
-    # 计算百分比
-    percent = current * 100 / total
-    
-    # 计算速度
-    elapsed_time = time.time() - start_time
-    if elapsed_time == 0:
-        elapsed_time = 0.1  # 避免除零错误
-    speed = current / elapsed_time
-    
-    # 格式化速度
-    if speed < 1024:
-        speed_text = f"{speed:.2f} B/s"
-    elif speed < 1024 * 1024:
-        speed_text = f"{speed/1024:.2f} KB/s"
-    else:
-        speed_text = f"{speed/(1024*1024):.2f} MB/s"
-    
-    # 每5%更新一次消息，避免频繁更新
-    if current == total or percent % 5 < 0.1 or current == 0:
-        try:
-            await status_message.edit_text(
-                f"⏳ 正在下载 {file_name}...\n"
-                f"进度: {current}/{total} 字节 ({percent:.1f}%)\n"
-                f"速度: {speed_text}"
-            )
-        except Exception as e:
-            print(f"更新进度消息失败: {e}")
-
-# 精品书籍存储路径
-PREMIUM_BOOKS_DIR = 'shu'
 # 每页显示的书籍数量
 BOOKS_PER_PAGE = 10
 # 兑换书籍的积分成本
 BOOK_EXCHANGE_COST = 2000
 # 上传书籍奖励积分
 BOOK_UPLOAD_REWARD = 2000
+# 发送file_id时表示file_id已失效的错误（file_id格式无法解析时pyrogram抛出ValueError）
+FILE_ID_ERRORS = (FileIdInvalid, FileReferenceExpired, FileReferenceInvalid, MediaEmpty, ValueError)
 
 # 确保书籍目录存在
 if not os.path.exists(PREMIUM_BOOKS_DIR):
@@ -116,13 +80,6 @@ async def upload_premium_book(client, message):
     """处理/upload命令，开始上传精品书籍会话"""
     user_id = message.from_user.id
     
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        reply = await message.reply("⚠️ 只有管理员才能执行此操作")
-        # 5秒后自动删除
-        await auto_delete_messages([message, reply], 5)
-        return
-    
     # 创建或重置上传会话
     admin_upload_sessions[user_id] = {
         "status": "uploading",
@@ -178,31 +135,27 @@ async def handle_admin_file_upload(client, message):
     new_file_name = f"{name_base}_{timestamp}{file_extension}"
     file_path = os.path.join(PREMIUM_BOOKS_DIR, new_file_name)
     
-    # 通知用户
-    status_message = await message.reply(f"⏳ 准备下载 {file_name}...")
+    # 同一聊天中同时下载的文件共用一条进度消息
+    chat_id = message.chat.id
+    progress_reporter.start(client, chat_id, message.id, file_name, document.file_size, reply_to_message_id=message.id)
     
     try:
-        # 记录开始时间
-        start_time = time.time()
-        
         # 下载文件，使用进度回调来更新状态
         await client.download_media(
             message=file_id, 
             file_name=file_path,
-            progress=progress_callback,
-            progress_args=(status_message, file_name, start_time)
+            progress=progress_reporter.update,
+            progress_args=(chat_id, message.id)
         )
         
-        # 创建书籍信息文件
-        info_file_path = os.path.join(PREMIUM_BOOKS_DIR, f"{name_base}_{timestamp}.info")
-        with open(info_file_path, 'w', encoding='utf-8') as f:
-            f.write(f"原始文件名: {file_name}\n")
-            f.write(f"上传时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"上传者ID: {user_id}\n")
-            f.write(f"文件大小: {document.file_size} 字节\n")
+        # 开启压缩存储时压缩保存，登记到精品书籍表，之后在后台提取元数据
+        file_path = await compression_service.compress(file_path)
+        # 记下管理员上传消息中的file_id，兑换时直接发送
+        book = await catalog_index.add_uploaded(file_path, file_name, user_id, file_id=file_id)
+        metadata_service.enqueue(file_path)
         
         # 更新状态消息
-        await status_message.edit_text(f"✅ 书籍 {file_name} 上传成功！\n存储为: {new_file_name}")
+        progress_reporter.finish(chat_id, message.id, f"✅ 书籍 {file_name} 上传成功！编号 #{book['id']}，存储为: {new_file_name}")
         
         # 添加到上传会话中
         admin_upload_sessions[user_id]["uploaded_books"].append({
@@ -218,10 +171,10 @@ async def handle_admin_file_upload(client, message):
             file_size_str = f"{size_mb:.2f} MB"
             
             # 获取所有授权群组
-            authorized_groups = db_service.get_all_authorized_groups()
+            authorized_groups = config_registry.get_authorized_groups()
             
             # 构建通知消息
-            notification_text = f"📚 书单新入一本书：{file_name} {file_size_str}"
+            notification_text = f"📚 书单新入一本书：#{book['id']} {file_name} {file_size_str}"
             
             # 发送到所有授权群组
             for group in authorized_groups:
@@ -234,7 +187,7 @@ async def handle_admin_file_upload(client, message):
         
     except Exception as e:
         # 上传失败
-        await status_message.edit_text(f"❌ 上传失败: {str(e)}")
+        progress_reporter.finish(chat_id, message.id, f"❌ {file_name} 上传失败: {str(e)}")
 
 # 处理上传完成命令
 async def done_upload_command(client, message):
@@ -242,11 +195,6 @@ async def done_upload_command(client, message):
     user_id = message.from_user.id
     print(f"收到/done命令，用户ID: {user_id}")
     
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        print(f"用户{user_id}不是管理员")
-        return await message.reply("⚠️ 只有管理员才能执行此操作")
-    
     # 检查是否在私聊
     print(f"聊天类型: {message.chat.type}")
     if message.chat.type != ChatType.PRIVATE:
@@ -338,7 +286,7 @@ async def handle_reward_user_id(client, message):
     
     # 检查用户是否存在
     print(f"正在检查用户 {target_user_id} 是否存在")
-    target_user = db_service.get_user(target_user_id)
+    target_user = await async_db_service.get_user(target_user_id)
     if not target_user:
         print(f"用户 {target_user_id} 不存在")
         return await message.reply(f"⚠️ 用户 {target_user_id} 不存在")
@@ -353,7 +301,7 @@ async def handle_reward_user_id(client, message):
     
     # 给用户增加积分
     try:
-        new_points = db_service.update_points(target_user_id, total_reward)
+        new_points = await async_db_service.update_points(target_user_id, total_reward)
         print(f"已成功增加积分，用户新积分: {new_points}")
         
         # 构建奖励消息
@@ -374,74 +322,37 @@ async def handle_reward_user_id(client, message):
         print(f"奖励积分失败: {str(e)}")
         return await message.reply(f"⚠️ 奖励积分失败: {str(e)}")
 
-# 获取精品书籍列表
-def get_premium_books() -> List[Dict]:
-    """获取所有精品书籍信息"""
-    books = []
-    
-    # 获取所有书籍文件
-    book_files = glob.glob(os.path.join(PREMIUM_BOOKS_DIR, "*.*"))
-    for file_path in book_files:
-        # 排除.info文件
-        if file_path.endswith('.info'):
-            continue
-        
-        # 获取文件名（不含路径）
-        file_name = os.path.basename(file_path)
-        # 获取文件大小
-        file_size = os.path.getsize(file_path)
-        # 获取对应的信息文件
-        info_file = os.path.splitext(file_path)[0] + '.info'
-        
-        original_name = file_name
-        
-        # 如果有信息文件，读取原始文件名
-        if os.path.exists(info_file):
-            with open(info_file, 'r', encoding='utf-8') as f:
-                info_content = f.read()
-                for line in info_content.splitlines():
-                    if line.startswith("原始文件名:"):
-                        original_name = line.split(":", 1)[1].strip()
-                        break
-        
-        books.append({
-            'filename': file_name,
-            'original_name': original_name,
-            'size': file_size,
-            'path': file_path
-        })
-    
-    # 按上传时间排序（文件名中包含时间戳）
-    books.sort(key=lambda x: x['filename'], reverse=True)
-    
-    # 处理同名书籍，添加编号
-    book_count = {}  # 用于记录每个书名出现的次数
-    book_index = {}  # 用于记录每个书名当前的编号
-    
-    # 第一次遍历，统计每个书名出现的次数
-    for book in books:
-        name = book['original_name']
-        if name in book_count:
-            book_count[name] += 1
-        else:
-            book_count[name] = 1
-    
-    # 第二次遍历，添加编号
-    for book in books:
-        name = book['original_name']
-        # 只有当同名书籍多于1本时才添加编号
-        if book_count[name] > 1:
-            # 初始化或增加编号
-            if name not in book_index:
-                book_index[name] = 1
-            else:
-                book_index[name] += 1
-            # 添加编号到原始名称中
-            book['display_name'] = f"{name} (#{book_index[name]})"
-        else:
-            book['display_name'] = name
-    
-    return books
+async def get_books_metadata(books):
+    """获取书籍预先提取的元数据，返回{MD5: 元数据}"""
+    try:
+        return await async_db_service.get_book_metadata([book['md5'] for book in books if book['md5']])
+    except Exception as e:
+        print(f"获取书籍元数据失败: {e}")
+        return {}
+
+def format_book_entry(book, metadata=None):
+    """格式化书单中的一本书：编号 书名 大小, 上传日期，有元数据时附加作者、字数和章节数"""
+    # 格式化文件大小
+    size_mb = book['size'] / (1024 * 1024)
+    file_size_str = f"{size_mb:.2f} MB"
+    
+    # 上传日期: YYYY-MM-DD
+    upload_time = book['uploaded_at'].strftime('%Y-%m-%d')
+    
+    entry = f"#{book['id']} `{book['display_name']}` {file_size_str}, {upload_time}\n"
+    
+    if metadata:
+        details = []
+        if metadata['author']:
+            details.append(f"✍️ {metadata['author']}")
+        if metadata['word_count']:
+            details.append(f"{metadata['word_count'] / 10000:.1f}万字")
+        if metadata['chapter_count']:
+            details.append(f"{metadata['chapter_count']}章")
+        if details:
+            entry += "    " + " · ".join(details) + "\n"
+    
+    return entry + "\n"
 
 # 列出精品书籍
 async def list_premium_books(client, message):
@@ -451,10 +362,8 @@ async def list_premium_books(client, message):
     # 检查是否是管理员，普通用户也可以查看
     is_admin = admin_service.is_admin(user_id)
     
-    # 获取书籍列表
-    books = get_premium_books()
-    
-    if not books:
+    # 书库为空
+    if not catalog_index.get_books():
         reply = await message.reply("📚 精品书籍库为空")
         # 如果在群组中，5秒后自动删除
         if message.chat.type != ChatType.PRIVATE:
@@ -470,42 +379,16 @@ async def list_premium_books(client, message):
         except ValueError:
             page = 1
     
-    # 计算总页数
-    total_pages = math.ceil(len(books) / BOOKS_PER_PAGE)
-    
-    # 确保页码有效
-    if page < 1:
-        page = 1
-    if page > total_pages:
-        page = total_pages
-    
-    # 获取当前页的书籍
-    start_idx = (page - 1) * BOOKS_PER_PAGE
-    end_idx = start_idx + BOOKS_PER_PAGE
-    current_page_books = books[start_idx:end_idx]
+    # 从目录索引获取当前页的书籍（页码超出范围时自动修正）
+    current_page_books, page, total_pages = catalog_index.get_page(page, BOOKS_PER_PAGE)
     
     # 构建显示文本
     reply_text = f"📚 精品书籍列表 (第 {page}/{total_pages} 页)\n\n"
     
-    for idx, book in enumerate(current_page_books, start=1):
-        # 格式化文件大小
-        size_mb = book['size'] / (1024 * 1024)
-        file_size_str = f"{size_mb:.2f} MB"
-        
-        # 提取上传时间
-        timestamp_match = re.search(r'_(\d{8}_\d{6})', book['filename'])
-        upload_time = ""
-        if timestamp_match:
-            time_str = timestamp_match.group(1)
-            upload_time = time_str[:8]  # 只取日期部分 YYYYMMDD
-            try:
-                # 格式化为更易读的形式: YYYY-MM-DD
-                upload_time = f"{time_str[:4]}-{time_str[4:6]}-{time_str[6:8]}"
-            except:
-                pass
-        
-        # 使用新格式：书名 大小, 上传时间
-        reply_text += f"{idx}. `{book['display_name']}` {file_size_str}, {upload_time}\n\n"
+    # 字数、章节等信息从预先提取的元数据表读取，不读取书籍文件
+    metadata = await get_books_metadata(current_page_books)
+    for book in current_page_books:
+        reply_text += format_book_entry(book, metadata.get(book['md5']))
     
     # 添加分页按钮
     buttons = []
@@ -530,9 +413,9 @@ async def list_premium_books(client, message):
     
     # 普通用户提示 - 根据是群聊还是私聊显示不同提示
     if message.chat.type == ChatType.PRIVATE:
-        reply_text += "\n使用 /huan [书名] 兑换书籍 (花费 2000 灵石)"
+        reply_text += "\n使用 /huan [书名或#编号] 兑换书籍 (花费 2000 灵石)"
     else:
-        reply_text += "\n在群组中使用 /huan [书名] 或私聊机器人兑换书籍 (花费 2000 灵石)"
+        reply_text += "\n在群组中使用 /huan [书名或#编号] 或私聊机器人兑换书籍 (花费 2000 灵石)"
     
     # 发送消息
     reply = await message.reply(reply_text, reply_markup=keyboard)
@@ -553,26 +436,13 @@ async def handle_book_list_callback(client, callback_query):
             
         page = int(parts[2])
         
-        # 获取书籍列表
-        books = get_premium_books()
-        
-        if not books:
+        # 书库为空
+        if not catalog_index.get_books():
             await callback_query.answer("📚 精品书籍库为空")
             return
         
-        # 计算总页数
-        total_pages = math.ceil(len(books) / BOOKS_PER_PAGE)
-        
-        # 确保页码有效
-        if page < 1:
-            page = 1
-        if page > total_pages:
-            page = total_pages
-        
-        # 获取当前页的书籍
-        start_idx = (page - 1) * BOOKS_PER_PAGE
-        end_idx = start_idx + BOOKS_PER_PAGE
-        current_page_books = books[start_idx:end_idx]
+        # 从目录索引获取当前页的书籍（页码超出范围时自动修正）
+        current_page_books, page, total_pages = catalog_index.get_page(page, BOOKS_PER_PAGE)
         
         # 检查用户是否是管理员
         user_id = callback_query.from_user.id
@@ -581,25 +451,10 @@ async def handle_book_list_callback(client, callback_query):
         # 构建显示文本
         reply_text = f"📚 精品书籍列表 (第 {page}/{total_pages} 页)\n\n"
         
-        for idx, book in enumerate(current_page_books, start=1):
-            # 格式化文件大小
-            size_mb = book['size'] / (1024 * 1024)
-            file_size_str = f"{size_mb:.2f} MB"
-            
-            # 提取上传时间
-            timestamp_match = re.search(r'_(\d{8}_\d{6})', book['filename'])
-            upload_time = ""
-            if timestamp_match:
-                time_str = timestamp_match.group(1)
-                upload_time = time_str[:8]  # 只取日期部分 YYYYMMDD
-                try:
-                    # 格式化为更易读的形式: YYYY-MM-DD
-                    upload_time = f"{time_str[:4]}-{time_str[4:6]}-{time_str[6:8]}"
-                except:
-                    pass
-            
-            # 使用新格式：书名 大小, 上传时间
-            reply_text += f"{idx}. `{book['display_name']}` {file_size_str}, {upload_time}\n\n"
+        # 字数、章节等信息从预先提取的元数据表读取，不读取书籍文件
+        metadata = await get_books_metadata(current_page_books)
+        for book in current_page_books:
+            reply_text += format_book_entry(book, metadata.get(book['md5']))
         
         # 添加分页按钮
         buttons = []
@@ -624,9 +479,9 @@ async def handle_book_list_callback(client, callback_query):
         
         # 普通用户提示 - 根据是群聊还是私聊显示不同提示
         if callback_query.message.chat.type == ChatType.PRIVATE:
-            reply_text += "\n使用 /huan [书名] 兑换书籍 (花费 2000 灵石)"
+            reply_text += "\n使用 /huan [书名或#编号] 兑换书籍 (花费 2000 灵石)"
         else:
-            reply_text += "\n在群组中使用 /huan [书名] 或私聊机器人兑换书籍 (花费 2000 灵石)"
+            reply_text += "\n在群组中使用 /huan [书名或#编号] 或私聊机器人兑换书籍 (花费 2000 灵石)"
         
         # 更新消息
         await callback_query.message.edit_text(reply_text, reply_markup=keyboard)
@@ -638,6 +493,30 @@ async def handle_book_list_callback(client, callback_query):
         except:
             pass
 
+async def send_premium_book(client, chat_id, book, caption):
+    """发送精品书籍
+
+    优先使用已保存的file_id，Telegram直接转发已有文件，不需要重新上传；
+    没有file_id或file_id被拒绝时上传本地文件（压缩存储的书籍临时解压后发送），并保存新的file_id。
+    """
+    if book['file_id']:
+        try:
+            return await client.send_document(chat_id=chat_id, document=book['file_id'], caption=caption)
+        except FILE_ID_ERRORS as e:
+            print(f"书籍 #{book['id']} 的file_id已失效，改为上传本地文件: {e}")
+            await catalog_index.set_file_id(book['id'], None)
+    
+    async with compression_service.open_for_sending(book['path']) as send_path:
+        sent = await client.send_document(
+            chat_id=chat_id,
+            document=send_path,
+            file_name=book['original_name'],
+            caption=caption
+        )
+    if sent and sent.document:
+        await catalog_index.set_file_id(book['id'], sent.document.file_id)
+    return sent
+
 # 兑换精品书籍
 async def exchange_premium_book(client, message):
     """处理/huan命令，兑换精品书籍"""
@@ -646,7 +525,7 @@ async def exchange_premium_book(client, message):
     # 解析命令参数
     command_parts = message.text.split(' ', 1)
     if len(command_parts) < 2:
-        reply = await message.reply("⚠️ 请提供书名，格式: /huan [书名]")
+        reply = await message.reply("⚠️ 请提供书名或编号，格式: /huan [书名] 或 /huan #编号")
         # 如果在群组中，5秒后自动删除
         if message.chat.type != ChatType.PRIVATE:
             await auto_delete_messages([message, reply], 5)
@@ -654,8 +533,11 @@ async def exchange_premium_book(client, message):
     
     book_name = command_parts[1].strip()
     
+    # 先写入缓冲中的水群积分，保证读到准确余额
+    await points_buffer.flush_user(user_id)
+    
     # 获取用户信息
-    user = db_service.get_user(user_id)
+    user = await async_db_service.get_user(user_id)
     if not user:
         reply = await message.reply("⚠️ 您还未注册，请先使用 /start 命令注册")
         # 如果在群组中，5秒后自动删除
@@ -671,41 +553,25 @@ async def exchange_premium_book(client, message):
             await auto_delete_messages([message, reply], 5)
         return
     
-    # 获取书籍列表
-    books = get_premium_books()
-    
     # 查找匹配的书籍
     found_book = None
     
-    # 首先尝试精确匹配完整书名（包括编号）
-    for book in books:
-        if book_name.lower() == book['display_name'].lower():
-            found_book = book
-            break
-    
-    # 如果精确匹配不成功，尝试部分匹配
-    if not found_book:
-        # 检查是否包含编号格式 (#数字)
-        number_match = re.search(r'\(#(\d+)\)', book_name)
-        if number_match:
-            # 提取书名和编号
-            pure_name = book_name.split('(#')[0].strip()
-            book_number = int(number_match.group(1))
-            
-            # 查找匹配书名和编号的书籍
-            for book in books:
-                book_number_match = re.search(r'\(#(\d+)\)', book['display_name'])
-                if (book_number_match and 
-                    pure_name.lower() in book['original_name'].lower() and
-                    int(book_number_match.group(1)) == book_number):
-                    found_book = book
-                    break
-        else:
-            # 如果没有指定编号，使用常规包含匹配
-            for book in books:
-                if book_name.lower() in book['display_name'].lower():
-                    found_book = book
-                    break
+    # 按编号兑换：/huan #12，或书名后带编号：/huan 书名 (#12)
+    id_match = re.fullmatch(r'#(\d+)', book_name)
+    name_match = re.fullmatch(r'(.+?)\s*\(#(\d+)\)', book_name)
+    if id_match:
+        found_book = catalog_index.get(int(id_match.group(1)))
+    elif name_match:
+        found_book = catalog_index.get(int(name_match.group(2)))
+        # 核对书名，避免编号输错兑换到别的书
+        if found_book and name_match.group(1).lower() not in found_book['original_name'].lower():
+            found_book = None
+    else:
+        # 通过书名索引查找，结果按匹配程度排序：优先书名完全相同，其次包含关键词
+        for book in catalog_index.search(book_name):
+            if book_name.lower() in book['display_name'].lower():
+                found_book = book
+                break
     
     if not found_book:
         reply = await message.reply(f"⚠️ 未找到书籍: {book_name}\n请使用 /list 命令查看可用的书籍")
@@ -714,8 +580,19 @@ async def exchange_premium_book(client, message):
             await auto_delete_messages([message, reply], 5)
         return
     
+    # 书籍在上次轮询后被压缩或移走时，重新扫描目录取得当前路径
+    if not os.path.exists(found_book['path']):
+        await catalog_index.refresh(force=True)
+        found_book = catalog_index.get(found_book['id'])
+        if not found_book:
+            reply = await message.reply(f"⚠️ 书籍已下架: {book_name}\n请使用 /list 命令查看可用的书籍")
+            # 如果在群组中，5秒后自动删除
+            if message.chat.type != ChatType.PRIVATE:
+                await auto_delete_messages([message, reply], 5)
+            return
+    
     # 先扣除积分
-    new_points = db_service.update_points(user_id, -BOOK_EXCHANGE_COST)
+    new_points = await async_db_service.update_points(user_id, -BOOK_EXCHANGE_COST)
     
     # 发送状态消息
     status_message = await message.reply(f"⏳ 正在准备发送书籍: {found_book['display_name']}...")
@@ -726,12 +603,10 @@ async def exchange_premium_book(client, message):
             # 先通知群组
             await status_message.edit_text(f"✅ 书籍准备就绪，请查看私聊消息获取书籍")
             
-            # 私聊发送文件
-            await client.send_document(
-                chat_id=user_id,
-                document=found_book['path'],
-                file_name=found_book['original_name'],
-                caption=f"📚 您在群组中兑换的精品书籍!\n消费: {BOOK_EXCHANGE_COST} 灵石\n剩余灵石: {new_points}"
+            # 私聊发送文件（已发送过的书籍直接使用file_id，不重新上传）
+            await send_premium_book(
+                client, user_id, found_book,
+                f"📚 您在群组中兑换的精品书籍!\n消费: {BOOK_EXCHANGE_COST} 灵石\n剩余灵石: {new_points}"
             )
             
             # 私聊发送提示
@@ -743,19 +618,17 @@ async def exchange_premium_book(client, message):
             # 群组中自动删除命令和状态消息
             await auto_delete_messages([message, status_message], 15)
         else:
-            # 私聊直接发送
-            await client.send_document(
-                chat_id=user_id,
-                document=found_book['path'],
-                file_name=found_book['original_name'],
-                caption=f"📚 您已成功兑换精品书籍!\n消费: {BOOK_EXCHANGE_COST} 灵石\n剩余灵石: {new_points}"
+            # 私聊直接发送（已发送过的书籍直接使用file_id，不重新上传）
+            await send_premium_book(
+                client, user_id, found_book,
+                f"📚 您已成功兑换精品书籍!\n消费: {BOOK_EXCHANGE_COST} 灵石\n剩余灵石: {new_points}"
             )
             
             # 更新状态消息
             await status_message.edit_text(f"✅ 书籍发送成功: {found_book['display_name']}")
     except Exception as e:
         # 失败时退还积分
-        db_service.update_points(user_id, BOOK_EXCHANGE_COST)
+        await async_db_service.update_points(user_id, BOOK_EXCHANGE_COST)
         
         # 更新状态消息
         await status_message.edit_text(f"❌ 书籍发送失败: {str(e)}\n已退还 {BOOK_EXCHANGE_COST} 灵石")
@@ -768,12 +641,12 @@ async def exchange_premium_book(client, message):
 def register_book_handlers(app):
     """注册精品书籍相关的处理器"""
     # 命令处理器
-    app.add_handler(MessageHandler(upload_premium_book, filters.command("upload") & filters.private))
-    app.add_handler(MessageHandler(group_upload_command, filters.command("upload") & filters.group))
-    app.add_handler(MessageHandler(done_upload_command, filters.command("done") & filters.private))
-    app.add_handler(MessageHandler(list_premium_books, filters.command("list")))
-    app.add_handler(MessageHandler(exchange_premium_book, filters.command("huan")))
-    app.add_handler(MessageHandler(search_premium_books, filters.command("sou")))
+    command_router.add("upload", upload_premium_book, chat='private', admin_only=True)
+    command_router.add("upload", group_upload_command, chat='group')
+    command_router.add("done", done_upload_command, chat='private', admin_only=True)
+    command_router.add("list", list_premium_books, concurrency=5)
+    command_router.add("huan", exchange_premium_book)
+    command_router.add("sou", search_premium_books, concurrency=5)
     
     # 文件和文本处理器
     app.add_handler(MessageHandler(
@@ -793,80 +666,44 @@ def register_book_handlers(app):
     app.add_handler(CallbackQueryHandler(handle_book_list_callback, filters.regex("^book_list_")))
     app.add_handler(CallbackQueryHandler(handle_book_search_callback, filters.regex("^book_search_")))
 
-# 搜索精品书籍
-async def search_premium_books(client, message):
-    """处理/sou命令，搜索精品书籍"""
-    # 提取搜索关键词
-    command_parts = message.text.split(' ', 1)
-    if len(command_parts) < 2 or not command_parts[1].strip():
-        reply = await message.reply("⚠️ 请提供搜索关键词，格式: /sou [关键词]")
-        # 如果在群组中，5秒后自动删除
-        if message.chat.type != ChatType.PRIVATE:
-            await auto_delete_messages([message, reply], 5)
-        return
-    
-    search_term = command_parts[1].strip().lower()
-    
-    # 获取所有书籍
-    all_books = get_premium_books()
-    
-    # 过滤匹配的书籍
-    matching_books = []
-    for book in all_books:
-        if (search_term in book['display_name'].lower() or 
-            search_term in book['original_name'].lower()):
-            matching_books.append(book)
-    
-    if not matching_books:
-        reply = await message.reply(f"📚 未找到包含关键词 \"{search_term}\" 的书籍")
-        # 如果在群组中，5秒后自动删除
-        if message.chat.type != ChatType.PRIVATE:
-            await auto_delete_messages([message, reply], 5)
-        return
-    
+async def render_search_page(cursor_id, search_term, book_ids, page):
+    """生成搜索结果某一页的文本和翻页按钮，只读取当前页的书籍"""
     # 计算总页数
-    total_pages = math.ceil(len(matching_books) / BOOKS_PER_PAGE)
-    page = 1
+    total_pages = math.ceil(len(book_ids) / BOOKS_PER_PAGE)
+    
+    # 确保页码有效
+    if page < 1:
+        page = 1
+    if page > total_pages:
+        page = total_pages
     
-    # 获取当前页的书籍
+    # 获取当前页的书籍（搜索之后被删除的书籍跳过）
     start_idx = (page - 1) * BOOKS_PER_PAGE
     end_idx = start_idx + BOOKS_PER_PAGE
-    current_page_books = matching_books[start_idx:end_idx]
+    current_page_books = [book for book in map(catalog_index.get, book_ids[start_idx:end_idx]) if book]
     
     # 构建显示文本
     reply_text = f"📚 搜索结果: \"{search_term}\" (第 {page}/{total_pages} 页)\n"
-    reply_text += f"找到 {len(matching_books)} 本相关书籍\n\n"
+    if len(book_ids) >= SEARCH_MAX_RESULTS:
+        reply_text += f"相关书籍过多，仅显示最相关的 {SEARCH_MAX_RESULTS} 本，请使用更准确的关键词\n\n"
+    else:
+        reply_text += f"找到 {len(book_ids)} 本相关书籍\n\n"
     
-    for idx, book in enumerate(current_page_books, start=1):
-        # 格式化文件大小
-        size_mb = book['size'] / (1024 * 1024)
-        file_size_str = f"{size_mb:.2f} MB"
-        
-        # 提取上传时间
-        timestamp_match = re.search(r'_(\d{8}_\d{6})', book['filename'])
-        upload_time = ""
-        if timestamp_match:
-            time_str = timestamp_match.group(1)
-            upload_time = time_str[:8]  # 只取日期部分 YYYYMMDD
-            try:
-                # 格式化为更易读的形式: YYYY-MM-DD
-                upload_time = f"{time_str[:4]}-{time_str[4:6]}-{time_str[6:8]}"
-            except:
-                pass
-        
-        # 使用新格式：书名 大小, 上传时间
-        reply_text += f"{idx}. `{book['display_name']}` {file_size_str}, {upload_time}\n\n"
+    # 字数、章节等信息从预先提取的元数据表读取，不读取书籍文件
+    metadata = await get_books_metadata(current_page_books)
+    for book in current_page_books:
+        reply_text += format_book_entry(book, metadata.get(book['md5']))
     
-    # 添加分页按钮
+    # 添加分页按钮，回调数据只携带游标ID和页码
     buttons = []
     
     # 上一页按钮
     if page > 1:
-        buttons.append(InlineKeyboardButton("◀️ 上一页", callback_data=f"book_search_{page-1}_{search_term}"))
+        buttons.append(InlineKeyboardButton("◀️ 上一页", callback_data=f"book_search_{cursor_id}:{page-1}"))
     
     # 下一页按钮
     if page < total_pages:
-        buttons.append(InlineKeyboardButton("下一页 ▶️", callback_data=f"book_search_{page+1}_{search_term}"))
+        buttons.append(InlineKeyboardButton("下一页 ▶️", callback_data=f"book_search_{cursor_id}:{page+1}"))
     
     # 如果有按钮，则创建行
     if buttons:
@@ -875,7 +712,38 @@ async def search_premium_books(client, message):
         keyboard = None
     
     # 添加提示
-    reply_text += "\n使用 /huan [书名] 兑换书籍 (花费 2000 灵石)"
+    reply_text += "\n使用 /huan [书名或#编号] 兑换书籍 (花费 2000 灵石)"
+    
+    return reply_text, keyboard
+
+# 搜索精品书籍
+async def search_premium_books(client, message):
+    """处理/sou命令，搜索精品书籍"""
+    # 提取搜索关键词
+    command_parts = message.text.split(' ', 1)
+    if len(command_parts) < 2 or not command_parts[1].strip():
+        reply = await message.reply("⚠️ 请提供搜索关键词，格式: /sou [关键词]")
+        # 如果在群组中，5秒后自动删除
+        if message.chat.type != ChatType.PRIVATE:
+            await auto_delete_messages([message, reply], 5)
+        return
+    
+    search_term = command_parts[1].strip().lower()
+    
+    # 通过书名索引搜索，结果按匹配程度和上传时间排序
+    matching_books = catalog_index.search(search_term)
+    
+    if not matching_books:
+        reply = await message.reply(f"📚 未找到包含关键词 \"{search_term}\" 的书籍")
+        # 如果在群组中，5秒后自动删除
+        if message.chat.type != ChatType.PRIVATE:
+            await auto_delete_messages([message, reply], 5)
+        return
+    
+    # 缓存搜索结果，翻页时直接使用
+    book_ids = [book['id'] for book in matching_books]
+    cursor_id = search_cursors.create(search_term, book_ids)
+    reply_text, keyboard = await render_search_page(cursor_id, search_term, book_ids, 1)
     
     # 发送消息
     reply = await message.reply(reply_text, reply_markup=keyboard)
@@ -888,86 +756,20 @@ async def search_premium_books(client, message):
 async def handle_book_search_callback(client, callback_query):
     """处理书籍搜索的翻页回调"""
     try:
-        # 解析回调数据
-        parts = callback_query.data.split('_')
-        if len(parts) < 3:
+        # 解析回调数据: book_search_{游标ID}:{页码}
+        cursor_id, _, page = callback_query.data[len("book_search_"):].partition(':')
+        if not page.isdigit():
             await callback_query.answer("⚠️ 无效的请求")
             return
-            
-        page = int(parts[2])
-        search_term = '_'.join(parts[3:]) if len(parts) > 3 else ""
-        
-        # 获取所有书籍
-        all_books = get_premium_books()
         
-        # 过滤匹配的书籍
-        matching_books = []
-        for book in all_books:
-            if (search_term.lower() in book['display_name'].lower() or 
-                search_term.lower() in book['original_name'].lower()):
-                matching_books.append(book)
-        
-        if not matching_books:
-            await callback_query.answer("📚 未找到匹配的书籍")
+        # 从游标缓存取出搜索结果，不重新搜索
+        cursor = search_cursors.get(cursor_id)
+        if cursor is None:
+            await callback_query.answer("⌛ 搜索结果已过期，请重新使用 /sou 搜索", show_alert=True)
             return
         
-        # 计算总页数
-        total_pages = math.ceil(len(matching_books) / BOOKS_PER_PAGE)
-        
-        # 确保页码有效
-        if page < 1:
-            page = 1
-        if page > total_pages:
-            page = total_pages
-        
-        # 获取当前页的书籍
-        start_idx = (page - 1) * BOOKS_PER_PAGE
-        end_idx = start_idx + BOOKS_PER_PAGE
-        current_page_books = matching_books[start_idx:end_idx]
-        
-        # 构建显示文本
-        reply_text = f"📚 搜索结果: \"{search_term}\" (第 {page}/{total_pages} 页)\n"
-        reply_text += f"找到 {len(matching_books)} 本相关书籍\n\n"
-        
-        for idx, book in enumerate(current_page_books, start=1):
-            # 格式化文件大小
-            size_mb = book['size'] / (1024 * 1024)
-            file_size_str = f"{size_mb:.2f} MB"
-            
-            # 提取上传时间
-            timestamp_match = re.search(r'_(\d{8}_\d{6})', book['filename'])
-            upload_time = ""
-            if timestamp_match:
-                time_str = timestamp_match.group(1)
-                upload_time = time_str[:8]  # 只取日期部分 YYYYMMDD
-                try:
-                    # 格式化为更易读的形式: YYYY-MM-DD
-                    upload_time = f"{time_str[:4]}-{time_str[4:6]}-{time_str[6:8]}"
-                except:
-                    pass
-            
-            # 使用新格式：书名 大小, 上传时间
-            reply_text += f"{idx}. `{book['display_name']}` {file_size_str}, {upload_time}\n\n"
-        
-        # 添加分页按钮
-        buttons = []
-        
-        # 上一页按钮
-        if page > 1:
-            buttons.append(InlineKeyboardButton("◀️ 上一页", callback_data=f"book_search_{page-1}_{search_term}"))
-        
-        # 下一页按钮
-        if page < total_pages:
-            buttons.append(InlineKeyboardButton("下一页 ▶️", callback_data=f"book_search_{page+1}_{search_term}"))
-        
-        # 如果有按钮，则创建行
-        if buttons:
-            keyboard = InlineKeyboardMarkup([buttons])
-        else:
-            keyboard = None
-        
-        # 添加提示
-        reply_text += "\n使用 /huan [书名] 兑换书籍 (花费 2000 灵石)"
+        search_term, book_ids = cursor
+        reply_text, keyboard = await render_search_page(cursor_id, search_term, book_ids, int(page))
         
         # 更新消息
         await callback_query.message.edit_text(reply_text, reply_markup=keyboard)
@@ -977,4 +779,4 @@ async def handle_book_search_callback(client, callback_query):
         try:
             await callback_query.answer(f"翻页出错，请重试")
         except:
-            pass 
\ No newline at end of file
+            pass
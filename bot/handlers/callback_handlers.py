@@ -2,7 +2,8 @@ from pyrogram import Client, filters
 from pyrogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.handlers import CallbackQueryHandler
 from bot.services.game_service import game_service
-from bot.services.db_service import db_service
+from bot.services.async_db_service import async_db_service
+from bot.utils.helpers import run_blocking
 import re
 import json
 import pyrogram
@@ -62,7 +63,7 @@ async def handle_gua_guess(client, callback_query):
     choice = int(callback_query.data.replace("gua_guess_", ""))
     
     # 确认游戏并获取结果
-    result = game_service.guess_number(user_id, choice)
+    result = await run_blocking(game_service.guess_number, user_id, choice)
     
     if not result['success']:
         try:
@@ -86,7 +87,7 @@ async def handle_gua_guess(client, callback_query):
     )
     
     # 获取最新的积分
-    current_points = db_service.get_user_points(user_id)
+    current_points = await async_db_service.get_user_points(user_id)
     
     if result['win']:
         result_text += (
@@ -150,7 +151,7 @@ async def handle_gua_cancel(client, callback_query):
     user_id = callback_query.from_user.id
     
     # 取消游戏
-    result = game_service.cancel_game(user_id)
+    result = await run_blocking(game_service.cancel_game, user_id)
     
     # 更新原始消息
     max_retries = 3
@@ -205,7 +206,7 @@ async def handle_duel_accept(client, callback_query):
     duel_id = int(callback_query.data.replace("duel_accept_", ""))
     
     # 获取对决信息
-    duel = db_service.get_duel_by_id(duel_id)
+    duel = await async_db_service.get_duel_by_id(duel_id)
     if not duel:
         await callback_query.answer("找不到对应的生死战", show_alert=True)
         return
@@ -221,14 +222,14 @@ async def handle_duel_accept(client, callback_query):
         return
     
     # 接受挑战
-    result = game_service.accept_duel(duel_id)
+    result = await run_blocking(game_service.accept_duel, duel_id)
     
     if not result['success']:
         await callback_query.answer(result['message'], show_alert=True)
         return
     
     # 获取挑战者信息
-    challenger = db_service.get_user(duel['challenger_id'])
+    challenger = await async_db_service.get_user(duel['challenger_id'])
     challenger_name = challenger['username'] if challenger and challenger['username'] else f"用户{duel['challenger_id']}"
     
     # 构建游戏信息文本
@@ -267,7 +268,7 @@ async def handle_duel_reject(client, callback_query):
     duel_id = int(callback_query.data.replace("duel_reject_", ""))
     
     # 获取对决信息
-    duel = db_service.get_duel_by_id(duel_id)
+    duel = await async_db_service.get_duel_by_id(duel_id)
     if not duel:
         await callback_query.answer("找不到对应的生死战", show_alert=True)
         return
@@ -283,14 +284,14 @@ async def handle_duel_reject(client, callback_query):
         return
     
     # 拒绝挑战
-    result = game_service.reject_duel(duel_id)
+    result = await run_blocking(game_service.reject_duel, duel_id)
     
     if not result['success']:
         await callback_query.answer(result['message'], show_alert=True)
         return
     
     # 获取挑战者信息
-    challenger = db_service.get_user(duel['challenger_id'])
+    challenger = await async_db_service.get_user(duel['challenger_id'])
     challenger_name = challenger['username'] if challenger and challenger['username'] else f"用户{duel['challenger_id']}"
     
     # 更新原始消息
@@ -311,7 +312,7 @@ async def handle_duel_draw(client, callback_query):
     duel_id = int(callback_query.data.replace("duel_draw_", ""))
     
     # 获取对决信息
-    duel = db_service.get_duel_by_id(duel_id)
+    duel = await async_db_service.get_duel_by_id(duel_id)
     if not duel:
         await callback_query.answer("找不到对应的生死战", show_alert=True)
         return
@@ -332,14 +333,14 @@ async def handle_duel_draw(client, callback_query):
         return
     
     # 抽牌
-    result = game_service.draw_card(duel_id, user_id)
+    result = await run_blocking(game_service.draw_card, duel_id, user_id)
     
     if not result['success']:
         await callback_query.answer(result['message'], show_alert=True)
         return
     
     # 获取更新后的对决信息
-    updated_duel = db_service.get_duel_by_id(duel_id)
+    updated_duel = await async_db_service.get_duel_by_id(duel_id)
     
     # 更新消息
     await update_duel_message(client, callback_query, updated_duel, result)
@@ -354,7 +355,7 @@ async def handle_duel_stand(client, callback_query):
     duel_id = int(callback_query.data.replace("duel_stand_", ""))
     
     # 获取对决信息
-    duel = db_service.get_duel_by_id(duel_id)
+    duel = await async_db_service.get_duel_by_id(duel_id)
     if not duel:
         await callback_query.answer("找不到对应的生死战", show_alert=True)
         return
@@ -375,14 +376,14 @@ async def handle_duel_stand(client, callback_query):
         return
     
     # 结牌
-    result = game_service.stand(duel_id, user_id)
+    result = await run_blocking(game_service.stand, duel_id, user_id)
     
     if not result['success']:
         await callback_query.answer(result['message'], show_alert=True)
         return
     
     # 获取更新后的对决信息
-    updated_duel = db_service.get_duel_by_id(duel_id)
+    updated_duel = await async_db_service.get_duel_by_id(duel_id)
     
     # 更新消息
     await update_duel_message(client, callback_query, updated_duel, result)
@@ -390,8 +391,8 @@ async def handle_duel_stand(client, callback_query):
 async def update_duel_message(client, callback_query, duel, result=None):
     """更新生死战消息"""
     # 获取挑战者和被挑战者信息
-    challenger = db_service.get_user(duel['challenger_id'])
-    challenged = db_service.get_user(duel['challenged_id'])
+    challenger = await async_db_service.get_user(duel['challenger_id'])
+    challenged = await async_db_service.get_user(duel['challenged_id'])
     
     challenger_name = challenger['username'] if challenger and challenger['username'] else f"用户{duel['challenger_id']}"
     challenged_name = challenged['username'] if challenged and challenged['username'] else f"用户{duel['challenged_id']}"
@@ -460,8 +461,8 @@ async def update_duel_message(client, callback_query, duel, result=None):
         
         if winner_name:
             # 获取双方资源信息
-            winner = db_service.get_user(duel['winner_id'])
-            winner_cultivation = db_service.get_cultivation(duel['winner_id'])
+            winner = await async_db_service.get_user(duel['winner_id'])
+            winner_cultivation = await async_db_service.get_cultivation(duel['winner_id'])
             winner_points = winner['points']
             winner_pills = winner_cultivation['pills'] if winner_cultivation else 0
             
@@ -505,13 +506,13 @@ async def update_duel_message(client, callback_query, duel, result=None):
 
 async def handle_duel_draw_callback(client, callback_query, duel_id):
     """处理生死战平局回调"""
-    duel = db_service.get_duel_by_id(duel_id)
+    duel = await async_db_service.get_duel_by_id(duel_id)
     if not duel:
         await callback_query.answer("生死战已不存在", show_alert=True)
         return
     
     # 设置平局结果
-    result = game_service.set_duel_draw(duel_id)
+    result = await run_blocking(game_service.set_duel_draw, duel_id)
     if not result['success']:
         await callback_query.answer(result['message'], show_alert=True)
         return
@@ -524,17 +525,17 @@ async def handle_duel_draw_callback(client, callback_query, duel_id):
 async def handle_duel_winner(client, callback_query, duel_id, winner_id, winner_points, loser_id, loser_points, bust_limit, message=None):
     """处理生死战获胜"""
     # 更新数据库
-    success = db_service.update_duel(
+    success = await async_db_service.update_duel(
         duel_id,
         status='finished',
         winner_id=winner_id
     )
     
     # 处理奖励
-    game_service.handle_duel_reward(duel_id)
+    await run_blocking(game_service.handle_duel_reward, duel_id)
     
     # 获取最新的决斗信息
-    duel = db_service.get_duel_by_id(duel_id)
+    duel = await async_db_service.get_duel_by_id(duel_id)
     
     # 更新消息
     if message:
@@ -564,7 +565,7 @@ async def handle_duel_accept_callback(client, callback_query):
     duel_id = int(callback_query.data.split('_')[2])
     
     # 获取对决信息
-    duel = db_service.get_duel_by_id(duel_id)
+    duel = await async_db_service.get_duel_by_id(duel_id)
     if not duel:
         await callback_query.answer("生死战已不存在", show_alert=True)
         return
@@ -580,7 +581,7 @@ async def handle_duel_accept_callback(client, callback_query):
         return
     
     # 更新状态为进行中，并设置当前回合为挑战者
-    db_service.update_duel(
+    await async_db_service.update_duel(
         duel_id,
         status='playing',
         current_turn=duel['challenger_id'],
@@ -592,24 +593,24 @@ async def handle_duel_accept_callback(client, callback_query):
     challenged_card = random.choice(list(range(1, 11)))
     
     # 更新卡片信息
-    db_service.update_duel(
+    await async_db_service.update_duel(
         duel_id,
         challenger_cards=str(challenger_card),
         challenged_cards=str(challenged_card)
     )
     
     # 获取对手信息
-    challenger = db_service.get_user(duel['challenger_id'])
+    challenger = await async_db_service.get_user(duel['challenger_id'])
     challenger_name = challenger['username'] if challenger and 'username' in challenger else f"用户{duel['challenger_id']}"
     
-    challenged = db_service.get_user(duel['challenged_id'])
+    challenged = await async_db_service.get_user(duel['challenged_id'])
     challenged_name = challenged['username'] if challenged and 'username' in challenged else f"用户{duel['challenged_id']}"
     
     # 创建按钮
     markup = create_duel_buttons(duel_id, duel['challenger_id'])
     
     # 获取更新后的对决信息
-    updated_duel = db_service.get_duel_by_id(duel_id)
+    updated_duel = await async_db_service.get_duel_by_id(duel_id)
     
     # 更新消息内容
     duel_text = (
@@ -4,11 +4,25 @@ from pyrogram.handlers import MessageHandler, CallbackQueryHandler
 from pyrogram.enums import ChatType
 from bot.services.admin_service import admin_service
 from bot.services.db_service import db_service
+from bot.services.async_db_service import async_db_service
+from bot.services.write_behind import points_buffer, event_counter_buffer
+from bot.services.profile_cache import profile_cache
+from bot.services.config_registry import config_registry
+from bot.handlers.conversation_router import conversation_router
+from bot.handlers.command_router import command_router
 from bot.services.cultivation_service import cultivation_service
 from bot.services.game_service import game_service
 from bot.services.gang_service import gang_service
 from bot.services.ai_service import ai_service
-from bot.utils.helpers import format_cultivation_info, format_leaderboard, format_time_ago, auto_delete
+from bot.services.book_service import book_service
+from bot.services.download_scheduler import download_scheduler
+from bot.services.fingerprint_service import fingerprint_service
+from bot.services.progress_reporter import progress_reporter
+from bot.services.compression_service import compression_service
+from bot.services.metadata_service import metadata_service
+from bot.services.catalog_index import catalog_index
+from bot.services.search_cursors import search_cursors
+from bot.utils.helpers import format_cultivation_info, format_leaderboard, format_time_ago, auto_delete, run_blocking
 from bot.config.config import CULTIVATION_STAGES, AI_BACKEND_URL, AI_API_KEY, AI_MODEL
 from datetime import datetime, timedelta
 import re
@@ -20,10 +34,10 @@ import uuid
 active_hongbaos = {}  # 存储活跃的红包 {红包ID: {creator_id, total_amount, total_people, remaining, claimed_users, message_id, chat_id}}
 
 # 保存红包数据到数据库的辅助函数
-def save_hongbao_to_db(hongbao_id):
+async def save_hongbao_to_db(hongbao_id):
     """将红包数据保存到数据库"""
     if hongbao_id in active_hongbaos:
-        db_service.save_hongbao(hongbao_id, active_hongbaos[hongbao_id])
+        await async_db_service.save_hongbao(hongbao_id, active_hongbaos[hongbao_id])
 
 # 恢复红包数据
 async def restore_hongbaos(client):
@@ -32,7 +46,7 @@ async def restore_hongbaos(client):
     
     try:
         # 获取所有活跃的红包记录
-        hongbao_records = db_service.get_all_active_hongbaos()
+        hongbao_records = await async_db_service.get_all_active_hongbaos()
         
         if hongbao_records:
             print(f"发现 {len(hongbao_records)} 个活跃红包记录，正在恢复...")
@@ -71,35 +85,33 @@ async def start_command(client, message):
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.first_name or "无名修士"
     
-    # 检查是否已注册
-    user = db_service.get_user(user_id)
-    if not user:
-        db_service.create_user(user_id, username)
-    else:
-        # 更新用户名
-        db_service.update_username(user_id, username)
+    # 确保用户已注册，并更新用户名
+    await async_db_service.ensure_user_profile(user_id, username, update_names=True)
     
     # 检查是否有参数
     command_parts = message.text.split()
     if len(command_parts) > 1 and command_parts[1] == "redeem":
         # 如果是通过群组的兑换码按钮点击过来的
+        # 先写入缓冲中的水群积分，保证读到准确余额
+        await points_buffer.flush_user(user_id)
+        
         # 检查用户积分是否足够
-        if user['points'] < 3000:
+        if await async_db_service.get_user_points(user_id) < 3000:
             return await message.reply("灵石不足，获取兑换码需要3000灵石")
         
         # 获取一个未使用的兑换码
-        redemption_code = db_service.get_unused_redemption_code()
+        redemption_code = await async_db_service.get_unused_redemption_code()
         if not redemption_code:
             return await message.reply("当前没有可用的兑换码，请稍后再试")
         
         # 扣除用户积分
-        if not db_service.update_points(user_id, -3000):
+        if not await async_db_service.update_points(user_id, -3000):
             return await message.reply("扣除积分失败，请稍后再试")
         
         # 标记兑换码为已使用
-        if not db_service.mark_redemption_code_used(redemption_code, user_id):
+        if not await async_db_service.mark_redemption_code_used(redemption_code, user_id):
             # 如果标记失败，尝试退还积分
-            db_service.update_points(user_id, 3000)
+            await async_db_service.update_points(user_id, 3000)
             return await message.reply("获取兑换码失败，已退还积分，请稍后再试")
         
         # 在私聊中发送兑换码
@@ -160,7 +172,8 @@ async def help_command(client, message):
         "/subpoint [用户ID] [数量] - 减少用户积分\n"
         "/deduct [用户ID] [数量] - 扣除用户积分(允许负分)\n"
         "/aiconfig - 配置AI参数\n"
-        "/set [兑换码] - 添加兑换码"
+        "/set [兑换码] - 添加兑换码\n"
+        "/stats - 查看运行状态"
     ) if is_admin else ""
     
     return await message.reply(basic_cmds + ai_cmds + admin_cmds)
@@ -176,60 +189,41 @@ async def my_command(client, message):
     full_name = (first_name + " " + last_name).strip()
     username = full_name or message.from_user.username or "无名修士"
     
-    # 获取用户信息
-    user_info = db_service.get_user(user_id)
+    # 获取用户信息和修仙信息（不存在时自动注册），同时更新用户名
+    user_info = await async_db_service.ensure_user_profile(user_id, username, first_name, last_name, update_names=True)
     if not user_info:
-        db_service.create_user(user_id, username, first_name, last_name)
-        user_info = db_service.get_user(user_id)
-    else:
-        # 更新用户名
-        db_service.update_username(user_id, username, first_name, last_name)
-    
-    # 获取修仙信息
-    cultivation = cultivation_service.get_user_cultivation(user_id)
-    if not cultivation:
-        # 如果修仙信息不存在，尝试初始化修仙记录
-        try:
-            # 确保用户信息创建后再创建修仙记录
-            db_service.initialize_user_cultivation(user_id)
-            # 重新获取修仙信息
-            cultivation = cultivation_service.get_user_cultivation(user_id)
-            if not cultivation:
-                return await message.reply("初始化用户修仙信息失败，请联系管理员")
-        except Exception as e:
-            print(f"初始化用户修仙信息时出错: {e}")
         return await message.reply("获取用户信息失败，请联系管理员")
     
     # 获取签到状态
-    checkin_status = game_service.get_checkin_status(user_id)
+    checkin_status = await run_blocking(game_service.get_checkin_status, user_id)
     
     # 获取刮刮乐记录
-    gua_records = game_service.get_gua_records(user_id)
+    gua_records = await run_blocking(game_service.get_gua_records, user_id)
     
     # 获取打劫记录
-    rob_record = db_service.get_rob_record(user_id)
+    rob_record = await async_db_service.get_rob_record(user_id)
     last_rob = format_time_ago(rob_record['last_rob']) if rob_record and rob_record['last_rob'] else "从未"
     
     # 获取奴隶状态
-    slave_status = gang_service.get_slave_status(user_id)
+    slave_status = await run_blocking(gang_service.get_slave_status, user_id)
     
     # 获取保护罩状态
-    shield_status = db_service.get_shield_status(user_id)
+    shield_status = await async_db_service.get_shield_status(user_id)
     
     cultivation_text = format_cultivation_info(
-        cultivation['stage_index'], 
-        cultivation['pills'],
-        cultivation['next_cost']
+        user_info['stage'], 
+        user_info['pills'],
+        user_info['next_cost']
     )
     
     # 帮主状态
-    leader = gang_service.get_gang_leader()
+    leader = await run_blocking(gang_service.get_gang_leader)
     is_leader = leader and leader['user_id'] == user_id
     
     # 构建个人信息
     info_text = (
         f"📊 个人信息 - {username}\n"
-        f"灵石：{user_info['points']} 个\n"
+        f"灵石：{user_info['points'] + points_buffer.get_pending(user_id)} 个\n"
         f"修为：{cultivation_text}\n\n"
         f"签到：连续 {checkin_status['consecutive_days']} 天"
     )
@@ -274,25 +268,15 @@ async def checkin_command(client, message):
     username = full_name or message.from_user.username or "无名修士"
     
     # 先检查今天是否已经签到过
-    checkin_status = game_service.get_checkin_status(user_id)
+    checkin_status = await run_blocking(game_service.get_checkin_status, user_id)
     if checkin_status['today_checked']:
         return await message.reply("⚠️ 今天已经签到过了，明天再来吧！")
     
-    # 检查用户是否存在
-    user = db_service.get_user(user_id)
-    if not user:
-        db_service.create_user(user_id, username, first_name, last_name)
-    else:
-        # 更新用户名
-        db_service.update_username(user_id, username, first_name, last_name)
-    
-    # 确保用户有修仙记录
-    cultivation = cultivation_service.get_user_cultivation(user_id)
-    if not cultivation:
-        db_service.initialize_user_cultivation(user_id)
+    # 确保用户已注册，并更新用户名
+    await async_db_service.ensure_user_profile(user_id, username, first_name, last_name, update_names=True)
     
     # 执行签到
-    result = game_service.check_in(user_id)
+    result = await run_blocking(game_service.check_in, user_id)
     
     if not result['success']:
         return await message.reply(result['message'])
@@ -319,7 +303,7 @@ async def checkin_command(client, message):
         reply_text += "\n⚠️ 已达到7天，连续签到天数将重置"
     
     # 获取当前总积分
-    points = db_service.get_user_points(user_id)
+    points = await async_db_service.get_user_points(user_id)
     reply_text += f"\n💰 当前灵石：{points}"
     
     return await message.reply(reply_text)
@@ -327,12 +311,6 @@ async def checkin_command(client, message):
 @auto_delete()
 async def authorize_group_command(client, message):
     """处理/auth命令，授权群组"""
-    user_id = message.from_user.id
-    
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        return await message.reply("⚠️ 只有管理员才能执行此操作")
-    
     # 检查是否在群组中
     if message.chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
         return await message.reply("⚠️ 此命令只能在群组中使用")
@@ -345,7 +323,7 @@ async def authorize_group_command(client, message):
         return await message.reply("✅ 此群组已经授权")
     
     # 授权群组
-    result = admin_service.authorize_group(group_id, group_name)
+    result = await run_blocking(admin_service.authorize_group, group_id, group_name)
     if result:
         return await message.reply("✅ 群组授权成功！")
     else:
@@ -354,12 +332,6 @@ async def authorize_group_command(client, message):
 @auto_delete()
 async def add_admin_command(client, message):
     """处理/addadmin命令，添加管理员"""
-    user_id = message.from_user.id
-    
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        return await message.reply("⚠️ 只有管理员才能执行此操作")
-    
     # 检查命令格式
     command_parts = message.text.split()
     if len(command_parts) != 2:
@@ -382,12 +354,6 @@ async def add_admin_command(client, message):
 @auto_delete()
 async def add_points_command(client, message):
     """处理/addpoint命令，增加用户积分"""
-    user_id = message.from_user.id
-    
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        return await message.reply("⚠️ 只有管理员才能执行此操作")
-    
     # 检查命令格式
     command_parts = message.text.split()
     if len(command_parts) != 3:
@@ -405,12 +371,12 @@ async def add_points_command(client, message):
         return await message.reply("⚠️ 积分数量必须大于0")
     
     # 检查用户是否存在
-    target_user = db_service.get_user(target_id)
+    target_user = await async_db_service.get_user(target_id)
     if not target_user:
         return await message.reply(f"⚠️ 用户 {target_id} 不存在")
     
     # 增加积分
-    new_points = admin_service.update_user_points(target_id, points)
+    new_points = await run_blocking(admin_service.update_user_points, target_id, points)
     
     # 获取用户显示名称
     display_name = target_user.get('username') or f"用户{target_id}"
@@ -420,12 +386,6 @@ async def add_points_command(client, message):
 @auto_delete()
 async def sub_points_command(client, message):
     """处理/subpoint命令，减少用户积分"""
-    user_id = message.from_user.id
-    
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        return await message.reply("⚠️ 只有管理员才能执行此操作")
-    
     # 检查命令格式
     command_parts = message.text.split()
     if len(command_parts) != 3:
@@ -443,24 +403,18 @@ async def sub_points_command(client, message):
         return await message.reply("⚠️ 积分数量必须大于0")
     
     # 检查用户是否存在
-    target_user = db_service.get_user(target_id)
+    target_user = await async_db_service.get_user(target_id)
     if not target_user:
         return await message.reply(f"⚠️ 用户 {target_id} 不存在")
     
     # 减少积分
-    new_points = admin_service.update_user_points(target_id, -points)
+    new_points = await run_blocking(admin_service.update_user_points, target_id, -points)
     
     return await message.reply(f"✅ 已从用户 {target_user['username']} 减少 {points} 灵石，当前灵石: {new_points}")
 
 @auto_delete()
 async def deduct_points_command(client, message):
     """处理/deduct命令，扣除用户积分（允许为负）"""
-    user_id = message.from_user.id
-    
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        return await message.reply("⚠️ 只有管理员才能执行此操作")
-    
     # 检查命令格式
     command_parts = message.text.split()
     if len(command_parts) != 3:
@@ -478,12 +432,12 @@ async def deduct_points_command(client, message):
         return await message.reply("⚠️ 积分数量必须大于0")
     
     # 检查用户是否存在
-    target_user = db_service.get_user(target_id)
+    target_user = await async_db_service.get_user(target_id)
     if not target_user:
         return await message.reply(f"⚠️ 用户 {target_id} 不存在")
     
     # 扣除积分（允许负数）
-    new_points = admin_service.deduct_user_points(target_id, points)
+    new_points = await run_blocking(admin_service.deduct_user_points, target_id, points)
     
     message_text = (
         f"✅ 已从用户 {target_user['username']} 扣除 {points} 灵石，当前灵石: {new_points}\n"
@@ -508,23 +462,23 @@ async def gua_command(client, message):
     
     amount = int(command_parts[1])
     
-    # 检查用户是否存在
-    user = db_service.get_user(user_id)
-    if not user:
-        db_service.create_user(user_id, username)
-        user = db_service.get_user(user_id)
+    # 先写入缓冲中的水群积分，保证读到准确余额
+    await points_buffer.flush_user(user_id)
+    
+    # 确保用户已注册，并获取用户信息
+    user = await async_db_service.ensure_user_profile(user_id, username)
     
     # 检查用户积分是否足够
     if user['points'] < amount:
         return await message.reply(f"⚠️ 灵石不足！你只有 {user['points']} 灵石，但需要 {amount} 灵石")
     
     # 检查今日使用次数
-    gua_records = game_service.get_gua_records(user_id)
+    gua_records = await run_blocking(game_service.get_gua_records, user_id)
     if gua_records['remaining'] <= 0:
         return await message.reply("⚠️ 今日刮刮乐次数已用完，明天再来吧！")
     
     # 创建游戏
-    game_result = game_service.start_gua_game(user_id, amount)
+    game_result = await run_blocking(game_service.start_gua_game, user_id, amount)
     if not game_result['success']:
         return await message.reply(game_result['message'])
     
@@ -550,7 +504,7 @@ async def gua_command(client, message):
 async def tiankou_command(client, message):
     """处理/tiankou命令，查看修真榜单"""
     # 获取排行榜信息
-    top_players = cultivation_service.get_top_cultivators(10)
+    top_players = await run_blocking(cultivation_service.get_top_cultivators, 10)
     leaderboard_text = format_leaderboard(top_players)
     
     return await message.reply(leaderboard_text)
@@ -561,13 +515,8 @@ async def tujing_command(client, message):
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.first_name or "无名修士"
     
-    # 检查用户是否存在
-    user = db_service.get_user(user_id)
-    if not user:
-        db_service.create_user(user_id, username)
-    
-    # 获取用户当前修为信息
-    cultivation = db_service.get_cultivation(user_id)
+    # 确保用户已注册，并获取当前修为信息
+    cultivation = await async_db_service.ensure_user_profile(user_id, username)
     if not cultivation:
         return await message.reply("获取用户修为信息失败，请联系管理员")
     
@@ -575,8 +524,11 @@ async def tujing_command(client, message):
     if cultivation['stage'] >= len(CULTIVATION_STAGES) - 1:
         return await message.reply("⚠️ 道友已达到菠萝界的最高境界【渡劫后期】，再突破便是飞升上界，超出凡人之界了！")
     
+    # 先写入缓冲中的水群积分，保证读到准确余额
+    await points_buffer.flush_user(user_id)
+    
     # 尝试突破
-    result = cultivation_service.attempt_breakthrough(user_id)
+    result = await run_blocking(cultivation_service.attempt_breakthrough, user_id)
     
     if not result['success']:
         return await message.reply(result['message'])
@@ -626,17 +578,15 @@ async def dajie_command(client, message):
         return await message.reply("⚠️ 不能打劫自己")
     
     # 检查目标用户是否存在
-    target_user = db_service.get_user(target_id)
+    target_user = await async_db_service.get_user(target_id)
     if not target_user:
         return await message.reply("⚠️ 对方还未注册")
     
-    # 检查自己是否存在
-    user = db_service.get_user(user_id)
-    if not user:
-        db_service.create_user(user_id, username)
+    # 确保自己已注册
+    await async_db_service.ensure_user_profile(user_id, username)
     
     # 检查打劫冷却时间
-    rob_record = db_service.get_rob_record(user_id)
+    rob_record = await async_db_service.get_rob_record(user_id)
     if rob_record and rob_record['last_rob']:
         # 计算从上次打劫到现在的时间（秒）
         cooldown_seconds = (datetime.now() - rob_record['last_rob']).total_seconds()
@@ -645,7 +595,7 @@ async def dajie_command(client, message):
             return await message.reply(f"⚠️ 打劫太频繁了，请等待{int(remaining_minutes)}分钟后再试")
     
     # 执行打劫
-    result = cultivation_service.rob_user(user_id, target_id)
+    result = await run_blocking(cultivation_service.rob_user, user_id, target_id)
     
     # 检查是否有特定的错误消息
     if not result['success'] and 'message' in result and '修士' in result['message']:
@@ -695,7 +645,7 @@ async def slave_command(client, message):
     username = message.from_user.username or message.from_user.first_name or "无名修士"
     
     # 检查是否是帮主
-    leader = gang_service.get_gang_leader()
+    leader = await run_blocking(gang_service.get_gang_leader)
     if not leader or leader['user_id'] != user_id:
         return await message.reply("⚠️ 只有帮主才能设置猫娘")
     
@@ -716,17 +666,17 @@ async def slave_command(client, message):
         return await message.reply("⚠️ 不能把自己设为猫娘")
     
     # 检查目标用户是否已成仙
-    target_cultivation = cultivation_service.get_user_cultivation(target_id)
+    target_cultivation = await run_blocking(cultivation_service.get_user_cultivation, target_id)
     if target_cultivation and target_cultivation['stage_index'] >= len(CULTIVATION_STAGES):
         return await message.reply("⚠️ 对方已位列仙班，已超脱五行三界，不受凡间羁绊！")
     
     # 检查是否已经在处理中
-    existing_record = db_service.get_catgirl_record(target_id, message.chat.id)
+    existing_record = await async_db_service.get_catgirl_record(target_id, message.chat.id)
     if existing_record and existing_record['status'] == 'pending':
         return await message.reply("⚠️ 该用户正在等待确认成为猫娘")
     
     # 创建猫娘记录
-    db_service.create_catgirl_record(user_id, target_id, message.chat.id)
+    await async_db_service.create_catgirl_record(user_id, target_id, message.chat.id)
     
     # 发送猫娘转化描述
     await message.reply(
@@ -738,11 +688,8 @@ async def slave_command(client, message):
         f"恭喜{target_message.from_user.mention}成为帮主的猫娘(众人纷纷投过了羡慕的眼光), 请{target_message.from_user.mention}说: 谢过帮主大人成全(必须一字不漏打完)"
     )
     
-    # 设置消息过滤器，高优先级(1)确保在其他处理器之前执行
-    client.add_handler(MessageHandler(
-        handle_catgirl_confirmation,
-        filters.chat(message.chat.id) & filters.user(target_id)
-    ), group=1)
+    # 等待猫娘确认
+    conversation_router.set(message.chat.id, target_id, 'catgirl', handle_catgirl_confirmation)
     
     # 设置24小时后的清理任务
     client.loop.create_task(cleanup_catgirl_status(client, target_id, message.chat.id))
@@ -750,7 +697,7 @@ async def slave_command(client, message):
 async def handle_catgirl_confirmation(client, message):
     """处理猫娘确认消息"""
     # 检查对应的记录是否存在并且状态是pending
-    record = db_service.get_catgirl_record(message.from_user.id, message.chat.id)
+    record = await async_db_service.get_catgirl_record(message.from_user.id, message.chat.id)
     if not record or record['status'] != 'pending':
         # 如果记录不存在或状态不是pending，则不处理
         return
@@ -770,28 +717,20 @@ async def handle_catgirl_confirmation(client, message):
         return
     
     # 更新猫娘状态为已确认
-    db_service.update_catgirl_status(message.from_user.id, message.chat.id, 'confirmed')
+    await async_db_service.update_catgirl_status(message.from_user.id, message.chat.id, 'confirmed')
     
     # 发送确认成功消息
     await message.reply(
         f'恭喜{message.from_user.mention}成为帮主的猫娘, 24小时内都要带上"喵"字哦~'
     )
     
-    # 移除当前消息处理器
-    for handler in client.dispatcher.groups.get(1, [])[:]:
-        if isinstance(handler, MessageHandler) and handler.callback == handle_catgirl_confirmation:
-            client.dispatcher.groups[1].remove(handler)
-    
-    # 设置新的消息过滤器，高优先级(1)确保在其他处理器之前执行
-    client.add_handler(MessageHandler(
-        handle_catgirl_messages,
-        filters.chat(message.chat.id) & filters.user(message.from_user.id)
-    ), group=1)
+    # 由等待确认切换为检查猫娘消息
+    conversation_router.set(message.chat.id, message.from_user.id, 'catgirl', handle_catgirl_messages)
 
 async def handle_catgirl_messages(client, message):
     """处理猫娘消息"""
     # 检查对应的记录是否存在并且状态是confirmed
-    record = db_service.get_catgirl_record(message.from_user.id, message.chat.id)
+    record = await async_db_service.get_catgirl_record(message.from_user.id, message.chat.id)
     if not record or record['status'] != 'confirmed':
         # 如果记录不存在或状态不是confirmed，则不处理
         return
@@ -811,16 +750,10 @@ async def cleanup_catgirl_status(client, user_id, group_id):
     await asyncio.sleep(24 * 60 * 60)  # 等待24小时
     
     # 删除数据库记录
-    db_service.delete_catgirl_record(user_id, group_id)
+    await async_db_service.delete_catgirl_record(user_id, group_id)
     
-    # 移除消息处理器
-    for group_id in [1]:  # 检查高优先级组
-        for handler in client.dispatcher.groups.get(group_id, [])[:]:
-            if isinstance(handler, MessageHandler) and (
-                handler.callback == handle_catgirl_confirmation or 
-                handler.callback == handle_catgirl_messages
-            ):
-                client.dispatcher.groups[group_id].remove(handler)
+    # 移除对话
+    conversation_router.remove(group_id, user_id, 'catgirl')
     
     print(f"已清理用户 {user_id} 的猫娘状态")
 
@@ -831,7 +764,7 @@ async def confirm_slave_command(client, message):
     username = message.from_user.username or message.from_user.first_name or "无名修士"
     
     # 确认成为奴隶
-    result = gang_service.confirm_slave(user_id)
+    result = await run_blocking(gang_service.confirm_slave, user_id)
     
     if result['success']:
         master_name = result['master_name']
@@ -863,17 +796,15 @@ async def rob_command(client, message):
             return await message.reply("⚠️ 不能打劫自己")
         
         # 检查目标用户是否存在
-        target_user = db_service.get_user(target_id)
+        target_user = await async_db_service.get_user(target_id)
         if not target_user:
             return await message.reply("⚠️ 对方还未注册")
         
-        # 检查自己是否存在
-        user = db_service.get_user(user_id)
-        if not user:
-            db_service.create_user(user_id, username)
+        # 确保自己已注册
+        await async_db_service.ensure_user_profile(user_id, username)
         
         # 检查打劫冷却时间
-        rob_record = db_service.get_rob_record(user_id)
+        rob_record = await async_db_service.get_rob_record(user_id)
         if rob_record and rob_record['last_rob']:
             # 计算从上次打劫到现在的时间（秒）
             cooldown_seconds = (datetime.now() - rob_record['last_rob']).total_seconds()
@@ -882,7 +813,7 @@ async def rob_command(client, message):
                 return await message.reply(f"⚠️ 打劫太频繁了，请等待{int(remaining_minutes)}分钟后再试")
         
         # 执行打劫
-        result = cultivation_service.rob_user(user_id, target_id)
+        result = await run_blocking(cultivation_service.rob_user, user_id, target_id)
         
         # 检查是否有特定的错误消息
         if not result['success'] and 'message' in result and '修士' in result['message']:
@@ -951,26 +882,26 @@ async def buy_command(client, message):
     price_per_pill = 50
     total_price = quantity * price_per_pill
     
-    # 检查用户是否存在
-    user = db_service.get_user(user_id)
-    if not user:
-        db_service.create_user(user_id, username)
-        user = db_service.get_user(user_id)
+    # 先写入缓冲中的水群积分，保证读到准确余额
+    await points_buffer.flush_user(user_id)
+    
+    # 确保用户已注册，并获取用户信息
+    user = await async_db_service.ensure_user_profile(user_id, username)
     
     # 检查用户积分是否足够
     if user['points'] < total_price:
         return await message.reply(f"⚠️ 灵石不足！购买 {quantity} 颗突破丹需要 {total_price} 灵石，但你只有 {user['points']} 灵石")
     
     # 扣除积分
-    db_service.update_points(user_id, -total_price)
+    await async_db_service.update_points(user_id, -total_price)
     
     # 增加突破丹
-    db_service.update_cultivation_pills(user_id, quantity)
+    await async_db_service.update_cultivation_pills(user_id, quantity)
     
     # 获取更新后的信息
-    user_cultivation = cultivation_service.get_user_cultivation(user_id)
+    user_cultivation = await run_blocking(cultivation_service.get_user_cultivation, user_id)
     current_pills = user_cultivation['pills']
-    current_points = db_service.get_user_points(user_id)
+    current_points = await async_db_service.get_user_points(user_id)
     
     return await message.reply(
         f"✅ 购买成功！\n"
@@ -1003,28 +934,26 @@ async def si_command(client, message):
         return await message.reply("⚠️ 不能向自己发起挑战")
     
     # 检查目标用户是否存在
-    target_user = db_service.get_user(target_id)
+    target_user = await async_db_service.get_user(target_id)
     if not target_user:
         return await message.reply("⚠️ 对方还未注册")
     
-    # 检查自己是否存在
-    user = db_service.get_user(user_id)
-    if not user:
-        db_service.create_user(user_id, username)
+    # 确保自己已注册
+    await async_db_service.ensure_user_profile(user_id, username)
     
     # 检查是否已经有进行中的对决
-    existing_duel = game_service.get_active_duel(user_id, target_id, message.chat.id)
+    existing_duel = await run_blocking(game_service.get_active_duel, user_id, target_id, message.chat.id)
     if existing_duel:
         return await message.reply("⚠️ 你们之间已经有一场生死战在进行中")
     
     # 创建生死战
-    result = game_service.create_duel(user_id, target_id, message.chat.id)
+    result = await run_blocking(game_service.create_duel, user_id, target_id, message.chat.id)
     
     if not result['success']:
         return await message.reply(result['message'])
     
     # 获取最新创建的对决
-    duel = game_service.get_active_duel(user_id, target_id, message.chat.id)
+    duel = await run_blocking(game_service.get_active_duel, user_id, target_id, message.chat.id)
     if not duel:
         return await message.reply("⚠️ 创建生死战失败")
     
@@ -1065,7 +994,7 @@ async def feisheng_command(client, message):
     username = message.from_user.username or message.from_user.first_name or "无名修士"
     
     # 获取用户当前修为信息
-    cultivation = db_service.get_cultivation(user_id)
+    cultivation = await async_db_service.get_cultivation(user_id)
     if not cultivation:
         return await message.reply("获取用户修为信息失败，请联系管理员")
     
@@ -1075,11 +1004,11 @@ async def feisheng_command(client, message):
         return await message.reply(f"⚠️ 道友当前境界为【{current_stage}】，只有达到【渡劫后期】才能开启飞升任务！")
     
     # 获取或创建飞升任务
-    task = db_service.get_ascension_task(user_id)
+    task = await async_db_service.get_ascension_task(user_id)
     if not task:
         try:
-            db_service.create_ascension_task(user_id)
-            task = db_service.get_ascension_task(user_id)
+            await async_db_service.create_ascension_task(user_id)
+            task = await async_db_service.get_ascension_task(user_id)
         except Exception as e:
             print(f"创建飞升任务失败: {e}")
             return await message.reply("创建飞升任务失败，请联系管理员")
@@ -1110,17 +1039,14 @@ async def feisheng_command(client, message):
         
         # 保存正确答案到状态中
         try:
-            db_service.update_ascension_task(user_id, math_question=question, math_answer=result)
+            await async_db_service.update_ascension_task(user_id, math_question=question, math_answer=result)
         except Exception as e:
             print(f"更新飞升任务失败: {e}")
             # 尝试不使用math_question和math_answer字段
-            db_service.update_ascension_task(user_id, math_attempts=0)
+            await async_db_service.update_ascension_task(user_id, math_attempts=0)
         
-        # 设置消息过滤器，高优先级(1)确保在其他处理器之前执行
-        client.add_handler(MessageHandler(
-            handle_math_answer,
-            filters.chat(message.chat.id) & filters.user(user_id)
-        ), group=1)
+        # 等待回答算术题
+        conversation_router.set(message.chat.id, user_id, 'math', handle_math_answer)
         
         # 启动计时任务，10秒后自动判定为失败
         client.loop.create_task(math_answer_timeout(client, user_id, message.chat.id))
@@ -1141,7 +1067,7 @@ async def feisheng_command(client, message):
             return await message.reply("🎉 恭喜道友已经成功飞升为【地仙】！")
         else:
             # 重置任务状态
-            db_service.reset_ascension_task(user_id)
+            await async_db_service.reset_ascension_task(user_id)
             return await message.reply("🔄 飞升任务状态已重置，请重新开始！")
 
 async def handle_math_answer(client, message):
@@ -1151,12 +1077,10 @@ async def handle_math_answer(client, message):
     answer_text = message.text.strip()
     
     # 获取飞升任务状态
-    task = db_service.get_ascension_task(user_id)
+    task = await async_db_service.get_ascension_task(user_id)
     if not task or task['current_stage'] != 2:
-        # 移除当前消息处理器
-        for handler in client.dispatcher.groups.get(1, [])[:]:
-            if isinstance(handler, MessageHandler) and handler.callback == handle_math_answer:
-                client.dispatcher.groups[1].remove(handler)
+        # 移除对话
+        conversation_router.remove(message.chat.id, user_id, 'math')
         return
     
     try:
@@ -1175,16 +1099,14 @@ async def handle_math_answer(client, message):
         if user_answer == correct_answer:
             # 回答正确，更新到第三阶段
             try:
-                db_service.update_ascension_task(user_id, current_stage=3, math_attempts=0)
+                await async_db_service.update_ascension_task(user_id, current_stage=3, math_attempts=0)
             except Exception as e:
                 print(f"更新飞升任务阶段失败: {e}")
                 # 尝试只更新阶段
-                db_service.update_ascension_task(user_id, current_stage=3)
+                await async_db_service.update_ascension_task(user_id, current_stage=3)
             
-            # 移除当前消息处理器
-            for handler in client.dispatcher.groups.get(1, [])[:]:
-                if isinstance(handler, MessageHandler) and handler.callback == handle_math_answer:
-                    client.dispatcher.groups[1].remove(handler)
+            # 移除对话
+            conversation_router.remove(message.chat.id, user_id, 'math')
             
             await message.reply(
                 "✅ 回答正确！\n"
@@ -1195,22 +1117,20 @@ async def handle_math_answer(client, message):
             # 回答错误，增加失败次数
             attempts = task['math_attempts'] + 1
             try:
-                db_service.update_ascension_task(user_id, math_attempts=attempts)
+                await async_db_service.update_ascension_task(user_id, math_attempts=attempts)
             except Exception as e:
                 print(f"更新飞升任务尝试次数失败: {e}")
             
             if attempts >= 3:
                 # 三次失败，但不重置整个任务，只重置当前关卡的尝试次数
                 try:
-                    db_service.update_ascension_task(user_id, math_attempts=0, math_question=None, math_answer=None)
+                    await async_db_service.update_ascension_task(user_id, math_attempts=0, math_question=None, math_answer=None)
                 except Exception as e:
                     print(f"重置飞升任务尝试次数失败: {e}")
-                    db_service.update_ascension_task(user_id, math_attempts=0)
+                    await async_db_service.update_ascension_task(user_id, math_attempts=0)
                 
-                # 移除当前消息处理器
-                for handler in client.dispatcher.groups.get(1, [])[:]:
-                    if isinstance(handler, MessageHandler) and handler.callback == handle_math_answer:
-                        client.dispatcher.groups[1].remove(handler)
+                # 移除对话
+                conversation_router.remove(message.chat.id, user_id, 'math')
                 
                 await message.reply(
                     "❌ 回答错误！这是第三次失败！\n"
@@ -1234,7 +1154,7 @@ async def handle_math_answer(client, message):
                 
                 # 保存新的正确答案
                 try:
-                    db_service.update_ascension_task(user_id, math_question=question, math_answer=result)
+                    await async_db_service.update_ascension_task(user_id, math_question=question, math_answer=result)
                 except Exception as e:
                     print(f"保存新题目答案失败: {e}")
                 
@@ -1254,23 +1174,21 @@ async def math_answer_timeout(client, user_id, chat_id):
     await asyncio.sleep(10)  # 等待10秒
     
     # 获取任务状态
-    task = db_service.get_ascension_task(user_id)
+    task = await async_db_service.get_ascension_task(user_id)
     if not task or task['current_stage'] != 2:
         return
     
     # 增加失败次数
     attempts = task['math_attempts'] + 1
-    db_service.update_ascension_task(user_id, math_attempts=attempts)
+    await async_db_service.update_ascension_task(user_id, math_attempts=attempts)
     
-    # 移除消息处理器
-    for handler in client.dispatcher.groups.get(1, [])[:]:
-        if isinstance(handler, MessageHandler) and handler.callback == handle_math_answer:
-            client.dispatcher.groups[1].remove(handler)
+    # 移除对话
+    conversation_router.remove(chat_id, user_id, 'math')
     
     # 发送超时消息
     if attempts >= 3:
         # 三次失败，但不重置整个任务，只重置当前关卡的尝试次数
-        db_service.update_ascension_task(user_id, math_attempts=0, math_question=None, math_answer=None)
+        await async_db_service.update_ascension_task(user_id, math_attempts=0, math_question=None, math_answer=None)
         
         await client.send_message(
             chat_id=chat_id,
@@ -1295,13 +1213,10 @@ async def math_answer_timeout(client, user_id, chat_id):
             question = f"{num1} - {num2}"
         
         # 保存新的正确答案
-        db_service.update_ascension_task(user_id, math_question=question, math_answer=result)
+        await async_db_service.update_ascension_task(user_id, math_question=question, math_answer=result)
         
-        # 设置新的消息处理器
-        client.add_handler(MessageHandler(
-            handle_math_answer,
-            filters.chat(chat_id) & filters.user(user_id)
-        ), group=1)
+        # 重新等待回答算术题
+        conversation_router.set(chat_id, user_id, 'math', handle_math_answer)
         
         # 启动新的计时任务
         client.loop.create_task(math_answer_timeout(client, user_id, chat_id))
@@ -1316,12 +1231,12 @@ async def math_answer_timeout(client, user_id, chat_id):
 async def handle_duel_completion(duel_id, winner_id):
     """处理生死战完成后的飞升任务更新"""
     # 获取获胜者的飞升任务状态
-    task = db_service.get_ascension_task(winner_id)
+    task = await async_db_service.get_ascension_task(winner_id)
     if not task:
         return
     
     # 获取决斗记录
-    duel = db_service.get_duel_by_id(duel_id)
+    duel = await async_db_service.get_duel_by_id(duel_id)
     if not duel:
         return
     
@@ -1329,21 +1244,21 @@ async def handle_duel_completion(duel_id, winner_id):
     loser_id = duel['challenger_id'] if duel['winner_id'] == duel['challenged_id'] else duel['challenged_id']
     
     # 处理败者的飞升任务 - 如果在第一阶段则重置连胜
-    loser_task = db_service.get_ascension_task(loser_id)
+    loser_task = await async_db_service.get_ascension_task(loser_id)
     if loser_task and loser_task['current_stage'] == 1 and loser_task['duel_wins'] > 0:
         # 用户在飞升第一关中输掉了生死战，重置连胜
-        db_service.update_ascension_task(loser_id, duel_wins=0)
+        await async_db_service.update_ascension_task(loser_id, duel_wins=0)
         print(f"用户{loser_id}在飞升第一关中输掉生死战，连胜重置为0")
     
     # 如果在第一阶段，记录胜利
     if task['current_stage'] == 1:
-        success = db_service.record_ascension_duel_win(winner_id, duel_id)
+        success = await async_db_service.record_ascension_duel_win(winner_id, duel_id)
         if success:
             # 重新获取最新的任务状态
-            updated_task = db_service.get_ascension_task(winner_id)
+            updated_task = await async_db_service.get_ascension_task(winner_id)
             if updated_task and updated_task['duel_wins'] >= 10:
             # 进入第二阶段
-                db_service.update_ascension_task(winner_id, current_stage=2)
+                await async_db_service.update_ascension_task(winner_id, current_stage=2)
             print(f"用户{winner_id}在飞升第一关中达成10连胜，进入第二阶段")
 
 @auto_delete(60)  # 保留一段时间便于查看
@@ -1381,12 +1296,6 @@ async def ask_command(client, message):
 @auto_delete(60)  # 保留一段时间便于查看
 async def aiconfig_command(client, message):
     """处理/aiconfig命令，配置AI参数"""
-    user_id = message.from_user.id
-    
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        return await message.reply("⚠️ 只有管理员才能执行此操作")
-    
     # 解析命令参数
     command_parts = message.text.split(" ", 2)
     if len(command_parts) < 2:
@@ -1461,7 +1370,7 @@ async def shield_help_command(client, message):
 async def gongde_command(client, message):
     """处理/gongde命令，显示功德榜"""
     # 获取上传书籍最多的前10名用户
-    top_uploaders = db_service.get_top_uploaders(10)
+    top_uploaders = await async_db_service.get_top_uploaders(10)
     
     if not top_uploaders:
         return await message.reply("功德榜暂无数据")
@@ -1524,40 +1433,117 @@ async def handle_bot_reply(client, message):
     else:
         return await message.reply(f"⚠️ AI响应出错: {result['message']}")
 
+@auto_delete(60)  # 保留一段时间便于查看
+async def stats_command(client, message):
+    """处理/stats命令，查看机器人运行状态"""
+    pool = db_service.get_pool_stats()
+    async_pool = async_db_service.get_pool_stats()
+    points = points_buffer.get_stats()
+    events = event_counter_buffer.get_stats()
+    cache = profile_cache.get_stats()
+    registry = config_registry.get_stats()
+    books = book_service.get_stats()
+    downloads = download_scheduler.get_stats()
+    fingerprints = fingerprint_service.get_stats()
+    progress = progress_reporter.get_stats()
+    compression = compression_service.get_stats()
+    metadata = metadata_service.get_stats()
+    catalog = catalog_index.get_stats()
+    cursors = search_cursors.get_stats()
+    reply_text = (
+        "📊 运行状态\n\n"
+        "⚡ 异步连接池：\n"
+        f"连接数: {async_pool['size']}/{async_pool['max_size']} (空闲 {async_pool['free']})\n\n"
+        "🗄 同步连接池：\n"
+        f"连接数: {pool['size']}/{pool['max_size']} (使用中 {pool['in_use']}，空闲 {pool['idle']})\n"
+        f"等待中: {pool['waiters']}\n"
+        f"借出次数: {pool['checkouts']}\n"
+        f"等待次数: {pool['wait_count']} (平均 {pool['avg_wait_ms']}ms，最长 {pool['max_wait_ms']}ms)\n"
+        f"获取超时: {pool['timeouts']}\n"
+        f"新建/回收/失效: {pool['created']}/{pool['recycled']}/{pool['broken']}\n\n"
+        "💰 积分写回缓冲：\n"
+        f"待写入: {points['pending']} 人 (累计 {points['increments']} 次加分)\n"
+        f"批量写入: {points['flushes']} 次，共 {points['rows_flushed']} 行 (最近一次 {points['last_flush_ms']}ms)\n"
+        f"写入失败: {points['failures']}\n\n"
+        "🎲 奇遇计数缓冲：\n"
+        f"待写入: {events['pending']} 人 (累计 {events['increments']} 次)\n"
+        f"批量写入: {events['flushes']} 次，共 {events['rows_flushed']} 行，失败 {events['failures']} 次\n\n"
+        "👤 用户信息缓存：\n"
+        f"条目: {cache['size']}/{cache['max_size']} (有效期 {cache['ttl']}秒)\n"
+        f"命中/未命中: {cache['hits']}/{cache['misses']} (命中率 {cache['hit_rate']}%)\n"
+        f"淘汰/过期: {cache['evictions']}/{cache['expirations']}\n\n"
+        "⚙️ 热配置：\n"
+        f"授权群组: {registry['groups']} 个，管理员: {registry['admins']} 人\n"
+        f"重新加载: {registry['reload_count']} 次\n\n"
+        "📚 书籍收录：\n"
+        f"流式哈希: {books['files_hashed']} 个文件，{books['bytes_hashed'] / (1024 * 1024):.2f} MB ({books['hash_mb_per_sec']} MB/s)\n"
+        f"省去二次读盘: {books['reread_bytes_avoided'] / (1024 * 1024):.2f} MB\n"
+        f"索引跳过下载: {books['index_hits']} 个，{books['index_skipped_bytes'] / (1024 * 1024):.2f} MB\n"
+        f"下载后判重: {books['duplicates']} 个，{books['duplicate_bytes'] / (1024 * 1024):.2f} MB，失败 {books['failures']} 个\n"
+        f"近似重复: {fingerprints['near_duplicates']} 个 (已索引 {fingerprints['indexed']} 本，阈值 {fingerprints['threshold']:.0%}，平均候选 {fingerprints['avg_candidates']} 个)\n"
+        f"压缩存储: {'开启' if compression['enabled'] else '关闭'}，已压缩 {compression['compressed']} 本，节省 {compression['saved_bytes'] / (1024 * 1024):.2f} MB，解压发送 {compression['served']} 次\n"
+        f"元数据提取: 已提取 {metadata['extracted']} 本，排队 {metadata['queued']} 本，失败 {metadata['failures']} 本\n"
+        f"精品书库目录: {catalog['books']} 本，扫描 {catalog['scans']} 次 (最近一次 {catalog['last_scan_ms']}ms)，主动更新 {catalog['updates']} 次\n"
+        f"自动登记: {catalog['imported']} 本，文件缺失: {catalog['missing']} 本，已缓存file_id: {catalog['cached_file_ids']} 本\n"
+        f"书名搜索: {catalog['searches']} 次 (平均 {catalog['avg_search_ms']}ms)\n"
+        f"搜索翻页缓存: {cursors['size']}/{cursors['max_size']} 条，命中/过期 {cursors['hits']}/{cursors['misses']}\n\n"
+        "📥 下载队列：\n"
+        f"下载中: {downloads['running']}/{downloads['workers']}，排队: {downloads['queued']} 个 ({downloads['users_waiting']} 人)，最高 {downloads['max_depth']} 个\n"
+        f"完成/失败/磁盘不足: {downloads['completed']}/{downloads['failed']}/{downloads['disk_rejected']} (平均排队 {downloads['avg_wait_ms']}ms)\n"
+        f"进度消息: {progress['updates']} 次进度合并为 {progress['edits']} 次编辑，跳过未变化 {progress['unchanged']} 次，FloodWait {progress['flood_waits']} 次"
+    )
+    
+    # 调用次数最多的命令
+    commands = [item for item in command_router.get_stats() if item['calls']][:5]
+    if commands:
+        reply_text += "\n\n⌨️ 常用命令：\n" + "\n".join(
+            f"/{item['command']}: {item['calls']} 次 (平均 {item['avg_ms']}ms，最长 {item['max_ms']}ms，出错 {item['errors']})"
+            for item in commands
+        )
+    
+    return await message.reply(reply_text)
+
 # 注册命令处理器
 def register_command_handlers(app):
     """注册所有命令处理器"""
-    app.add_handler(MessageHandler(start_command, filters.command("start")))
-    app.add_handler(MessageHandler(help_command, filters.command("help")))
-    app.add_handler(MessageHandler(my_command, filters.command("my")))
-    app.add_handler(MessageHandler(checkin_command, filters.command("checkin")))
-    app.add_handler(MessageHandler(authorize_group_command, filters.command("auth")))
-    app.add_handler(MessageHandler(add_admin_command, filters.command("addadmin")))
-    app.add_handler(MessageHandler(add_points_command, filters.command("addpoint")))
-    app.add_handler(MessageHandler(sub_points_command, filters.command("subpoint")))
-    app.add_handler(MessageHandler(deduct_points_command, filters.command("deduct")))
-    app.add_handler(MessageHandler(gua_command, filters.command("gua")))
-    app.add_handler(MessageHandler(tiankou_command, filters.command("tiankou")))
-    app.add_handler(MessageHandler(tujing_command, filters.command("tujing")))
-    app.add_handler(MessageHandler(dajie_command, filters.command("dajie")))
-    app.add_handler(MessageHandler(slave_command, filters.command("slave")))
-    app.add_handler(MessageHandler(confirm_slave_command, filters.command("confirm")))
-    app.add_handler(MessageHandler(rob_command, filters.command("rob")))
-    app.add_handler(MessageHandler(buy_command, filters.command("buy")))
-    app.add_handler(MessageHandler(si_command, filters.command("si")))
-    app.add_handler(MessageHandler(feisheng_command, filters.command("feisheng"))) 
-    app.add_handler(MessageHandler(ask_command, filters.command("ask")))
-    app.add_handler(MessageHandler(aiconfig_command, filters.command("aiconfig")))
-    app.add_handler(MessageHandler(aireset_command, filters.command("aireset")))
-    app.add_handler(MessageHandler(shield_help_command, filters.command("shield")))
-    app.add_handler(MessageHandler(gongde_command, filters.command("gongde")))
-    app.add_handler(MessageHandler(hongbao_command, filters.command("hongbao")))
-    app.add_handler(MessageHandler(set_redemption_code_command, filters.command("set")))
-    app.add_handler(MessageHandler(redeem_code_command, filters.command("duihuan")))
+    # 所有命令通过命令分发器处理，需在其他消息处理器之前注册
+    command_router.register(app)
+    
+    command_router.add("start", start_command)
+    command_router.add("help", help_command)
+    command_router.add("my", my_command)
+    command_router.add("checkin", checkin_command)
+    command_router.add("auth", authorize_group_command, admin_only=True)
+    command_router.add("addadmin", add_admin_command, admin_only=True)
+    command_router.add("addpoint", add_points_command, admin_only=True)
+    command_router.add("subpoint", sub_points_command, admin_only=True)
+    command_router.add("deduct", deduct_points_command, admin_only=True)
+    command_router.add("gua", gua_command)
+    command_router.add("tiankou", tiankou_command)
+    command_router.add("tujing", tujing_command)
+    command_router.add("dajie", dajie_command)
+    command_router.add("slave", slave_command)
+    command_router.add("confirm", confirm_slave_command)
+    command_router.add("rob", rob_command)
+    command_router.add("buy", buy_command)
+    command_router.add("si", si_command)
+    command_router.add("feisheng", feisheng_command)
+    command_router.add("ask", ask_command, concurrency=3)
+    command_router.add("aiconfig", aiconfig_command, admin_only=True)
+    command_router.add("aireset", aireset_command)
+    command_router.add("shield", shield_help_command)
+    command_router.add("gongde", gongde_command)
+    command_router.add("hongbao", hongbao_command)
+    command_router.add("set", set_redemption_code_command, admin_only=True)
+    command_router.add("duihuan", redeem_code_command)
+    command_router.add("stats", stats_command, admin_only=True)
     
     # 添加回调查询处理器
     app.add_handler(CallbackQueryHandler(handle_hongbao_callback, filters.regex("^hongbao_")))
     
+    # 注册对话分发器（猫娘、飞升算术题等按用户进行中的对话）
+    conversation_router.register(app)
+    
     # 添加回复机器人消息的处理器
     app.add_handler(MessageHandler(handle_bot_reply, filters.text & filters.reply), group=10) 
 
@@ -1584,13 +1570,16 @@ async def hongbao_command(client, message):
     if total_amount < total_people:
         return await message.reply("⚠️ 积分总数必须不少于领取人数，确保每人至少能领到1积分")
     
+    # 先写入缓冲中的水群积分，保证读到准确余额
+    await points_buffer.flush_user(user_id)
+    
     # 检查用户积分是否足够
-    user_points = db_service.get_user_points(user_id)
+    user_points = await async_db_service.get_user_points(user_id)
     if user_points < total_amount:
         return await message.reply(f"⚠️ 积分不足！你只有 {user_points} 灵石，但需要 {total_amount} 灵石")
     
     # 扣除积分
-    db_service.update_points(user_id, -total_amount)
+    await async_db_service.update_points(user_id, -total_amount)
     
     # 生成红包ID
     hongbao_id = str(uuid.uuid4())
@@ -1632,7 +1621,7 @@ async def hongbao_command(client, message):
     active_hongbaos[hongbao_id]["message_id"] = hongbao_msg.id
     
     # 将红包数据保存到数据库
-    save_hongbao_to_db(hongbao_id)
+    await save_hongbao_to_db(hongbao_id)
     
     # 置顶消息
     try:
@@ -1655,7 +1644,7 @@ async def expire_hongbao(client, hongbao_id, delay=24*60*60):
     
     # 如果还有剩余积分，返还给发红包的人
     if hongbao["remaining_amount"] > 0:
-        db_service.update_points(hongbao["creator_id"], hongbao["remaining_amount"])
+        await async_db_service.update_points(hongbao["creator_id"], hongbao["remaining_amount"])
         
         try:
             # 更新红包消息
@@ -1728,10 +1717,10 @@ async def handle_hongbao_callback(client, callback_query):
     }
     
     # 保存更新后的红包状态到数据库
-    save_hongbao_to_db(hongbao_id)
+    await save_hongbao_to_db(hongbao_id)
     
     # 添加积分给用户
-    db_service.update_points(user_id, amount)
+    await async_db_service.update_points(user_id, amount)
     
     # 构建已领取用户列表（使用字典的副本避免迭代错误）
     claimed_text = "\n\n已领取用户：\n"
@@ -1791,10 +1780,6 @@ async def set_redemption_code_command(client, message):
     """处理/set命令，添加兑换码"""
     user_id = message.from_user.id
     
-    # 检查是否为管理员
-    if not admin_service.is_admin(user_id):
-        return await message.reply("此命令仅限管理员使用")
-    
     # 解析命令参数
     command_parts = message.text.split()
     if len(command_parts) < 2:
@@ -1807,9 +1792,9 @@ async def set_redemption_code_command(client, message):
         return await message.reply("兑换码长度必须在5-30个字符之间")
     
     # 添加兑换码到数据库
-    if db_service.add_redemption_code(redemption_code, user_id):
+    if await async_db_service.add_redemption_code(redemption_code, user_id):
         # 获取未使用的兑换码数量
-        unused_count = db_service.get_redemption_codes_count(used=False)
+        unused_count = await async_db_service.get_redemption_codes_count(used=False)
         return await message.reply(f"兑换码添加成功，当前有 {unused_count} 个可用兑换码")
     else:
         return await message.reply("兑换码添加失败，可能是兑换码已存在")
@@ -1820,8 +1805,11 @@ async def redeem_code_command(client, message):
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.first_name or f"用户{user_id}"
     
+    # 先写入缓冲中的水群积分，保证读到准确余额
+    await points_buffer.flush_user(user_id)
+    
     # 获取用户信息
-    user_info = db_service.get_user(user_id)
+    user_info = await async_db_service.get_user(user_id)
     if not user_info:
         return await message.reply("请先使用 /start 命令注册")
     
@@ -1854,18 +1842,18 @@ async def redeem_code_command(client, message):
     else:
         # 在私聊中，正常处理兑换流程
         # 获取一个未使用的兑换码
-        redemption_code = db_service.get_unused_redemption_code()
+        redemption_code = await async_db_service.get_unused_redemption_code()
         if not redemption_code:
             return await message.reply("当前没有可用的兑换码，请稍后再试")
         
         # 扣除用户积分
-        if not db_service.update_points(user_id, -3000):
+        if not await async_db_service.update_points(user_id, -3000):
             return await message.reply("扣除积分失败，请稍后再试")
         
         # 标记兑换码为已使用
-        if not db_service.mark_redemption_code_used(redemption_code, user_id):
+        if not await async_db_service.mark_redemption_code_used(redemption_code, user_id):
             # 如果标记失败，尝试退还积分
-            db_service.update_points(user_id, 3000)
+            await async_db_service.update_points(user_id, 3000)
             return await message.reply("获取兑换码失败，已退还积分，请稍后再试")
         
         # 在私聊中发送兑换码
@@ -0,0 +1,141 @@
+import re
+import time
+import asyncio
+from pyrogram import filters
+from pyrogram.enums import ChatType
+from pyrogram.handlers import MessageHandler
+from bot.services.admin_service import admin_service
+from bot.utils.helpers import auto_delete_messages
+
+# 命令参数的解析方式与pyrogram的filters.command保持一致（支持引号包裹的参数）
+COMMAND_ARGS_RE = re.compile(r"([\"'])(.*?)(?<!\\)\1|(\S+)")
+
+class CommandRoute:
+    """一个命令的处理方式"""
+
+    def __init__(self, name, callback, chat=None, admin_only=False, concurrency=None):
+        self.name = name
+        self.callback = callback
+        self.chat = chat  # None不限制，'private'仅私聊，'group'仅群组
+        self.admin_only = admin_only
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    def accepts(self, chat_type):
+        """检查命令是否可以在该类型的聊天中使用"""
+        if self.chat == 'private':
+            return chat_type == ChatType.PRIVATE
+        if self.chat == 'group':
+            return chat_type in (ChatType.GROUP, ChatType.SUPERGROUP)
+        return True
+
+class CommandRouter:
+    """命令分发器
+
+    只在调度器中注册一个处理器：解析一次命令，然后按字典分发，
+    代替为每个命令注册一个filters.command处理器。
+    支持按聊天类型限制、仅管理员可用、每个命令的并发上限，并统计每个命令的耗时。
+    """
+
+    def __init__(self):
+        self._routes = {}  # {命令: [CommandRoute]}，同一命令可以按聊天类型注册多个
+        self._stats = {}  # {命令: 统计信息}
+
+    def add(self, name, callback, chat=None, admin_only=False, concurrency=None):
+        """注册命令"""
+        name = name.lower()
+        self._routes.setdefault(name, []).append(CommandRoute(name, callback, chat, admin_only, concurrency))
+        self._stats.setdefault(name, {
+            'calls': 0, 'errors': 0, 'rejected': 0, 'running': 0, 'total_ms': 0.0, 'max_ms': 0.0
+        })
+
+    def parse(self, client, message):
+        """解析消息中的命令，返回(CommandRoute, 命令参数列表)，不是已注册的命令时返回None"""
+        text = message.text or message.caption
+        if not text or not text.startswith('/'):
+            return None
+
+        parts = text[1:].split(None, 1)
+        if not parts:
+            return None
+
+        # 支持 /命令@机器人用户名 的形式，@其他机器人的命令不处理
+        name, _, target = parts[0].partition('@')
+        routes = self._routes.get(name.lower())
+        if not routes:
+            return None
+        if target:
+            me = getattr(client, 'me', None)
+            if not me or not me.username or target.lower() != me.username.lower():
+                return None
+
+        chat_type = message.chat.type if message.chat else None
+        route = next((route for route in routes if route.accepts(chat_type)), None)
+        if not route:
+            return None
+
+        args = parts[1] if len(parts) > 1 else ""
+        command = [route.name] + [
+            re.sub(r"\\([\"'])", r"\1", match.group(2) or match.group(3) or "")
+            for match in COMMAND_ARGS_RE.finditer(args)
+        ]
+        return route, command
+
+    async def _filter(self, _, client, message):
+        parsed = self.parse(client, message)
+        if not parsed:
+            return False
+        # 与filters.command一样把解析结果放到message.command
+        message._command_route, message.command = parsed
+        return True
+
+    async def dispatch(self, client, message):
+        """执行命令"""
+        route = message._command_route
+        stats = self._stats[route.name]
+
+        if route.admin_only and (not message.from_user or not admin_service.is_admin(message.from_user.id)):
+            stats['rejected'] += 1
+            reply = await message.reply("⚠️ 只有管理员才能执行此操作")
+            asyncio.create_task(auto_delete_messages([message, reply], 10))
+            return
+
+        stats['calls'] += 1
+        stats['running'] += 1
+        start = time.monotonic()
+        try:
+            if route.semaphore:
+                async with route.semaphore:
+                    await route.callback(client, message)
+            else:
+                await route.callback(client, message)
+        except Exception:
+            stats['errors'] += 1
+            raise
+        finally:
+            elapsed = (time.monotonic() - start) * 1000
+            stats['running'] -= 1
+            stats['total_ms'] += elapsed
+            stats['max_ms'] = max(stats['max_ms'], elapsed)
+
+    def register(self, app, group=0):
+        """注册分发处理器，需要在其他消息处理器之前注册"""
+        app.add_handler(MessageHandler(self.dispatch, filters.create(self._filter)), group=group)
+
+    def get_stats(self):
+        """获取每个命令的调用统计，按调用次数排序"""
+        result = []
+        for name, stats in self._stats.items():
+            calls = stats['calls']
+            result.append({
+                'command': name,
+                'calls': calls,
+                'errors': stats['errors'],
+                'rejected': stats['rejected'],
+                'running': stats['running'],
+                'avg_ms': round(stats['total_ms'] / calls, 1) if calls else 0.0,
+                'max_ms': round(stats['max_ms'], 1)
+            })
+        return sorted(result, key=lambda item: item['calls'], reverse=True)
+
+# 创建全局命令分发器实例
+command_router = CommandRouter()
@@ -0,0 +1,56 @@
+from pyrogram import filters
+from pyrogram.handlers import MessageHandler
+
+class ConversationRouter:
+    """按(群组ID, 用户ID)分发正在进行中的对话（猫娘确认/猫娘说话、飞升算术题等）
+
+    只在调度器中注册一个处理器，收到消息时查字典，而不是为每个用户注册一个带过滤器的处理器。
+    同一个用户有多个对话时，按添加顺序只处理第一个（与原来同组处理器只执行第一个匹配的行为一致）。
+    """
+
+    def __init__(self):
+        self._states = {}  # {(群组ID, 用户ID): {对话名称: 回调}}
+
+    def set(self, chat_id, user_id, name, callback):
+        """设置用户在群组中的对话，同名对话会被替换"""
+        self._states.setdefault((chat_id, user_id), {})[name] = callback
+
+    def remove(self, chat_id, user_id, name=None):
+        """移除用户在群组中的对话，name为空时移除全部"""
+        key = (chat_id, user_id)
+        states = self._states.get(key)
+        if not states:
+            return
+        if name is None:
+            states.clear()
+        else:
+            states.pop(name, None)
+        if not states:
+            del self._states[key]
+
+    def get(self, chat_id, user_id):
+        """获取用户当前要处理的对话回调"""
+        states = self._states.get((chat_id, user_id))
+        if not states:
+            return None
+        return next(iter(states.values()))
+
+    async def _filter(self, _, __, message):
+        # 过滤器使用协程函数，pyrogram会把同步过滤器放到线程池执行
+        return bool(message.chat and message.from_user) and (message.chat.id, message.from_user.id) in self._states
+
+    async def dispatch(self, client, message):
+        """把消息交给对应的对话回调"""
+        callback = self.get(message.chat.id, message.from_user.id)
+        if callback:
+            await callback(client, message)
+
+    def register(self, app, group=1):
+        """注册分发处理器，高优先级(1)确保在其他处理器之前执行"""
+        app.add_handler(MessageHandler(self.dispatch, filters.create(self._filter)), group=group)
+
+    def __len__(self):
+        return len(self._states)
+
+# 创建全局对话分发器实例
+conversation_router = ConversationRouter()
@@ -1,11 +1,12 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.enums import ChatType
-from pyrogram.handlers import MessageHandler
 from bot.services.lottery_service import lottery_service
-from bot.services.admin_service import admin_service
-from bot.services.db_service import db_service
-from bot.utils.helpers import auto_delete, auto_delete_messages
+from bot.handlers.command_router import command_router
+from bot.services.async_db_service import async_db_service
+from bot.services.config_registry import config_registry
+from bot.services.write_behind import points_buffer
+from bot.utils.helpers import auto_delete, auto_delete_messages, run_blocking
 import asyncio
 import time
 
@@ -33,12 +34,12 @@ async def start_lottery(client, chat_id=None, force=False):
         return
     
     # 启动新的大乐透
-    numbers = lottery_service.start_new_lottery()
+    numbers = await run_blocking(lottery_service.start_new_lottery)
     pool_amount = lottery_service.current_pool_amount
     
     # 生成公告消息
     announcement_text = (
-        f"🎯 第{get_lottery_round_number()}期大乐透盛大开启！\n\n"
+        f"🎯 第{await get_lottery_round_number()}期大乐透盛大开启！\n\n"
         f"💰 当前奖池总额: {pool_amount:,} 灵石\n\n"
         f"📋 游戏规则:\n"
         f"• 选择3个0-9之间的数字\n"
@@ -59,14 +60,14 @@ async def start_lottery(client, chat_id=None, force=False):
             
             # 保存消息ID
             lottery_status["announcement_message_id"] = message.id
-            lottery_service.set_lottery_message_id(message.id)
+            await run_blocking(lottery_service.set_lottery_message_id, message.id)
             
             print(f"大乐透公告已发送到群组 {chat_id}，消息ID: {message.id}")
         except Exception as e:
             print(f"发送大乐透公告到群组 {chat_id} 失败: {e}")
     else:
         # 发送到所有授权群组
-        groups = db_service.get_all_authorized_groups()
+        groups = config_registry.get_authorized_groups()
         for group in groups:
             try:
                 # 发送公告并置顶
@@ -76,7 +77,7 @@ async def start_lottery(client, chat_id=None, force=False):
                 # 保存第一个群组的消息ID
                 if not lottery_status["announcement_message_id"]:
                     lottery_status["announcement_message_id"] = message.id
-                    lottery_service.set_lottery_message_id(message.id)
+                    await run_blocking(lottery_service.set_lottery_message_id, message.id)
                 
                 print(f"大乐透公告已发送到群组 {group['group_name']}，消息ID: {message.id}")
             except Exception as e:
@@ -104,7 +105,7 @@ async def end_lottery(client, chat_id=None):
         return
     
     # 进行开奖
-    result = lottery_service.draw_lottery()
+    result = await run_blocking(lottery_service.draw_lottery)
     
     if not result["success"]:
         print(f"大乐透开奖失败: {result['message']}")
@@ -118,7 +119,7 @@ async def end_lottery(client, chat_id=None):
     
     # 构建开奖结果消息
     result_text = (
-        f"🎊 第{get_lottery_round_number()}期大乐透开奖结果！\n\n"
+        f"🎊 第{await get_lottery_round_number()}期大乐透开奖结果！\n\n"
         f"🔢 中奖号码: {winning_numbers}\n\n"
     )
     
@@ -174,7 +175,7 @@ async def end_lottery(client, chat_id=None):
             print(f"发送大乐透开奖结果到群组 {chat_id} 失败: {e}")
     else:
         # 发送到所有授权群组
-        groups = db_service.get_all_authorized_groups()
+        groups = config_registry.get_authorized_groups()
         for group in groups:
             try:
                 # 解除之前的置顶
@@ -223,7 +224,7 @@ async def update_lottery_announcement(client, chat_id, new_pool_amount):
         
         # 更新公告文本
         announcement_text = (
-            f"🎯 第{get_lottery_round_number()}期大乐透盛大开启！\n\n"
+            f"🎯 第{await get_lottery_round_number()}期大乐透盛大开启！\n\n"
             f"💰 当前奖池总额: {new_pool_amount:,} 灵石\n\n"
             f"📋 游戏规则:\n"
             f"• 选择3个0-9之间的数字\n"
@@ -242,27 +243,19 @@ async def update_lottery_announcement(client, chat_id, new_pool_amount):
         print(f"更新大乐透公告失败: {e}")
 
 # 获取当前大乐透期数
-def get_lottery_round_number():
+async def get_lottery_round_number():
     """获取当前大乐透期数，格式为YYYYMMDD-XX"""
     # 获取今天的日期
     from datetime import datetime
     today = datetime.now().strftime("%Y%m%d")
     
     # 查询今天已经开了几期
-    connection = db_service.get_connection()
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT COUNT(*) FROM lottery_numbers
-                WHERE DATE(created_at) = CURDATE()
-            """)
-            count = cursor.fetchone()[0]
-            return f"{today}-{count+1}"
+        count = await async_db_service.get_today_lottery_count()
+        return f"{today}-{count+1}"
     except Exception as e:
         print(f"获取大乐透期数失败: {e}")
         return f"{today}-1"
-    finally:
-        connection.close()
 
 # 管理员启动大乐透命令
 @auto_delete()
@@ -270,11 +263,6 @@ async def daletou_command(client, message):
     """处理/daletou命令，管理员强制启动大乐透"""
     user_id = message.from_user.id
     
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        reply = await message.reply("⚠️ 只有管理员才能执行此操作")
-        return await auto_delete_messages([message, reply], 5)
-    
     # 检查是否在群组中
     if message.chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
         reply = await message.reply("⚠️ 此命令只能在群组中使用")
@@ -323,13 +311,6 @@ async def daletou_command(client, message):
 @auto_delete()
 async def draw_command(client, message):
     """处理/draw命令，管理员手动开奖（仅用于开发测试）"""
-    user_id = message.from_user.id
-    
-    # 检查是否是管理员
-    if not admin_service.is_admin(user_id):
-        reply = await message.reply("⚠️ 只有管理员才能执行此操作")
-        return await auto_delete_messages([message, reply], 5)
-    
     # 检查是否在群组中
     if message.chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
         reply = await message.reply("⚠️ 此命令只能在群组中使用")
@@ -386,8 +367,11 @@ async def le_command(client, message):
         reply = await message.reply("⚠️ 注数必须是正整数")
         return await auto_delete_messages([message, reply], 5)
     
+    # 先写入缓冲中的水群积分，保证下注时读到准确余额
+    await points_buffer.flush_user(user_id)
+    
     # 执行下注
-    result = lottery_service.place_bet(user_id, username, numbers, bet_count)
+    result = await run_blocking(lottery_service.place_bet, user_id, username, numbers, bet_count)
     
     if not result["success"]:
         reply = await message.reply(result["message"])
@@ -455,11 +439,11 @@ async def wait_and_end_lottery(client, seconds):
 def register_lottery_handlers(app):
     """注册大乐透相关的处理器"""
     # 管理员命令
-    app.add_handler(MessageHandler(daletou_command, filters.command("daletou")))
-    app.add_handler(MessageHandler(draw_command, filters.command("draw")))
+    command_router.add("daletou", daletou_command, admin_only=True)
+    command_router.add("draw", draw_command, admin_only=True)
     
     # 用户命令
-    app.add_handler(MessageHandler(le_command, filters.command("le")))
+    command_router.add("le", le_command)
     
     # 设置定时任务
     app.loop.create_task(setup_lottery_scheduler(app))
@@ -476,13 +460,13 @@ async def restore_lottery_status(client):
     
     try:
         # 获取最新的大乐透记录
-        numbers = lottery_service.get_current_numbers()
-        message_id = lottery_service.get_lottery_message_id()
+        numbers = await run_blocking(lottery_service.get_current_numbers)
+        message_id = await run_blocking(lottery_service.get_lottery_message_id)
         
         # 检查是否有大乐透记录
         if numbers and message_id:
             # 检查最新一期大乐透的创建时间
-            today_lottery = db_service.get_today_lottery()
+            today_lottery = lottery_service.get_today_lottery()
             
             if today_lottery:
                 # 如果有今天的大乐透记录，则恢复状态
@@ -4,10 +4,16 @@ from pyrogram.enums import ChatMemberStatus
 from pyrogram.handlers import MessageHandler
 from bot.services.admin_service import admin_service
 from bot.services.book_service import book_service
+from bot.services.download_scheduler import download_scheduler
 from bot.services.cultivation_service import cultivation_service
-from bot.services.db_service import db_service
-from bot.config.config import CHAT_MIN_CHARS, ALLOWED_EXTENSIONS, BOOK_POINT_REWARD, CULTIVATION_STAGES, BOOK_DOWNLOAD_PATH
-from bot.utils.helpers import is_chinese_text, auto_delete_messages, calculate_md5, auto_delete_reply
+from bot.services.async_db_service import async_db_service
+from bot.services.write_behind import points_buffer, event_counter_buffer
+from bot.services.daily_state_service import daily_state_service
+from bot.config.config import (
+    CHAT_MIN_CHARS, ALLOWED_EXTENSIONS, BOOK_POINT_REWARD, CULTIVATION_STAGES, BOOK_DOWNLOAD_PATH,
+    UPLOAD_BURST_WINDOW, UPLOAD_SUMMARY_INTERVAL
+)
+from bot.utils.helpers import is_chinese_text, auto_delete_messages, calculate_md5, auto_delete_reply, run_blocking, roll_random_event
 import pyrogram
 import asyncio
 import time
@@ -15,9 +21,6 @@ import random
 from collections import defaultdict, deque
 import os
 
-# 全局处理队列和信号量
-processing_queue = {}  # 用户ID -> 队列
-user_semaphores = {}  # 用户ID -> 信号量
 # 全局命令信号量，用于确保命令始终能被处理
 command_semaphore = asyncio.Semaphore(30)  # 允许30个命令同时处理
 
@@ -25,178 +28,180 @@ command_semaphore = asyncio.Semaphore(30)  # 允许30个命令同时处理
 group_messages = defaultdict(lambda: deque(maxlen=30))  # 群组ID -> 最近30条消息
 group_message_count = defaultdict(int)  # 群组ID -> 消息计数
 
-# 用户上传速率控制器
-class UploadRateController:
-    def __init__(self, max_concurrent=3, rate_limit=10, time_window=60):
-        """初始化上传速率控制器
-        
-        Args:
-            max_concurrent: 同一用户最大并发处理数
-            rate_limit: 时间窗口内最大处理数
-            time_window: 时间窗口，单位秒
-        """
-        self.max_concurrent = max_concurrent
-        self.rate_limit = rate_limit
-        self.time_window = time_window
-        self.user_uploads = defaultdict(list)
-    
-    def can_process_now(self, user_id):
-        """检查是否可以立即处理用户上传
-        
-        Args:
-            user_id: 用户ID
-        
-        Returns:
-            bool: 是否允许立即处理
-            int: 建议等待的时间（秒）
-        """
-        current_time = time.time()
-        
-        # 清理过期的上传记录
-        self.user_uploads[user_id] = [t for t in self.user_uploads[user_id] 
-                                     if current_time - t < self.time_window]
-        
-        # 检查上传次数是否超过限制
-        if len(self.user_uploads[user_id]) >= self.rate_limit:
-            # 计算需要等待的时间
-            oldest_time = self.user_uploads[user_id][0]
-            wait_time = int(self.time_window - (current_time - oldest_time))
-            return False, max(1, wait_time)
-        
-        return True, 0
-    
-    def record_upload(self, user_id):
-        """记录一次上传处理
-        
-        Args:
-            user_id: 用户ID
-        """
-        self.user_uploads[user_id].append(time.time())
-    
-    def get_user_semaphore(self, user_id):
-        """获取用户的信号量，用于控制并发
-        
-        Args:
-            user_id: 用户ID
-            
-        Returns:
-            asyncio.Semaphore: 用户的信号量
-        """
-        if user_id not in user_semaphores:
-            user_semaphores[user_id] = asyncio.Semaphore(self.max_concurrent)
-        return user_semaphores[user_id]
-
-# 创建上传速率控制器 - 增加并发处理数和速率限制
-upload_controller = UploadRateController(max_concurrent=10, rate_limit=50, time_window=60)
-
-async def process_file_task(client, message, file_id, file_name, user_id, username):
-    """异步处理文件任务"""
-    semaphore = upload_controller.get_user_semaphore(user_id)
-    
-    async with semaphore:
-        # 检查是否可以立即处理，如果不能，等待适当的时间
-        can_process, wait_time = upload_controller.can_process_now(user_id)
-        if not can_process:
-            # 等待时间减少到1/4，显著提高处理速度
-            adjusted_wait_time = max(1, wait_time // 4)
-            await asyncio.sleep(adjusted_wait_time)
-        
-        # 记录此次处理
-        upload_controller.record_upload(user_id)
-        
-        # 处理文件下载和奖励
-        process_msg = None
-        max_retries = 3
-        retry_count = 0
-        
-        # 发送处理消息，有重试机制
-        while process_msg is None and retry_count < max_retries:
-            try:
-                process_msg = await message.reply(f"🔄 正在处理文件: {file_name}...")
-                break
-            except pyrogram.errors.exceptions.flood_420.FloodWait as e:
-                print(f"FloodWait: 需要等待 {e.value} 秒，文件: {file_name}")
-                retry_count += 1
-                if retry_count < max_retries:
-                    # 减少等待时间至1/4，但不低于1秒
-                    adjusted_wait = max(1, e.value // 4)
-                    await asyncio.sleep(adjusted_wait)
-                else:
-                    print(f"达到最大重试次数，无法处理文件: {file_name}")
-                    return
-            except Exception as e:
-                print(f"发送消息时出错: {str(e)}")
-                return
-        
-        # 使用异步方式处理文件，不阻塞其他操作
-        result = await asyncio.create_task(book_service.process_book_file(file_id, file_name, user_id, client))
-        
-        # 更新处理消息，有重试机制
-        retry_count = 0
-        while retry_count < max_retries:
+class UploadBurst:
+    """一个用户在一个群里连续上传的一批书籍
+
+    同一用户在UPLOAD_BURST_WINDOW秒内连续发送的文件（转发的一组文件同时到达）归为一批：
+    所有文件共用一条实时更新的汇总消息，新书在整批处理完后一次事务写入数据库。
+    """
+
+    def __init__(self, client, message, user_id, username):
+        self.client = client
+        self.message = message  # 本批第一个文件的消息，汇总消息回复它
+        self.user_id = user_id
+        self.username = username
+        self.key = (message.chat.id, user_id)
+        self.total = 0
+        self.pending = 0
+        self.started = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.books = []  # 下载完成、等待统一写库的新书
+        self.position = 0  # 最近一次加入队列时前面的文件数
+        self.last_added = time.monotonic()
+        self.summary_msg = None
+        self._last_edit = 0.0
+        self._sending = False  # 正在发送或编辑汇总消息
+        self._idle = asyncio.Event()
+        self._closer = None
+
+    def add_file(self, message, known=False):
+        """加入一个文件，known为True表示通过索引已知是重复文件，不需要下载"""
+        document = message.document
+        self.total += 1
+        self.last_added = time.monotonic()
+        if known:
+            self.duplicates += 1
+            return
+
+        self.pending += 1
+        self.position = download_scheduler.submit(
+            self.user_id,
+            document.file_size,
+            lambda: self._process(document),
+            self._on_rejected
+        )
+
+    async def _process(self, document):
+        """下载并判重一个文件（由下载调度器执行）"""
+        self.started += 1
+        try:
+            result = await book_service.download_book_file(
+                document.file_id, document.file_name, self.client, document.file_unique_id
+            )
+            if not result['success']:
+                self.failed += 1
+            elif result['is_duplicate']:
+                self.duplicates += 1
+            else:
+                self.books.append(result['book'])
+        except Exception as e:
+            print(f"处理文件 {document.file_name} 时出错: {e}")
+            self.failed += 1
+        finally:
+            self._file_done()
+        await self.update_summary()
+
+    async def _on_rejected(self, reason):
+        """磁盘空间不足等原因未下载"""
+        self.failed += 1
+        self._file_done()
+        await self.update_summary(reason=reason)
+
+    def _file_done(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self._idle.set()
+
+    def start(self):
+        """开始等待本批结束"""
+        self._closer = asyncio.create_task(self._close_when_done())
+
+    async def _close_when_done(self):
+        """所有文件处理完且一段时间内没有新文件时结束本批"""
+        while True:
+            wait = self.last_added + UPLOAD_BURST_WINDOW - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            if self.pending:
+                self._idle.clear()
+                await self._idle.wait()
+                continue
+            break
+
+        # 不再接收新文件
+        if upload_bursts.get(self.key) is self:
+            del upload_bursts[self.key]
+        await self.commit()
+
+    async def commit(self):
+        """一次事务收录本批新书并发送最终汇总"""
+        result = None
+        if self.books:
             try:
-                if result['success']:
-                    if result['is_duplicate']:
-                        response_msg = await process_msg.edit_text(f"⚠️ {result['message']}")
-                        # 已存在书籍的消息10秒后只删除回复消息，保留原始文件消息
-                        asyncio.create_task(auto_delete_reply(response_msg, 10))
-                    else:
-                        # 构建成功消息
-                        success_message = f"✅ {result['message']}\n获得 {result['reward']} 灵石奖励！\n当前灵石: {result['new_points']}"
-                        
-                        # 添加书籍上传计数信息
-                        if 'books_uploaded' in result:
-                            success_message += f"\n今日已上传: {result['books_uploaded']}/10 本"
-                            
-                            # 如果刚激活保护罩，显示特别提示
-                            if result.get('shield_activated', False):
-                                success_message += "\n🛡️ 已获得今日保护罩，不会被任何人打劫！"
-                        
-                        response_msg = await process_msg.edit_text(success_message)
-                        
-                        # 在这里检查并处理飞升任务
-                        if not result['is_duplicate']:
-                            # 直接检查用户是否在飞升任务的第三阶段
-                            task = db_service.get_ascension_task(user_id)
-                            print(f"用户 {user_id} 飞升任务状态: {task}")
-                            
-                            if task and task['current_stage'] == 3:
-                                print(f"用户 {user_id} 处于飞升任务第三阶段，开始处理书籍上传进度")
-                                # 更新分享书籍数量
-                                shared_books = task['shared_books'] + 1
-                                db_service.update_ascension_task(user_id, shared_books=shared_books)
-                                print(f"更新后的书籍数量: {shared_books}/20")
-                                
-                                # 发送飞升任务进度消息
-                                progress_msg = await message.reply(
-                                    f"📚 飞升任务进度更新！\n"
-                                    f"已分享书籍：{shared_books}/20"
-                                )
-                                
-                                # 10秒后自动删除进度消息
-                                asyncio.create_task(auto_delete_reply(progress_msg, 10))
-                        
-                        # 成功上传书籍的消息10秒后只删除回复消息，保留原始文件消息
-                        asyncio.create_task(auto_delete_reply(response_msg, 10))
-                else:
-                    await process_msg.edit_text(f"❌ {result['message']}")
-                break
-            except pyrogram.errors.exceptions.flood_420.FloodWait as e:
-                print(f"FloodWait: 需要等待 {e.value} 秒以更新消息，文件: {file_name}")
-                retry_count += 1
-                if retry_count < max_retries:
-                    # 减少等待时间至1/4，但不低于1秒
-                    adjusted_wait = max(1, e.value // 4)
-                    await asyncio.sleep(adjusted_wait)
-                else:
-                    print(f"达到最大重试次数，无法更新消息: {file_name}")
-                    return
+                result = await book_service.commit_books(self.user_id, self.books)
+                self.duplicates += result['duplicates']
             except Exception as e:
-                print(f"更新消息时出错: {str(e)}")
-                print(f"错误详情: {type(e).__name__}: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
-                return
+                print(f"批量收录书籍时出错: {e}")
+                self.failed += len(self.books)
+        self.books = []
+
+        summary_msg = await self.update_summary(result=result, final=True)
+        if summary_msg:
+            asyncio.create_task(auto_delete_reply(summary_msg, 30))
+
+    def _format_summary(self, result=None, final=False, reason=None):
+        """生成汇总消息文本"""
+        accepted = result['accepted'] if result else len(self.books)
+        lines = [
+            f"📚 {'上传完成' if final else '正在处理上传'}：共 {self.total} 个文件",
+            f"✅ 新书: {accepted}  ⚠️ 重复: {self.duplicates}  ❌ 失败: {self.failed}"
+        ]
+        if not final:
+            if self.pending and not self.started and self.position:
+                lines.append(f"⏳ 排队中，前面还有 {self.position} 个文件")
+            elif self.pending:
+                lines.append(f"🔄 处理中: {self.pending} 个")
+        if reason:
+            lines.append(f"❌ {reason}")
+
+        if result and result['accepted']:
+            lines.append(f"获得 {result['reward']} 灵石奖励！当前灵石: {result['new_points']}")
+            lines.append(f"今日已上传: {result['books_uploaded']}/10 本")
+            if result['shield_activated']:
+                lines.append("🛡️ 已获得今日保护罩，不会被任何人打劫！")
+            if result['shared_books'] is not None:
+                lines.append(f"📚 飞升任务进度：已分享书籍 {result['shared_books']}/20")
+        return "\n".join(lines)
+
+    async def update_summary(self, result=None, final=False, reason=None):
+        """发送或更新汇总消息，处理中的更新按UPLOAD_SUMMARY_INTERVAL限频"""
+        if final:
+            # 等正在进行的发送完成，保证最终汇总是最后一次编辑
+            while self._sending:
+                await asyncio.sleep(0.1)
+        elif self._sending:
+            return self.summary_msg
+
+        now = time.monotonic()
+        if self.summary_msg and not final and not reason and now - self._last_edit < UPLOAD_SUMMARY_INTERVAL:
+            return self.summary_msg
+        self._last_edit = now
+
+        text = self._format_summary(result, final, reason)
+        self._sending = True
+        try:
+            if self.summary_msg is None:
+                self.summary_msg = await self.message.reply(text)
+            else:
+                await self.summary_msg.edit_text(text)
+        except pyrogram.errors.exceptions.flood_420.FloodWait as e:
+            print(f"FloodWait: 需要等待 {e.value} 秒以更新上传汇总")
+            if final:
+                await asyncio.sleep(e.value)
+                self._sending = False
+                return await self.update_summary(result, final, reason)
+        except pyrogram.errors.MessageNotModified:
+            pass
+        except Exception as e:
+            print(f"更新上传汇总消息时出错: {str(e)}")
+        finally:
+            self._sending = False
+        return self.summary_msg
+
+# 正在进行中的上传批次 {(群组ID, 用户ID): UploadBurst}
+upload_bursts = {}
 
 async def handle_new_member(client, message):
     """处理新成员加入群组"""
@@ -229,17 +234,11 @@ async def handle_new_member(client, message):
             user_id = member.id
             username = member.username or member.first_name
             
-            # 检查用户是否已注册
-            user = db_service.get_user(user_id)
-            if not user:
-                # 创建新用户
-                db_service.create_user(user_id, username)
-            else:
-                # 更新用户名
-                db_service.update_username(user_id, username)
+            # 确保用户已注册，并更新用户名
+            await async_db_service.ensure_user_profile(user_id, username, update_names=True)
             
             # 添加用户到群组关联
-            db_service.add_user_to_group(user_id, message.chat.id)
+            await async_db_service.add_user_to_group(user_id, message.chat.id)
 
 async def handle_text_message(client, message):
     """处理文本消息"""
@@ -254,39 +253,27 @@ async def handle_text_message(client, message):
     user_id = message.from_user.id
     chat_id = message.chat.id
     
-    # 在消息处理前检查用户是否存在
-    user = db_service.get_user(user_id)
-    if not user:
-        first_name = message.from_user.first_name or ""
-        last_name = message.from_user.last_name or ""
-        full_name = (first_name + " " + last_name).strip()
-        username = full_name or message.from_user.username or "无名修士"
-        db_service.create_user(user_id, username, first_name, last_name)
-    
-    # 确保用户有修仙记录
-    cultivation = cultivation_service.get_user_cultivation(user_id)
-    if not cultivation:
-        db_service.initialize_user_cultivation(user_id)
+    # 在消息处理前确保用户已注册并有修仙记录（一次查询）
+    first_name = message.from_user.first_name or ""
+    last_name = message.from_user.last_name or ""
+    full_name = (first_name + " " + last_name).strip()
+    username = full_name or message.from_user.username or "无名修士"
+    profile = await async_db_service.ensure_user_profile(user_id, username, first_name, last_name)
     
     # 检查消息中是否包含"奶龙"，如果包含则触发AI回复
     if "奶龙" in message.text:
         asyncio.create_task(ai_direct_reply(client, message))
     
-    # 检查用户是否是地仙（飞升成功），处理每日首次发言
-    is_immortal = db_service.is_immortal(user_id)
-    if is_immortal:
-        # 判断是否为今日首次发言
-        if not db_service.check_immortal_daily_chat(user_id):
-            # 记录地仙已发言
-            db_service.mark_immortal_greeted(user_id)
-            
-            # 获取用户全名
-            first_name = message.from_user.first_name or ""
-            last_name = message.from_user.last_name or ""
-            user_full_name = (first_name + " " + last_name).strip() or message.from_user.username or "道友"
-            
-            # 发送欢迎语
-            await welcome_immortal(client, message, user_full_name)
+    # 检查用户是否是地仙（飞升成功），处理每日首次发言（内存判断，不查询数据库）
+    daily_state_service.on_stage_change(user_id, profile['stage'])
+    if daily_state_service.try_greet(user_id):
+        # 获取用户全名
+        first_name = message.from_user.first_name or ""
+        last_name = message.from_user.last_name or ""
+        user_full_name = (first_name + " " + last_name).strip() or message.from_user.username or "道友"
+        
+        # 发送欢迎语
+        await welcome_immortal(client, message, user_full_name)
     
     # 处理文本内容（异步，不阻塞）
     asyncio.create_task(process_text_message(user_id, message))
@@ -344,14 +331,22 @@ async def ai_random_reply(client, chat_id):
         import traceback
         print(traceback.format_exc())
 
+async def roll_message_event(user_id):
+    """记录事件计数并掷出随机事件，只有真正触发事件时才访问数据库"""
+    event_counter_buffer.record(user_id)
+    event_type = roll_random_event()
+    if not event_type:
+        return None
+    return await run_blocking(cultivation_service.process_event, user_id, event_type)
+
 async def process_text_message(user_id, message):
     """异步处理文本消息内容"""
     try:
-        # 加1分作为水群奖励
-        db_service.update_points(user_id, 1)
+        # 加1分作为水群奖励（写入缓冲，定时批量落库）
+        points_buffer.add(user_id, 1)
         
         # 处理可能的随机事件
-        event = cultivation_service.process_message(user_id, message.text)
+        event = await roll_message_event(user_id)
         
         # 如果触发了事件，发送通知
         if event and event['message']:
@@ -372,7 +367,6 @@ async def handle_document(client, message):
     
     document = message.document
     file_name = document.file_name
-    file_id = document.file_id
     
     # 检查文件类型是否允许
     if not any(file_name.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS):
@@ -382,25 +376,23 @@ async def handle_document(client, message):
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.first_name
     
-    # 检查用户是否已注册
-    user = db_service.get_user(user_id)
-    if not user:
-        db_service.create_user(user_id, username)
-    
-    # 初始化用户的处理队列
-    if user_id not in processing_queue:
-        processing_queue[user_id] = []
-    
-    # 创建异步任务处理文件（立即启动而不等待）
-    task = asyncio.create_task(
-        process_file_task(client, message, file_id, file_name, user_id, username)
-    )
+    # 确保用户已注册
+    await async_db_service.ensure_user_profile(user_id, username)
     
-    # 添加到用户队列
-    processing_queue[user_id].append(task)
+    # 已收录的文件（file_unique_id在索引中）直接算作重复，不下载
+    known = await book_service.is_known_file(document.file_unique_id, document.file_size)
     
-    # 清理已完成的任务
-    processing_queue[user_id] = [t for t in processing_queue[user_id] if not t.done()]
+    # 同一用户连续上传的文件归入同一批，共用一条汇总消息
+    # 取批次和加入文件之间不能有await，否则批次可能在此期间结束
+    key = (message.chat.id, user_id)
+    burst = upload_bursts.get(key)
+    is_new_burst = burst is None
+    if is_new_burst:
+        burst = upload_bursts[key] = UploadBurst(client, message, user_id, username)
+    burst.add_file(message, known=known)
+    if is_new_burst:
+        burst.start()
+    await burst.update_summary()
 
 # 添加命令处理器装饰器，确保命令处理优先进行
 def with_command_priority(func):
@@ -514,22 +506,15 @@ async def handle_message(client, message):
     user_id = message.from_user.id
     chat_id = message.chat.id
     
-    # 检查用户是否存在
-    user = db_service.get_user(user_id)
-    if not user:
-        first_name = message.from_user.first_name or ""
-        last_name = message.from_user.last_name or ""
-        full_name = (first_name + " " + last_name).strip()
-        username = full_name or message.from_user.username or "无名修士"
-        db_service.create_user(user_id, username, first_name, last_name)
-    
-    # 确保用户有修仙记录
-    cultivation = cultivation_service.get_user_cultivation(user_id)
-    if not cultivation:
-        db_service.initialize_user_cultivation(user_id)
+    # 确保用户已注册并有修仙记录
+    first_name = message.from_user.first_name or ""
+    last_name = message.from_user.last_name or ""
+    full_name = (first_name + " " + last_name).strip()
+    username = full_name or message.from_user.username or "无名修士"
+    await async_db_service.ensure_user_profile(user_id, username, first_name, last_name)
     
     # 处理随机事件
-    event_result = cultivation_service.process_message(user_id, message.text)
+    event_result = await roll_message_event(user_id)
     if event_result: 
         # 如果触发了事件，发送通知
         if 'message' in event_result and event_result['message']:
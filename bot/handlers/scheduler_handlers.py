@@ -4,14 +4,17 @@ from datetime import datetime, time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from bot.services.gang_service import gang_service
 from bot.services.game_service import game_service
-from bot.services.db_service import db_service
+from bot.services.async_db_service import async_db_service
+from bot.services.config_registry import config_registry
 from bot.services.admin_service import admin_service
+from bot.utils.helpers import run_blocking
+from bot.services.compression_service import compression_service
+from bot.config.config import CONFIG_RELOAD_INTERVAL, BOOK_COMPRESS_INTERVAL
 from pyrogram.enums import ChatMemberStatus
-from pyrogram.handlers import MessageHandler
-from pyrogram import filters
 
 # 导入猫娘相关的处理函数
 from bot.handlers.command_handlers import handle_catgirl_confirmation, handle_catgirl_messages, restore_hongbaos
+from bot.handlers.conversation_router import conversation_router
 
 # 全局变量，用于存储机器人客户端实例
 client = None
@@ -23,7 +26,7 @@ async def update_gang_leader():
         return
     
     # 更新帮主
-    new_leader = gang_service.update_gang_leader()
+    new_leader = await run_blocking(gang_service.update_gang_leader)
     
     if not new_leader:
         print("未能更新帮主，可能没有合适的帮主候选人")
@@ -31,7 +34,7 @@ async def update_gang_leader():
     
     # 获取所有授权的群组，并通知新帮主
     try:
-        groups = db_service.get_all_authorized_groups()
+        groups = config_registry.get_authorized_groups()
         
         username = new_leader['username']
         reward = new_leader['reward']
@@ -64,7 +67,7 @@ async def check_negative_points_users():
     
     try:
         # 获取所有需要踢出的负分用户
-        negative_users = admin_service.check_negative_points_users()
+        negative_users = await run_blocking(admin_service.check_negative_points_users)
         
         if negative_users:
             print(f"发现 {len(negative_users)} 名负分超过3天的用户，准备处理...")
@@ -76,7 +79,7 @@ async def check_negative_points_users():
             negative_since = user['first_negative_time']
             
             # 获取用户所在的群组
-            user_groups = db_service.get_user_groups(user_id)
+            user_groups = await async_db_service.get_user_groups(user_id)
             
             # 在数据库标记后再实际踢出用户
             for group in user_groups:
@@ -98,7 +101,7 @@ async def check_negative_points_users():
                         print(f"已踢出用户 {username}(ID:{user_id}) 从群组 {group_name}(ID:{group_id})")
                         
                         # 移除数据库中的用户-群组关联
-                        db_service.remove_user_from_group(user_id, group_id)
+                        await async_db_service.remove_user_from_group(user_id, group_id)
                         
                         # 发送通知
                         await client.send_message(
@@ -113,7 +116,7 @@ async def check_negative_points_users():
                     print(f"处理负分用户 {username} 时出错: {e}")
             
             # 移除负分记录
-            db_service.remove_negative_points_record(user_id)
+            await async_db_service.remove_negative_points_record(user_id)
     except Exception as e:
         print(f"检查负分用户失败: {e}")
 
@@ -125,22 +128,22 @@ async def check_duel_timeouts():
     
     try:
         # 获取所有超时的生死战
-        timeout_duels = db_service.get_timeout_duels()
+        timeout_duels = await async_db_service.get_timeout_duels()
         
         if timeout_duels:
             print(f"发现 {len(timeout_duels)} 场超时的生死战，准备处理...")
         
         for duel in timeout_duels:
             # 处理超时
-            is_timeout = game_service.check_duel_timeout(duel['id'])
+            is_timeout = await run_blocking(game_service.check_duel_timeout, duel['id'])
             
             if is_timeout:
                 print(f"生死战 {duel['id']} 已超时处理完成")
                 # 构建消息
                 if duel['status'] == 'waiting':
                     # 等待接受超时
-                    challenger = db_service.get_user(duel['challenger_id'])
-                    challenged = db_service.get_user(duel['challenged_id'])
+                    challenger = await async_db_service.get_user(duel['challenger_id'])
+                    challenged = await async_db_service.get_user(duel['challenged_id'])
                     challenger_name = challenger['username'] if challenger and challenger['username'] else f"用户{duel['challenger_id']}"
                     challenged_name = challenged['username'] if challenged and challenged['username'] else f"用户{duel['challenged_id']}"
                     
@@ -156,13 +159,13 @@ async def check_duel_timeouts():
                     winner_id = duel['challenged_id'] if current_turn_id == duel['challenger_id'] else duel['challenger_id']
                     
                     # 获取用户信息
-                    loser = db_service.get_user(current_turn_id)
-                    winner = db_service.get_user(winner_id)
+                    loser = await async_db_service.get_user(current_turn_id)
+                    winner = await async_db_service.get_user(winner_id)
                     loser_name = loser['username'] if loser and loser['username'] else f"用户{current_turn_id}"
                     winner_name = winner['username'] if winner and winner['username'] else f"用户{winner_id}"
                     
                     # 获取胜者资源信息
-                    winner_cultivation = db_service.get_cultivation(winner_id)
+                    winner_cultivation = await async_db_service.get_cultivation(winner_id)
                     winner_points = winner['points']
                     winner_pills = winner_cultivation['pills'] if winner_cultivation else 0
                     
@@ -192,7 +195,7 @@ async def restore_pending_catgirls():
     
     try:
         # 获取所有等待确认的猫娘记录
-        pending_records = db_service.get_all_pending_catgirls()
+        pending_records = await async_db_service.get_all_pending_catgirls()
         
         if pending_records:
             print(f"发现 {len(pending_records)} 个正在等待确认的猫娘记录，正在恢复...")
@@ -208,11 +211,8 @@ async def restore_pending_catgirls():
             
             print(f"正在恢复用户 {user_name}(ID:{user_id}) 在群组 {group_id} 的猫娘确认状态")
             
-            # 添加消息处理器，高优先级(1)确保在其他处理器之前执行
-            client.add_handler(MessageHandler(
-                handle_catgirl_confirmation,
-                filters.chat(group_id) & filters.user(user_id)
-            ), group=1)
+            # 恢复等待确认的对话
+            conversation_router.set(group_id, user_id, 'catgirl', handle_catgirl_confirmation)
             
             # 发送提醒消息
             try:
@@ -235,7 +235,7 @@ async def restore_confirmed_catgirls():
     
     try:
         # 获取所有已确认的猫娘记录
-        confirmed_records = db_service.get_all_confirmed_catgirls()
+        confirmed_records = await async_db_service.get_all_confirmed_catgirls()
         
         if confirmed_records:
             print(f"发现 {len(confirmed_records)} 个已确认的猫娘记录，正在恢复...")
@@ -252,11 +252,8 @@ async def restore_confirmed_catgirls():
             
             print(f"正在恢复用户 {user_name}(ID:{user_id}) 在群组 {group_id} 的已确认猫娘状态")
             
-            # 添加消息过滤器，高优先级(1)确保在其他处理器之前执行
-            client.add_handler(MessageHandler(
-                handle_catgirl_messages,
-                filters.chat(group_id) & filters.user(user_id)
-            ), group=1)
+            # 恢复检查猫娘消息的对话
+            conversation_router.set(group_id, user_id, 'catgirl', handle_catgirl_messages)
             
             # 发送提醒消息
             try:
@@ -271,6 +268,20 @@ async def restore_confirmed_catgirls():
     except Exception as e:
         print(f"恢复已确认猫娘状态失败: {e}")
 
+async def reload_config_registry():
+    """定时重新加载热配置（获取其他进程对数据库的修改）"""
+    try:
+        await run_blocking(config_registry.reload)
+    except Exception as e:
+        print(f"重新加载配置失败: {e}")
+
+async def convert_compressed_books():
+    """定时把已有书库中的一批文本书籍转换为压缩存储"""
+    try:
+        await compression_service.convert_batch()
+    except Exception as e:
+        print(f"后台压缩书籍失败: {e}")
+
 # 启动时恢复大乐透状态
 async def restore_lottery_status(client):
     """从数据库恢复大乐透状态"""
@@ -280,19 +291,19 @@ async def restore_lottery_status(client):
         from bot.handlers.lottery_handlers import lottery_status, start_lottery
         
         # 恢复大乐透的中奖号码
-        numbers = lottery_service.get_current_numbers()
+        numbers = await run_blocking(lottery_service.get_current_numbers)
         if numbers:
             print(f"已从数据库恢复大乐透中奖号码: {numbers}")
         
         # 恢复大乐透的奖池金额
-        pool_info = lottery_service.get_lottery_pool()
+        pool_info = await run_blocking(lottery_service.get_lottery_pool)
         if pool_info:
             print(f"已从数据库恢复大乐透奖池金额: {pool_info['amount']}")
         else:
             print("没有找到大乐透奖池信息，使用默认值")
         
         # 恢复大乐透的公告消息ID
-        message_id = lottery_service.get_lottery_message_id()
+        message_id = await run_blocking(lottery_service.get_lottery_message_id)
         if message_id:
             lottery_status["announcement_message_id"] = message_id
             print(f"已从数据库恢复大乐透公告消息ID: {message_id}")
@@ -332,6 +343,20 @@ def setup_scheduler(app):
         minute=0
     )
     
+    # 添加重新加载热配置的定时任务
+    scheduler.add_job(
+        reload_config_registry,
+        'interval',
+        seconds=CONFIG_RELOAD_INTERVAL
+    )
+    
+    # 添加后台压缩书库的定时任务（未开启压缩存储时不做任何事）
+    scheduler.add_job(
+        convert_compressed_books,
+        'interval',
+        seconds=BOOK_COMPRESS_INTERVAL
+    )
+    
     # 立即检查一次生死战超时
     asyncio.create_task(check_duel_timeouts())
     
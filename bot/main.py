@@ -14,6 +14,15 @@ from bot.handlers.callback_handlers import register_callback_handlers
 from bot.handlers.scheduler_handlers import setup_scheduler
 from bot.handlers.book_handlers import register_book_handlers
 from bot.handlers.lottery_handlers import register_lottery_handlers
+from bot.services.async_db_service import async_db_service
+from bot.services.write_behind import points_buffer, event_counter_buffer
+from bot.services.download_scheduler import download_scheduler
+from bot.services.fingerprint_service import fingerprint_service
+from bot.services.metadata_service import metadata_service
+from bot.services.catalog_index import catalog_index
+from bot.services.config_registry import config_registry
+from bot.services.daily_state_service import daily_state_service
+from bot.utils.helpers import run_blocking
 
 # 配置日志
 logging.basicConfig(
@@ -93,6 +102,33 @@ async def main():
     # 打印启动信息
     logger.info("机器人正在启动...")
     
+    # 创建异步数据库连接池
+    await async_db_service.init_pool()
+    
+    # 加载授权群组、管理员和大乐透状态到内存
+    await run_blocking(config_registry.reload)
+    
+    # 加载地仙用户和今日欢迎记录
+    await daily_state_service.load()
+    
+    # 加载书籍指纹，建立近似重复检测索引
+    await fingerprint_service.load()
+    
+    # 扫描精品书库，建立常驻内存的目录索引
+    await catalog_index.load()
+    catalog_index.start()
+    
+    # 启动积分和奇遇计数写回缓冲
+    points_buffer.start()
+    event_counter_buffer.start()
+    
+    # 启动书籍下载调度器
+    download_scheduler.start()
+    
+    # 启动书籍元数据提取，并补充提取还没有元数据的精品书籍
+    metadata_service.start()
+    asyncio.create_task(metadata_service.scan_premium_books())
+    
     # 启动机器人
     await app.start()
     
@@ -124,8 +160,17 @@ async def main():
         # 捕获Ctrl+C
         pass
     finally:
-        # 关闭机器人
+        # 停止下载调度器、指纹计算和元数据提取，然后关闭机器人
+        await download_scheduler.stop()
+        fingerprint_service.shutdown()
+        await metadata_service.stop()
+        await catalog_index.stop()
         await app.stop()
+        # 写入缓冲中剩余的积分和奇遇计数
+        await points_buffer.stop()
+        await event_counter_buffer.stop()
+        # 关闭异步数据库连接池
+        await async_db_service.close_pool()
         logger.info("机器人已关闭")
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+
+# 添加项目根目录到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from bot.services.db_service import db_service
+from bot.services.catalog_index import list_book_files, read_sidecar_book
+from bot.services.compression_service import original_path
+from bot.config.config import PREMIUM_BOOKS_DIR
+
+def import_premium_books(directory=PREMIUM_BOOKS_DIR, remove_info=False):
+    """把精品书库中旧版.info信息文件记录的书籍导入premium_books表，按上传时间先后分配编号"""
+    print(f"开始导入精品书籍: {directory}")
+
+    books = []
+    failed = 0
+    for path in list_book_files(directory).values():
+        try:
+            books.append((read_sidecar_book(path), path))
+        except Exception as e:
+            print(f"读取书籍 {path} 时出错: {e}")
+            failed += 1
+    books.sort(key=lambda item: item[0]['uploaded_at'])
+    print(f"找到 {len(books)} 本书籍")
+    if not books:
+        return
+
+    connection = db_service.get_connection()
+    try:
+        # 已导入的存储文件名保持原编号，重新运行不会重复导入
+        with connection.cursor() as cursor:
+            cursor.executemany("""
+                INSERT IGNORE INTO premium_books (original_name, stored_name, file_size, uploader_id, uploaded_at, md5)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, [
+                (book['original_name'][:255], book['stored_name'], book['file_size'],
+                 book['uploader_id'], book['uploaded_at'], book['md5'])
+                for book, _ in books
+            ])
+            imported = cursor.rowcount
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print(f"导入精品书籍失败: {e}")
+        return
+    finally:
+        connection.close()
+
+    print(f"导入完成：新增 {imported} 本，已存在 {len(books) - imported} 本，读取失败 {failed} 本")
+
+    # 信息已保存到表中，按需删除旧的信息文件
+    if remove_info:
+        removed = 0
+        for _, path in books:
+            info_file = os.path.splitext(original_path(path))[0] + '.info'
+            if os.path.exists(info_file):
+                os.remove(info_file)
+                removed += 1
+        print(f"已删除 {removed} 个.info信息文件")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把精品书籍的.info信息文件导入premium_books表")
+    parser.add_argument("directory", nargs="?", default=PREMIUM_BOOKS_DIR, help="精品书籍目录")
+    parser.add_argument("--remove-info", action="store_true", help="导入成功后删除.info信息文件")
+    args = parser.parse_args()
+
+    import_premium_books(args.directory, args.remove_info)
@@ -0,0 +1,187 @@
+import argparse
+import gzip
+import hashlib
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 添加项目根目录到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from bot.config.config import BOOK_DOWNLOAD_PATH, ALLOWED_EXTENSIONS, PREMIUM_BOOKS_DIR
+
+# 超过该大小的文件用mmap计算MD5，避免逐块read的拷贝
+MMAP_THRESHOLD = 8 * 1024 * 1024
+# 补录的文件记在系统用户名下
+SYSTEM_USER_ID = 0
+
+def hash_file(path, compressed=False):
+    """计算文件MD5（在子进程中执行），返回(路径, MD5, 文件大小, 错误信息)
+
+    压缩存储的文件计算解压后内容的MD5和大小，与上传时记录的一致。
+    """
+    try:
+        md5_hash = hashlib.md5()
+        if compressed:
+            size = 0
+            with gzip.open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    md5_hash.update(block)
+                    size += len(block)
+            return path, md5_hash.hexdigest(), size, None
+
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            if size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    md5_hash.update(mm)
+            else:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    md5_hash.update(block)
+        return path, md5_hash.hexdigest(), size, None
+    except Exception as e:
+        return path, None, 0, str(e)
+
+def walk_books(directories):
+    """遍历目录下的所有书籍文件（包括压缩存储的书籍，如 xxx.txt.gz）"""
+    from bot.services.compression_service import original_path
+
+    for directory in directories:
+        if not os.path.isdir(directory):
+            print(f"目录不存在，跳过: {directory}")
+            continue
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(original_path(name))[1].lower() in ALLOWED_EXTENSIONS:
+                    yield os.path.abspath(os.path.join(root, name))
+
+def load_checkpoint(checkpoint_path):
+    """读取已处理过的文件路径"""
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, encoding="utf-8") as f:
+        return set(line.rstrip("\n") for line in f if line.strip())
+
+def load_compressed_md5(connection):
+    """读取压缩时记录的原始MD5和大小，返回{压缩文件绝对路径: (MD5, 原始大小)}"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT path, original_md5, original_size FROM compressed_files")
+        return {os.path.abspath(path): (md5, size) for path, md5, size in cursor.fetchall()}
+
+def flush_batch(connection, batch, checkpoint_file):
+    """批量写入一批文件记录，成功后记录检查点，返回新收录的文件数"""
+    from bot.services.compression_service import original_path
+
+    with connection.cursor() as cursor:
+        inserted = cursor.executemany("""
+            INSERT IGNORE INTO files (md5, user_id)
+            VALUES (%s, %s)
+        """, [(md5, SYSTEM_USER_ID) for _, md5, _ in batch])
+        cursor.executemany("""
+            INSERT IGNORE INTO book_files (md5, file_name, file_ext, file_size, user_id)
+            VALUES (%s, %s, %s, %s, NULL)
+        """, [
+            (md5, os.path.basename(original_path(path))[:255], os.path.splitext(original_path(path))[1].lower(), size)
+            for path, md5, size in batch
+        ])
+    connection.commit()
+
+    # 写库成功后才记录检查点，中断后重新运行不会漏掉文件
+    checkpoint_file.write("".join(f"{path}\n" for path, _, _ in batch))
+    checkpoint_file.flush()
+    return inserted or 0
+
+def index_books(directories, workers, batch_size, checkpoint_path):
+    """多进程计算已有书库的MD5并补录到files表"""
+    from bot.services.db_service import db_service
+    from bot.services.compression_service import is_compressed
+
+    done = load_checkpoint(checkpoint_path)
+    paths = [path for path in walk_books(directories) if path not in done]
+    print(f"找到 {len(paths)} 个待处理的文件（检查点中已处理 {len(done)} 个）")
+    if not paths:
+        return
+
+    connection = db_service.get_connection()
+    try:
+        # 确保系统用户存在（files.user_id有外键约束）
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT IGNORE INTO users (user_id, username)
+                VALUES (%s, %s)
+            """, (SYSTEM_USER_ID, "system"))
+        connection.commit()
+
+        # 压缩存储的文件优先使用压缩时记录的原始MD5，不需要解压；没有记录的解压后计算
+        compressed_md5 = load_compressed_md5(connection)
+        recorded = [path for path in paths if path in compressed_md5]
+        to_hash = [path for path in paths if path not in compressed_md5]
+
+        start = time.monotonic()
+        processed = 0
+        inserted = 0
+        failed = 0
+        total_bytes = 0
+        batch = []
+
+        with open(checkpoint_path, "a", encoding="utf-8") as checkpoint_file, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            for path in recorded:
+                md5, size = compressed_md5[path]
+                processed += 1
+                batch.append((path, md5, size))
+                if len(batch) >= batch_size:
+                    inserted += flush_batch(connection, batch, checkpoint_file)
+                    batch = []
+
+            results = executor.map(hash_file, to_hash, [is_compressed(path) for path in to_hash], chunksize=16)
+            for path, md5, size, error in results:
+                processed += 1
+                if error:
+                    print(f"计算 {path} 的MD5失败: {error}")
+                    failed += 1
+                    continue
+
+                total_bytes += size
+                batch.append((path, md5, size))
+                if len(batch) >= batch_size:
+                    inserted += flush_batch(connection, batch, checkpoint_file)
+                    batch = []
+
+                    elapsed = time.monotonic() - start
+                    print(
+                        f"已处理 {processed}/{len(paths)} 个文件，新收录 {inserted} 个，"
+                        f"{processed / elapsed:.1f} 个/秒，{total_bytes / elapsed / 1048576:.1f} MB/秒"
+                    )
+
+            if batch:
+                inserted += flush_batch(connection, batch, checkpoint_file)
+
+        elapsed = max(time.monotonic() - start, 0.001)
+        print(
+            f"索引完成：处理 {processed} 个文件（{total_bytes / 1048576:.1f} MB），新收录 {inserted} 个，失败 {failed} 个，"
+            f"用时 {elapsed:.1f} 秒（{processed / elapsed:.1f} 个/秒，{total_bytes / elapsed / 1048576:.1f} MB/秒）"
+        )
+    except Exception as e:
+        print(f"索引过程中出现错误: {e}")
+        connection.rollback()
+        print("已写入的部分记录在检查点中，重新运行会从中断处继续")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把已有书库的文件MD5补录到files表，使判重覆盖整个书库")
+    parser.add_argument("directories", nargs="*", default=[BOOK_DOWNLOAD_PATH, PREMIUM_BOOKS_DIR],
+                        help="要索引的目录，默认为书库目录和精品书籍目录")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="计算MD5的进程数")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批写入数据库的记录数")
+    parser.add_argument("--checkpoint", default="index_books.checkpoint", help="检查点文件路径")
+    parser.add_argument("--reset", action="store_true", help="忽略检查点，重新处理所有文件")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    index_books(args.directories, args.workers, args.batch_size, args.checkpoint)
@@ -0,0 +1,83 @@
+import pymysql
+import sys
+import os
+
+# 添加项目根目录到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# 导入数据库配置
+from bot.services.db_service import db_service
+from bot.config.config import BOOK_DOWNLOAD_PATH, ALLOWED_EXTENSIONS
+from bot.utils.helpers import calculate_md5, get_book_storage_path
+
+def migrate_book_storage(base_dir=BOOK_DOWNLOAD_PATH):
+    """把书库根目录下平铺的书籍迁移到按MD5分片的存储路径，并记录文件名到book_files表"""
+    print(f"开始迁移书库: {base_dir}")
+
+    # 只处理根目录下的书籍文件，已分片的子目录和下载中的临时文件跳过
+    file_names = [
+        name for name in os.listdir(base_dir)
+        if os.path.isfile(os.path.join(base_dir, name))
+        and os.path.splitext(name)[1].lower() in ALLOWED_EXTENSIONS
+    ]
+    print(f"找到 {len(file_names)} 个待迁移的文件")
+    if not file_names:
+        return
+
+    while True:
+        answer = input("是否开始迁移？(yes/no): ").strip().lower()
+        if answer in ('yes', 'y'):
+            break
+        elif answer in ('no', 'n'):
+            print("已取消迁移")
+            return
+        else:
+            print("请输入yes或no")
+
+    moved = 0
+    duplicates = 0
+    failed = 0
+    connection = db_service.get_connection()
+
+    try:
+        for index, file_name in enumerate(file_names, 1):
+            source_path = os.path.join(base_dir, file_name)
+            file_ext = os.path.splitext(file_name)[1].lower()
+
+            try:
+                file_size = os.path.getsize(source_path)
+                file_md5 = calculate_md5(source_path)
+                target_path = get_book_storage_path(base_dir, file_md5, file_ext)
+
+                # 先记录文件名，再移动文件，中途中断后重新运行不会丢失记录
+                with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                    cursor.execute("SELECT user_id FROM files WHERE md5 = %s", (file_md5,))
+                    record = cursor.fetchone()
+                    cursor.execute("""
+                        INSERT IGNORE INTO book_files (md5, file_name, file_ext, file_size, user_id)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, (file_md5, file_name, file_ext, file_size, record['user_id'] if record else None))
+                connection.commit()
+
+                if os.path.exists(target_path):
+                    # 内容相同的文件已经迁移过，删除多余的副本
+                    os.remove(source_path)
+                    duplicates += 1
+                else:
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    os.replace(source_path, target_path)
+                    moved += 1
+            except Exception as e:
+                print(f"迁移文件 {file_name} 时出错: {e}")
+                connection.rollback()
+                failed += 1
+
+            if index % 500 == 0:
+                print(f"已处理 {index}/{len(file_names)} 个文件")
+
+        print(f"迁移完成：移动 {moved} 个，重复删除 {duplicates} 个，失败 {failed} 个")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    migrate_book_storage(sys.argv[1] if len(sys.argv) > 1 else BOOK_DOWNLOAD_PATH)
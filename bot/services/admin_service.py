@@ -2,76 +2,88 @@ import os
 import json
 from bot.config.config import INITIAL_ADMIN
 from bot.services.db_service import db_service
+from bot.services.config_registry import config_registry
 
 class AdminService:
     def __init__(self):
         self.db = db_service
-        self.admins = set(INITIAL_ADMIN)
         self.admin_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'admins.json')
-        self._load_admins()
+        config_registry.set_admins(self._load_admins())
+        # 定时重新加载时也从文件读取管理员列表
+        config_registry.register_loader('admins', lambda: frozenset(self._load_admins()))
     
     def _load_admins(self):
         """从文件加载管理员列表"""
+        admins = set(INITIAL_ADMIN)
+        
         # 确保data目录存在
         os.makedirs(os.path.dirname(self.admin_file), exist_ok=True)
         
         # 如果文件不存在，创建一个新的并保存初始管理员
         if not os.path.exists(self.admin_file):
-            self._save_admins()
-            return
+            self._save_admins(admins)
+            return admins
         
         # 尝试加载文件
         try:
             with open(self.admin_file, 'r') as f:
                 admin_data = json.load(f)
                 # 合并初始管理员和保存的管理员
-                self.admins = set(admin_data + INITIAL_ADMIN)
+                admins = set(admin_data + INITIAL_ADMIN)
         except (json.JSONDecodeError, FileNotFoundError) as e:
             print(f"加载管理员文件出错: {e}")
             # 保存初始管理员
-            self._save_admins()
+            self._save_admins(admins)
+        return admins
     
-    def _save_admins(self):
+    def _save_admins(self, admins):
         """保存管理员列表到文件"""
         try:
             with open(self.admin_file, 'w') as f:
-                json.dump(list(self.admins), f)
+                json.dump(list(admins), f)
         except Exception as e:
             print(f"保存管理员文件出错: {e}")
     
     def is_admin(self, user_id):
         """检查用户是否是管理员"""
-        return user_id in self.admins
+        return config_registry.is_admin(user_id)
     
     def add_admin(self, user_id):
         """添加新管理员"""
-        if user_id in self.admins:
+        if config_registry.is_admin(user_id):
             return False
         
-        self.admins.add(user_id)
-        self._save_admins()
+        admins = set(config_registry.get_admins())
+        admins.add(user_id)
+        self._save_admins(admins)
+        config_registry.set_admins(admins)
         return True
     
     def remove_admin(self, user_id):
         """移除管理员"""
-        if user_id not in self.admins:
+        if not config_registry.is_admin(user_id):
             return False
         
-        self.admins.remove(user_id)
-        self._save_admins()
+        admins = set(config_registry.get_admins())
+        admins.remove(user_id)
+        self._save_admins(admins)
+        config_registry.set_admins(admins)
         return True
     
     def get_admins(self):
         """获取所有管理员ID"""
-        return list(self.admins)
+        return config_registry.get_admins()
     
     def authorize_group(self, group_id, group_name):
         """授权群组使用机器人"""
-        return self.db.authorize_group(group_id, group_name)
+        result = self.db.authorize_group(group_id, group_name)
+        if result:
+            config_registry.add_authorized_group(group_id, group_name)
+        return result
     
     def is_group_authorized(self, group_id):
         """检查群组是否已授权"""
-        return self.db.is_group_authorized(group_id)
+        return config_registry.is_group_authorized(group_id)
     
     def update_user_points(self, user_id, points_change):
         """更新用户积分（管理员操作）"""
@@ -97,7 +109,7 @@ class AdminService:
             }
             
         # 检查群组是否已授权
-        if not self.db.is_group_authorized(group_id):
+        if not config_registry.is_group_authorized(group_id):
             return {
                 "success": False,
                 "message": f"群组 {group_id} 未授权"
@@ -36,8 +36,8 @@ class AIService:
                 username = first_name or last_name
         else:
             # 如果没有传入，则尝试从数据库获取
-            from bot.services.db_service import db_service
-            user = db_service.get_user(user_id) if user_id != 0 else None
+            from bot.services.async_db_service import async_db_service
+            user = await async_db_service.get_user(user_id) if user_id != 0 else None
             username = user['username'] if user and 'username' in user and user['username'] else "道友"
         
         # 构建系统提示，包含用户昵称
@@ -0,0 +1,683 @@
+import asyncio
+import functools
+from datetime import date
+import aiomysql
+import pymysql
+from bot.config.config import (
+    DB_CONFIG, CULTIVATION_STAGES, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_MAX_LIFETIME
+)
+from bot.utils.db_config_helper import get_async_pool_config
+from bot.services.db_service import (
+    db_service, PROFILE_QUERY, profile_upsert_statements, is_profile_complete, clean_profile
+)
+from bot.services.profile_cache import profile_cache
+
+class AsyncDBService:
+    """异步数据库服务
+
+    消息热路径上的方法基于aiomysql连接池原生实现；
+    其余方法自动转交同步的DBService在线程池中执行，保证所有方法都可以await且不阻塞事件循环。
+    同步的db_service仍供脚本使用。
+    """
+
+    def __init__(self):
+        self.config = DB_CONFIG
+        self.pool = None
+        self._pool_lock = None
+
+    async def init_pool(self):
+        """创建异步连接池（需要在事件循环中调用）"""
+        if self.pool is not None:
+            return self.pool
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await aiomysql.create_pool(
+                    minsize=DB_POOL_MIN_SIZE,
+                    maxsize=DB_POOL_MAX_SIZE,
+                    pool_recycle=DB_POOL_MAX_LIFETIME,
+                    **get_async_pool_config(self.config)
+                )
+                print("异步数据库连接池已创建")
+        return self.pool
+
+    async def close_pool(self):
+        """关闭异步连接池"""
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    def get_pool_stats(self):
+        """获取异步连接池统计信息"""
+        if self.pool is None:
+            return {'size': 0, 'free': 0, 'max_size': DB_POOL_MAX_SIZE}
+        return {
+            'size': self.pool.size,
+            'free': self.pool.freesize,
+            'max_size': self.pool.maxsize
+        }
+
+    async def _fetchone(self, query, params=None, dict_cursor=False):
+        """执行查询并返回一行"""
+        pool = await self.init_pool()
+        async with pool.acquire() as connection:
+            cursor_class = aiomysql.DictCursor if dict_cursor else aiomysql.Cursor
+            async with connection.cursor(cursor_class) as cursor:
+                await cursor.execute(query, params)
+                return await cursor.fetchone()
+
+    async def _fetchall(self, query, params=None, dict_cursor=False):
+        """执行查询并返回所有行"""
+        pool = await self.init_pool()
+        async with pool.acquire() as connection:
+            cursor_class = aiomysql.DictCursor if dict_cursor else aiomysql.Cursor
+            async with connection.cursor(cursor_class) as cursor:
+                await cursor.execute(query, params)
+                return await cursor.fetchall()
+
+    async def _execute(self, query, params=None):
+        """执行单条写入语句（自动提交），返回影响行数"""
+        pool = await self.init_pool()
+        async with pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                return cursor.rowcount
+
+    def __getattr__(self, name):
+        """没有原生异步实现的方法，转交同步DBService在线程池中执行"""
+        method = getattr(db_service, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(method, *args, **kwargs))
+
+        return wrapper
+
+    # ========== 用户管理 ==========
+    async def get_user(self, user_id):
+        """获取用户信息"""
+        cached = profile_cache.get_user(user_id)
+        if cached is not None:
+            return cached
+
+        token = profile_cache.begin_read()
+        user = await self._fetchone("""
+            SELECT * FROM users WHERE user_id = %s
+        """, (user_id,), dict_cursor=True)
+        if user:
+            profile_cache.put_user(user_id, user, token)
+        return user
+
+    async def create_user(self, user_id, username, first_name=None, last_name=None):
+        """创建新用户"""
+        # 如果username为None，使用默认值
+        if username is None:
+            username = "无名修士"
+
+        pool = await self.init_pool()
+        async with pool.acquire() as connection:
+            await connection.begin()
+            try:
+                async with connection.cursor() as cursor:
+                    for query, params in profile_upsert_statements(user_id, username, first_name, last_name):
+                        await cursor.execute(query, params)
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+            finally:
+                profile_cache.invalidate(user_id)
+
+    async def ensure_user_profile(self, user_id, username, first_name=None, last_name=None, update_names=False):
+        """确保用户的基本信息、修仙、事件、打劫记录都存在，返回用户信息和修仙信息合并后的一行
+
+        老用户只需一次联表查询；缺少记录时在同一个事务中补齐。
+        update_names为True时，如果昵称有变化则顺便更新。
+        """
+        # 如果username为None，使用默认值
+        if username is None:
+            username = "无名修士"
+
+        cached = profile_cache.get_profile(user_id)
+        if cached is not None and (not update_names or (cached['username'], cached['first_name'], cached['last_name']) == (username, first_name, last_name)):
+            return cached
+
+        token = profile_cache.begin_read()
+        pool = await self.init_pool()
+        async with pool.acquire() as connection:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(PROFILE_QUERY, (user_id,))
+                profile = await cursor.fetchone()
+
+                if not is_profile_complete(profile):
+                    # 在同一个事务中补齐缺失的记录
+                    await connection.begin()
+                    try:
+                        for query, params in profile_upsert_statements(user_id, username, first_name, last_name):
+                            await cursor.execute(query, params)
+                        await cursor.execute(PROFILE_QUERY, (user_id,))
+                        profile = await cursor.fetchone()
+                        await connection.commit()
+                    except Exception:
+                        await connection.rollback()
+                        raise
+                elif update_names and (profile['username'], profile['first_name'], profile['last_name']) != (username, first_name, last_name):
+                    await cursor.execute("""
+                        UPDATE users
+                        SET username = %s, first_name = %s, last_name = %s
+                        WHERE user_id = %s
+                    """, (username, first_name, last_name, user_id))
+                    # 改名很少发生，直接让缓存失效，本次不回填
+                    profile_cache.invalidate(user_id)
+                    profile.update(username=username, first_name=first_name, last_name=last_name)
+
+        profile = clean_profile(profile)
+        profile_cache.put_profile(user_id, profile, token)
+        return profile
+
+    async def update_username(self, user_id, username, first_name=None, last_name=None):
+        """更新用户名和姓名"""
+        # 如果username为None，使用默认值
+        if username is None:
+            username = "无名修士"
+
+        await self._execute("""
+            UPDATE users
+            SET username = %s, first_name = %s, last_name = %s
+            WHERE user_id = %s
+        """, (username, first_name, last_name, user_id))
+        profile_cache.patch_user(user_id, username=username, first_name=first_name, last_name=last_name)
+
+    async def add_user_to_group(self, user_id, group_id):
+        """添加用户到群组关联"""
+        await self._execute("""
+            INSERT IGNORE INTO user_group (user_id, group_id)
+            VALUES (%s, %s)
+        """, (user_id, group_id))
+
+    # ========== 群组管理 ==========
+    async def is_group_authorized(self, group_id):
+        """检查群组是否已授权"""
+        result = await self._fetchone("""
+            SELECT group_id FROM authorized_groups WHERE group_id = %s
+        """, (group_id,))
+        return result is not None
+
+    async def get_all_authorized_groups(self):
+        """获取所有授权的群组"""
+        return await self._fetchall("SELECT * FROM authorized_groups", dict_cursor=True)
+
+    # ========== 积分管理 ==========
+    async def update_points(self, user_id, points_change, max_retries=3):
+        """更新用户积分，返回更新后的积分"""
+        retries = 0
+        while True:
+            try:
+                pool = await self.init_pool()
+                async with pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        # 允许负积分
+                        await cursor.execute("""
+                            UPDATE users
+                            SET points = points + %s
+                            WHERE user_id = %s
+                        """, (points_change, user_id))
+                        profile_cache.add_points(user_id, points_change)
+
+                        # 获取更新后的积分
+                        await cursor.execute("SELECT points FROM users WHERE user_id = %s", (user_id,))
+                        result = await cursor.fetchone()
+                        new_points = result[0] if result else 0
+                break
+            except pymysql.err.OperationalError as e:
+                # 如果是锁等待超时，尝试重试
+                if e.args[0] == 1205:  # Lock wait timeout exceeded
+                    retries += 1
+                    if retries < max_retries:
+                        print(f"锁等待超时，正在重试 ({retries}/{max_retries})...")
+                        await asyncio.sleep(0.5)
+                        continue
+                    print("达到最大重试次数，操作失败")
+                raise
+
+        # 如果积分为负数，记录首次负分时间
+        if new_points < 0:
+            await self.record_negative_points(user_id)
+
+        return new_points
+
+    async def add_points_batch(self, deltas):
+        """用一条语句批量累加多个用户的积分，deltas为{用户ID: 增量}"""
+        if not deltas:
+            return 0
+        user_ids = list(deltas)
+        cases = " ".join(["WHEN %s THEN %s"] * len(user_ids))
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        params = [value for user_id in user_ids for value in (user_id, deltas[user_id])]
+        params.extend(user_ids)
+        updated = await self._execute(f"""
+            UPDATE users
+            SET points = points + CASE user_id {cases} ELSE 0 END
+            WHERE user_id IN ({placeholders})
+        """, params)
+        for user_id, delta in deltas.items():
+            profile_cache.add_points(user_id, delta)
+        return updated
+
+    async def record_negative_points(self, user_id):
+        """记录用户积分首次变为负数的时间"""
+        try:
+            inserted = await self._execute("""
+                INSERT IGNORE INTO negative_points_records (user_id, first_negative_time)
+                VALUES (%s, CURRENT_TIMESTAMP)
+            """, (user_id,))
+            if inserted:
+                print(f"用户 {user_id} 积分首次变为负数，已记录时间")
+        except Exception as e:
+            print(f"记录负分时间出错: {e}")
+
+    async def get_user_points(self, user_id):
+        """获取用户积分"""
+        user = await self.get_user(user_id)
+        return user['points'] if user else 0
+
+    # ========== 修仙系统 ==========
+    async def get_cultivation(self, user_id):
+        """获取用户修仙信息"""
+        cached = profile_cache.get_cultivation(user_id)
+        if cached is not None:
+            return cached
+
+        token = profile_cache.begin_read()
+        cultivation = await self._fetchone("""
+            SELECT * FROM user_cultivation
+            WHERE user_id = %s
+        """, (user_id,), dict_cursor=True)
+        if cultivation:
+            profile_cache.put_cultivation(user_id, cultivation, token)
+        return cultivation
+
+    async def initialize_user_cultivation(self, user_id):
+        """初始化用户修仙信息"""
+        try:
+            inserted = await self._execute("""
+                INSERT IGNORE INTO user_cultivation (user_id, stage, pills, next_cost)
+                VALUES (%s, 0, 0, 200)
+            """, (user_id,))
+            if inserted:
+                profile_cache.invalidate(user_id, user=False)
+                print(f"已为用户 {user_id} 初始化修仙信息")
+            return True
+        except Exception as e:
+            print(f"初始化用户修仙信息出错: {e}")
+            return False
+
+    async def is_immortal(self, user_id):
+        """检查用户是否为地仙"""
+        try:
+            cultivation = await self.get_cultivation(user_id)
+            if not cultivation:
+                return False
+            # 检查是否已达到地仙境界
+            return cultivation['stage'] >= len(CULTIVATION_STAGES)
+        except Exception as e:
+            print(f"检查用户是否为地仙出错: {e}")
+            return False
+
+    async def get_immortal_user_ids(self):
+        """获取所有地仙用户ID"""
+        rows = await self._fetchall("""
+            SELECT user_id FROM user_cultivation
+            WHERE stage >= %s
+        """, (len(CULTIVATION_STAGES),))
+        return [row[0] for row in rows]
+
+    async def get_greeted_immortals(self, day):
+        """获取某天已经被欢迎过的地仙用户ID"""
+        rows = await self._fetchall("""
+            SELECT user_id FROM immortal_daily_chat
+            WHERE date = %s AND has_greeted = TRUE
+        """, (day,))
+        return [row[0] for row in rows]
+
+    async def mark_immortal_greeted(self, user_id, day=None):
+        """标记地仙用户某天（默认今天）已经被欢迎过"""
+        try:
+            await self._execute("""
+                INSERT INTO immortal_daily_chat (user_id, date, has_greeted)
+                VALUES (%s, %s, TRUE)
+                ON DUPLICATE KEY UPDATE has_greeted = TRUE
+            """, (user_id, day or date.today()))
+            return True
+        except Exception as e:
+            print(f"标记地仙欢迎状态出错: {e}")
+            return False
+
+    async def get_ascension_task(self, user_id):
+        """获取用户飞升任务状态"""
+        return await self._fetchone("""
+            SELECT * FROM ascension_tasks
+            WHERE user_id = %s
+        """, (user_id,), dict_cursor=True)
+
+    # ========== 奇遇系统 ==========
+    async def add_event_counts_batch(self, counts):
+        """批量累加用户事件计数，counts为{用户ID: (次数, 最后触发时间)}"""
+        if not counts:
+            return 0
+        placeholders = ", ".join(["(%s, %s, %s)"] * len(counts))
+        params = [value for user_id, (count, last_trigger) in counts.items() for value in (user_id, last_trigger, count)]
+        # IGNORE：个别用户记录不存在（外键失败）时跳过，不影响整批写入
+        return await self._execute(f"""
+            INSERT IGNORE INTO user_events (user_id, last_trigger, event_count)
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE
+                event_count = event_count + VALUES(event_count),
+                last_trigger = GREATEST(last_trigger, VALUES(last_trigger))
+        """, params)
+
+    # ========== 文件管理 ==========
+    async def check_file_exists(self, md5):
+        """检查文件MD5是否已存在"""
+        result = await self._fetchone("SELECT md5 FROM files WHERE md5 = %s", (md5,))
+        return result is not None
+
+    async def add_file_record(self, md5, user_id):
+        """添加文件记录"""
+        try:
+            await self._execute("""
+                INSERT INTO files (md5, user_id)
+                VALUES (%s, %s)
+            """, (md5, user_id))
+            return True
+        except Exception as e:
+            print(f"添加文件记录失败: {e}")
+            return False
+
+    async def add_book_file(self, md5, file_name, file_ext, file_size, user_id=None):
+        """记录书籍文件名与MD5的对应关系（同一本书的不同文件名都会记录）"""
+        try:
+            await self._execute("""
+                INSERT IGNORE INTO book_files (md5, file_name, file_ext, file_size, user_id)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (md5, file_name, file_ext, file_size, user_id))
+            return True
+        except Exception as e:
+            print(f"添加书籍文件名记录失败: {e}")
+            return False
+
+    async def get_file_md5(self, file_unique_id):
+        """通过Telegram的file_unique_id查询已收录文件的MD5，未收录返回None"""
+        result = await self._fetchone(
+            "SELECT md5 FROM file_index WHERE file_unique_id = %s", (file_unique_id,)
+        )
+        return result[0] if result else None
+
+    async def add_file_index(self, file_unique_id, md5):
+        """记录file_unique_id对应的MD5"""
+        try:
+            await self._execute("""
+                INSERT IGNORE INTO file_index (file_unique_id, md5)
+                VALUES (%s, %s)
+            """, (file_unique_id, md5))
+            return True
+        except Exception as e:
+            print(f"添加文件索引失败: {e}")
+            return False
+
+    async def get_book_fingerprints(self):
+        """获取所有书籍的指纹签名，返回[(MD5, 签名)]"""
+        return await self._fetchall("SELECT md5, signature FROM book_fingerprints")
+
+    async def add_book_fingerprint(self, md5, signature):
+        """保存书籍的指纹签名"""
+        try:
+            await self._execute("""
+                INSERT IGNORE INTO book_fingerprints (md5, signature)
+                VALUES (%s, %s)
+            """, (md5, signature))
+            return True
+        except Exception as e:
+            print(f"保存书籍指纹失败: {e}")
+            return False
+
+    async def add_compressed_file(self, path, original_md5, original_size, compressed_size):
+        """记录压缩存储的文件及其原始大小和MD5"""
+        try:
+            await self._execute("""
+                INSERT INTO compressed_files (path, original_md5, original_size, compressed_size)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    original_md5 = VALUES(original_md5),
+                    original_size = VALUES(original_size),
+                    compressed_size = VALUES(compressed_size)
+            """, (path, original_md5, original_size, compressed_size))
+            return True
+        except Exception as e:
+            print(f"记录压缩文件失败: {e}")
+            return False
+
+    async def add_book_metadata(self, metadata):
+        """保存书籍元数据"""
+        await self._execute("""
+            INSERT INTO book_metadata (md5, encoding, word_count, chapter_count, title, author, preview)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                encoding = VALUES(encoding),
+                word_count = VALUES(word_count),
+                chapter_count = VALUES(chapter_count),
+                title = VALUES(title),
+                author = VALUES(author),
+                preview = VALUES(preview),
+                extracted_at = CURRENT_TIMESTAMP
+        """, (
+            metadata['md5'], metadata['encoding'], metadata['word_count'], metadata['chapter_count'],
+            (metadata['title'] or '')[:255] or None, (metadata['author'] or '')[:255] or None, metadata['preview']
+        ))
+
+    async def get_book_metadata(self, md5_list):
+        """批量获取书籍元数据，返回{MD5: 元数据}"""
+        if not md5_list:
+            return {}
+        placeholders = ", ".join(["%s"] * len(md5_list))
+        rows = await self._fetchall(
+            f"SELECT * FROM book_metadata WHERE md5 IN ({placeholders})", list(md5_list), dict_cursor=True
+        )
+        return {row['md5']: row for row in rows}
+
+    async def get_book_metadata_md5s(self):
+        """获取已提取元数据的所有MD5"""
+        rows = await self._fetchall("SELECT md5 FROM book_metadata")
+        return [row[0] for row in rows]
+
+    async def get_premium_books(self):
+        """获取所有精品书籍"""
+        return await self._fetchall("""
+            SELECT id, original_name, stored_name, file_size, uploader_id, uploaded_at, md5, tg_file_id
+            FROM premium_books
+            ORDER BY id
+        """, dict_cursor=True)
+
+    async def add_premium_book(self, original_name, stored_name, file_size, uploader_id, uploaded_at, md5=None, file_id=None, overwrite=True):
+        """添加精品书籍，返回书籍编号
+
+        同一存储文件名已存在时保留原编号；overwrite为True时用新的信息覆盖原记录，否则保留原记录。
+        """
+        update = """
+            ON DUPLICATE KEY UPDATE
+                original_name = VALUES(original_name),
+                file_size = VALUES(file_size),
+                uploader_id = VALUES(uploader_id),
+                uploaded_at = VALUES(uploaded_at),
+                tg_file_id = VALUES(tg_file_id)
+        """ if overwrite else ""
+        await self._execute(f"""
+            INSERT {'' if overwrite else 'IGNORE '}INTO premium_books (original_name, stored_name, file_size, uploader_id, uploaded_at, md5, tg_file_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            {update}
+        """, (original_name[:255], stored_name, file_size, uploader_id, uploaded_at, md5, file_id))
+        row = await self._fetchone("SELECT id FROM premium_books WHERE stored_name = %s", (stored_name,))
+        return row[0]
+
+    async def set_premium_book_md5(self, book_id, md5):
+        """记录精品书籍的MD5（由后台元数据提取写入）"""
+        await self._execute("UPDATE premium_books SET md5 = %s WHERE id = %s", (md5, book_id))
+
+    async def set_premium_book_file_id(self, book_id, file_id):
+        """记录精品书籍在Telegram的file_id（file_id失效时传入None清除）"""
+        await self._execute("UPDATE premium_books SET tg_file_id = %s WHERE id = %s", (file_id, book_id))
+
+    async def add_books_batch(self, user_id, books, reward):
+        """在一个事务中收录一批书籍并发放奖励
+
+        books为[{'md5', 'file_name', 'file_ext', 'file_size', 'file_unique_id'}]，
+        已被其他上传抢先收录的MD5算作重复。返回收录结果。
+        """
+        today = date.today()
+        result = {
+            'accepted': 0,
+            'duplicates': 0,
+            'new_points': None,
+            'books_uploaded': 0,
+            'shared_books': None
+        }
+        pool = await self.init_pool()
+        async with pool.acquire() as connection:
+            await connection.begin()
+            try:
+                async with connection.cursor() as cursor:
+                    for book in books:
+                        # 逐条插入，根据影响行数判断这本书是否由本批次首次收录
+                        await cursor.execute("""
+                            INSERT IGNORE INTO files (md5, user_id)
+                            VALUES (%s, %s)
+                        """, (book['md5'], user_id))
+                        is_new = cursor.rowcount > 0
+                        await cursor.execute("""
+                            INSERT IGNORE INTO book_files (md5, file_name, file_ext, file_size, user_id)
+                            VALUES (%s, %s, %s, %s, %s)
+                        """, (book['md5'], book['file_name'], book['file_ext'], book['file_size'], user_id if is_new else None))
+                        if book.get('file_unique_id'):
+                            await cursor.execute("""
+                                INSERT IGNORE INTO file_index (file_unique_id, md5)
+                                VALUES (%s, %s)
+                            """, (book['file_unique_id'], book['md5']))
+                        if is_new:
+                            result['accepted'] += 1
+                        else:
+                            result['duplicates'] += 1
+
+                    accepted = result['accepted']
+                    if accepted:
+                        # 奖励灵石
+                        await cursor.execute("""
+                            UPDATE users
+                            SET points = points + %s, total_books_uploaded = total_books_uploaded + %s
+                            WHERE user_id = %s
+                        """, (reward * accepted, accepted, user_id))
+
+                        # 更新今日上传记录，达到10本激活保护罩
+                        await cursor.execute("""
+                            INSERT INTO shield_records (user_id, date, books_uploaded, shield_active)
+                            VALUES (%s, %s, %s, %s >= 10)
+                            ON DUPLICATE KEY UPDATE
+                                books_uploaded = books_uploaded + VALUES(books_uploaded),
+                                shield_active = shield_active OR books_uploaded >= 10
+                        """, (user_id, today, accepted, accepted))
+
+                        # 飞升任务第三阶段累计分享书籍
+                        await cursor.execute("""
+                            UPDATE ascension_tasks
+                            SET shared_books = shared_books + %s
+                            WHERE user_id = %s AND current_stage = 3
+                        """, (accepted, user_id))
+                        if cursor.rowcount:
+                            await cursor.execute(
+                                "SELECT shared_books FROM ascension_tasks WHERE user_id = %s", (user_id,)
+                            )
+                            result['shared_books'] = (await cursor.fetchone())[0]
+
+                    await cursor.execute("SELECT points FROM users WHERE user_id = %s", (user_id,))
+                    row = await cursor.fetchone()
+                    result['new_points'] = row[0] if row else 0
+                    await cursor.execute("""
+                        SELECT books_uploaded FROM shield_records
+                        WHERE user_id = %s AND date = %s
+                    """, (user_id, today))
+                    row = await cursor.fetchone()
+                    result['books_uploaded'] = row[0] if row else 0
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+        if result['accepted']:
+            profile_cache.invalidate(user_id, cultivation=False)
+        return result
+
+    async def update_book_upload_count(self, user_id, increment=1):
+        """更新用户当天上传书籍数量，如果达到10本则激活保护罩"""
+        today = date.today()
+        try:
+            pool = await self.init_pool()
+            async with pool.acquire() as connection:
+                await connection.begin()
+                try:
+                    async with connection.cursor() as cursor:
+                        # 更新今日上传记录
+                        await cursor.execute("""
+                            INSERT INTO shield_records (user_id, date, books_uploaded, shield_active)
+                            VALUES (%s, %s, %s, FALSE)
+                            ON DUPLICATE KEY UPDATE books_uploaded = books_uploaded + VALUES(books_uploaded)
+                        """, (user_id, today, increment))
+
+                        # 获取更新后的记录
+                        await cursor.execute("""
+                            SELECT books_uploaded FROM shield_records
+                            WHERE user_id = %s AND date = %s
+                        """, (user_id, today))
+                        updated_record = await cursor.fetchone()
+                        books_uploaded = updated_record[0] if updated_record else 0
+
+                        # 如果达到10本，激活保护罩
+                        if books_uploaded >= 10:
+                            await cursor.execute("""
+                                UPDATE shield_records
+                                SET shield_active = TRUE
+                                WHERE user_id = %s AND date = %s
+                            """, (user_id, today))
+
+                        # 更新用户总上传书籍数量
+                        await cursor.execute("""
+                            UPDATE users
+                            SET total_books_uploaded = total_books_uploaded + %s
+                            WHERE user_id = %s
+                        """, (increment, user_id))
+                    await connection.commit()
+                except Exception:
+                    await connection.rollback()
+                    raise
+            profile_cache.invalidate(user_id, cultivation=False)
+            return books_uploaded
+        except Exception as e:
+            print(f"更新书籍上传数量出错: {e}")
+            return 0
+
+    # ========== 猫娘系统 ==========
+    async def get_catgirl_record(self, user_id, group_id):
+        """获取猫娘记录"""
+        try:
+            return await self._fetchone("""
+                SELECT * FROM catgirl_records
+                WHERE user_id = %s AND group_id = %s
+            """, (user_id, group_id), dict_cursor=True)
+        except Exception as e:
+            print(f"获取猫娘记录失败: {e}")
+            return None
+
+# 创建全局异步数据库服务实例
+async_db_service = AsyncDBService()
@@ -1,18 +1,34 @@
 import os
+import time
+import uuid
+import hashlib
 from bot.config.config import BOOK_DOWNLOAD_PATH, BOOK_POINT_REWARD, ALLOWED_EXTENSIONS
-from bot.services.db_service import db_service
-from bot.utils.helpers import calculate_md5, ensure_dir
+from bot.services.async_db_service import async_db_service
+from bot.services.fingerprint_service import fingerprint_service
+from bot.services.compression_service import compression_service
+from bot.services.metadata_service import metadata_service
+from bot.utils.helpers import ensure_dir, get_book_storage_path
 import pyrogram
 import asyncio
 
 class BookService:
     def __init__(self):
-        self.db = db_service
+        self.db = async_db_service
         # 确保下载目录存在
         ensure_dir(BOOK_DOWNLOAD_PATH)
+        self.stats = {
+            'files_hashed': 0,  # 流式下载并计算哈希的文件数
+            'bytes_hashed': 0,
+            'hash_seconds': 0.0,
+            'duplicates': 0,  # 下载后才发现重复的文件数
+            'duplicate_bytes': 0,
+            'index_hits': 0,  # 通过file_unique_id索引直接跳过的文件数
+            'index_skipped_bytes': 0,
+            'failures': 0
+        }
     
-    async def process_book_file(self, file_id, file_name, user_id, client):
-        """处理书籍文件下载"""
+    async def download_book_file(self, file_id, file_name, client, file_unique_id=None):
+        """下载书籍文件并判重，新书保存到存储路径，数据库记录和奖励由commit_books统一处理"""
         # 检查文件类型是否允许
         file_ext = os.path.splitext(file_name)[1].lower()
         if file_ext not in ALLOWED_EXTENSIONS:
@@ -21,82 +37,80 @@ class BookService:
                 'message': f"不支持的文件类型: {file_ext}，只允许 {', '.join(ALLOWED_EXTENSIONS)}"
             }
         
-        # 构建保存路径
-        save_path = os.path.join(BOOK_DOWNLOAD_PATH, file_name)
+        # 先下载到临时文件，确认收录后再原子重命名到按MD5分片的存储路径
+        temp_path = os.path.join(BOOK_DOWNLOAD_PATH, f".{uuid.uuid4().hex}.part")
         
         try:
-            # 下载文件，添加洪水控制异常处理
-            max_retries = 3
-            retry_count = 0
-            download_success = False
-            
-            while not download_success and retry_count < max_retries:
-                try:
-                    await client.download_media(file_id, save_path)
-                    download_success = True
-                except pyrogram.errors.exceptions.flood_420.FloodWait as e:
-                    print(f"FloodWait: 需要等待 {e.value} 秒下载文件: {file_name}")
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        # 减少等待时间，但不低于1秒
-                        adjusted_wait = max(1, e.value // 2)
-                        await asyncio.sleep(adjusted_wait)
-                    else:
-                        raise Exception(f"达到最大重试次数，无法下载文件: {file_name}")
-            
-            if not download_success:
-                return {
-                    'success': False,
-                    'message': "文件下载失败，请稍后重试"
-                }
-            
-            # 计算MD5
-            file_md5 = calculate_md5(save_path)
+            # 边下载边计算MD5，不需要再读一遍文件
+            file_md5, file_size = await self._stream_to_file(client, file_id, file_name, temp_path)
             
             # 检查文件是否已存在（通过MD5值）
-            exists = self.db.check_file_exists(file_md5)
+            exists = await self.db.check_file_exists(file_md5)
             
             if exists:
-                # 文件已存在，删除刚下载的副本
-                os.remove(save_path)
+                # 文件已存在，丢弃临时文件
+                os.remove(temp_path)
+                self.stats['duplicates'] += 1
+                self.stats['duplicate_bytes'] += file_size
+                # 记录索引，同一个文件再次上传时无需下载
+                if file_unique_id:
+                    await self.db.add_file_index(file_unique_id, file_md5)
+                await self.db.add_book_file(file_md5, file_name, file_ext, file_size)
                 return {
                     'success': True,
                     'is_duplicate': True,
                     'message': f"文件 {file_name} 已经存在，跳过奖励"
                 }
             
-            # 添加文件记录到数据库
-            self.db.add_file_record(file_md5, user_id)
+            # 检查是否与已收录的书籍内容高度相似（换编码、重新排版、加广告等）
+            signature = await fingerprint_service.compute(temp_path, file_ext)
+            similar = fingerprint_service.find_similar(signature)
+            if similar:
+                similar_md5, similarity = similar
+                os.remove(temp_path)
+                self.stats['duplicates'] += 1
+                self.stats['duplicate_bytes'] += file_size
+                # 索引到相似的书籍，同一个文件再次上传时无需下载（相似的书籍所在批次还未提交时不索引）
+                if file_unique_id and not fingerprint_service.is_pending(similar_md5):
+                    await self.db.add_file_index(file_unique_id, similar_md5)
+                return {
+                    'success': True,
+                    'is_duplicate': True,
+                    'message': f"文件 {file_name} 与已收录的书籍高度相似（相似度 {similarity:.0%}），跳过奖励"
+                }
+            
+            # 同名的不同书籍不会互相覆盖，同一目录下的文件数也不会无限增长
+            save_path = get_book_storage_path(BOOK_DOWNLOAD_PATH, file_md5, file_ext)
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            os.replace(temp_path, save_path)
             
-            # 给用户加积分
-            new_points = self.db.update_points(user_id, BOOK_POINT_REWARD)
+            # 立即加入内存索引，同一批上传中的近似副本也能被识别，签名在批次提交后保存
+            fingerprint_service.add(file_md5, signature)
             
-            # 更新书籍上传计数并检查是否激活保护罩
-            books_uploaded = self.db.update_book_upload_count(user_id)
-            shield_activated = books_uploaded >= 10
+            # 开启压缩存储时压缩保存，批次提交后在后台提取元数据
+            save_path = await compression_service.compress(save_path)
             
-            result = {
+            return {
                 'success': True,
                 'is_duplicate': False,
                 'message': f"成功保存书籍 {file_name}",
-                'reward': BOOK_POINT_REWARD,
-                'new_points': new_points,
-                'books_uploaded': books_uploaded
+                'book': {
+                    'md5': file_md5,
+                    'file_name': file_name,
+                    'file_ext': file_ext,
+                    'file_size': file_size,
+                    'file_unique_id': file_unique_id,
+                    'path': save_path
+                }
             }
             
-            # 如果刚刚达到10本书并激活保护罩，添加提示信息
-            if shield_activated and books_uploaded == 10:
-                result['shield_activated'] = True
-                result['message'] += "，并且激活了今日保护罩！"
-            
-            return result
-            
         except Exception as e:
             print(f"处理文件 {file_name} 时出错: {e}")
-            # 如果下载失败，尝试清理可能部分下载的文件
-            if os.path.exists(save_path):
+            self.stats['failures'] += 1
+            # 清理可能部分下载的临时文件
+            if os.path.exists(temp_path):
                 try:
-                    os.remove(save_path)
+                    os.remove(temp_path)
                 except:
                     pass
             
@@ -105,5 +119,100 @@ class BookService:
                 'message': f"处理文件失败: {str(e)}"
             }
 
+    async def commit_books(self, user_id, books):
+        """在一个事务中收录一批新书并发放奖励，成功后保存指纹并提取元数据"""
+        md5_list = [book['md5'] for book in books]
+        try:
+            result = await self.db.add_books_batch(user_id, books, BOOK_POINT_REWARD)
+        except Exception:
+            # 收录失败：撤销指纹并删除已保存的文件，这些书之后可以重新上传
+            fingerprint_service.remove(md5_list)
+            for book in books:
+                await self._discard_stored_file(book)
+            raise
+        await fingerprint_service.save(md5_list)
+        for book in books:
+            metadata_service.enqueue(book['path'])
+        result['reward'] = result['accepted'] * BOOK_POINT_REWARD
+        # 本批次让今日上传数跨过10本时提示激活了保护罩
+        result['shield_activated'] = (
+            result['accepted'] > 0 and result['books_uploaded'] >= 10
+            and result['books_uploaded'] - result['accepted'] < 10
+        )
+        return result
+
+    async def _discard_stored_file(self, book):
+        """删除收录失败的书籍文件，同一MD5已被其他上传收录时保留"""
+        try:
+            if await self.db.check_file_exists(book['md5']):
+                return
+        except Exception as e:
+            print(f"检查文件 {book['md5']} 是否已收录时出错: {e}")
+        try:
+            os.remove(book['path'])
+        except OSError as e:
+            print(f"删除未收录的文件 {book['path']} 失败: {e}")
+
+    async def _stream_to_file(self, client, file_id, file_name, temp_path):
+        """流式下载文件到临时路径，同时计算MD5，返回(MD5, 文件大小)"""
+        md5_hash = hashlib.md5()
+        file_size = 0
+        chunks = 0
+        
+        with open(temp_path, "wb") as f:
+            # 下载文件，添加洪水控制异常处理，重试时从已下载的分块继续
+            max_retries = 3
+            retry_count = 0
+            
+            while True:
+                try:
+                    async for chunk in client.stream_media(file_id, offset=chunks):
+                        # 写盘和计算哈希放到线程中执行，避免阻塞事件循环
+                        hash_seconds = await asyncio.to_thread(self._write_chunk, f, md5_hash, chunk)
+                        chunks += 1
+                        file_size += len(chunk)
+                        self.stats['hash_seconds'] += hash_seconds
+                    break
+                except pyrogram.errors.exceptions.flood_420.FloodWait as e:
+                    print(f"FloodWait: 需要等待 {e.value} 秒下载文件: {file_name}")
+                    retry_count += 1
+                    if retry_count < max_retries:
+                        # 减少等待时间，但不低于1秒
+                        adjusted_wait = max(1, e.value // 2)
+                        await asyncio.sleep(adjusted_wait)
+                    else:
+                        raise Exception(f"达到最大重试次数，无法下载文件: {file_name}")
+        
+        self.stats['files_hashed'] += 1
+        self.stats['bytes_hashed'] += file_size
+        return md5_hash.hexdigest(), file_size
+
+    @staticmethod
+    def _write_chunk(f, md5_hash, chunk):
+        """写入一个分块并更新MD5，返回计算哈希的耗时"""
+        f.write(chunk)
+        start = time.perf_counter()
+        md5_hash.update(chunk)
+        return time.perf_counter() - start
+
+    async def is_known_file(self, file_unique_id, file_size=0):
+        """通过file_unique_id检查文件是否已收录（不需要下载）"""
+        if not file_unique_id:
+            return False
+        if await self.db.get_file_md5(file_unique_id) is None:
+            return False
+        self.stats['index_hits'] += 1
+        self.stats['index_skipped_bytes'] += file_size or 0
+        return True
+
+    def get_stats(self):
+        """获取书籍收录统计"""
+        stats = dict(self.stats)
+        hash_seconds = stats.pop('hash_seconds')
+        stats['hash_mb_per_sec'] = round(stats['bytes_hashed'] / hash_seconds / 1048576, 1) if hash_seconds else 0.0
+        # 边下载边哈希，省掉的二次读盘字节数等于哈希过的字节数
+        stats['reread_bytes_avoided'] = stats['bytes_hashed']
+        return stats
+
 # 创建全局书籍服务实例
 book_service = BookService() 
\ No newline at end of file
@@ -0,0 +1,318 @@
+import asyncio
+import math
+import os
+import re
+import time
+from datetime import datetime
+from bot.config.config import PREMIUM_BOOKS_DIR, CATALOG_POLL_INTERVAL, SEARCH_MAX_RESULTS
+from bot.services.async_db_service import async_db_service
+from bot.services.compression_service import is_compressed, original_path, get_original_size
+from bot.utils.search_index import TitleSearchIndex
+
+# 不属于书籍的文件：旧版信息文件、压缩中的临时文件、下载中的临时文件
+IGNORED_SUFFIXES = ('.info', '.part', '.temp')
+# 存储文件名中的上传时间，如 书名_20240101_120000.txt
+UPLOAD_TIME_RE = re.compile(r'_(\d{8}_\d{6})')
+
+def list_book_files(directory):
+    """列出目录中的书籍文件，返回{存储文件名: 路径}（压缩存储的文件名去掉压缩后缀）"""
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file() or '.' not in entry.name or entry.name.endswith(IGNORED_SUFFIXES):
+                continue
+            stored_name = original_path(entry.name)
+            # 压缩过程中原文件和压缩文件会短暂同时存在，只列出原文件
+            if stored_name in files and is_compressed(entry.name):
+                continue
+            files[stored_name] = entry.path
+    return files
+
+def read_sidecar_book(path):
+    """从旧版.info信息文件读取书籍信息，生成premium_books表的一行
+
+    没有信息文件时，原始文件名使用存储文件名，上传时间从文件名或修改时间推断。
+    """
+    stored_name = os.path.basename(original_path(path))
+    info_file = os.path.splitext(original_path(path))[0] + '.info'
+    book = {
+        'original_name': stored_name,
+        'stored_name': stored_name,
+        'file_size': get_original_size(path),
+        'uploader_id': None,
+        'uploaded_at': None,
+        'md5': None
+    }
+
+    if os.path.exists(info_file):
+        with open(info_file, 'r', encoding='utf-8') as f:
+            for line in f.read().splitlines():
+                key, _, value = line.partition(":")
+                value = value.strip()
+                if key == "原始文件名" and value:
+                    book['original_name'] = value
+                elif key == "上传时间":
+                    try:
+                        book['uploaded_at'] = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+                    except ValueError:
+                        pass
+                elif key == "上传者ID" and value.isdigit():
+                    book['uploader_id'] = int(value)
+                elif key == "MD5" and value:
+                    book['md5'] = value
+
+    if book['uploaded_at'] is None:
+        match = UPLOAD_TIME_RE.search(stored_name)
+        if match:
+            book['uploaded_at'] = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+        else:
+            book['uploaded_at'] = datetime.fromtimestamp(int(os.path.getmtime(path)))
+    return book
+
+class CatalogIndex:
+    """精品书籍目录索引
+
+    书籍信息保存在premium_books表中，编号就是表的id，删除书籍后其他书的编号不变。
+    启动时从表中加载并常驻内存：书单按上传时间排好序，翻页直接切片；书名维护在倒排索引中，搜索不需要逐本比较。
+    后台按目录修改时间轮询，登记直接放进目录的书籍，文件不存在的书籍暂不列出（保留记录和编号）；
+    上传和元数据提取完成时主动更新。
+    """
+
+    def __init__(self, directory=PREMIUM_BOOKS_DIR, poll_interval=CATALOG_POLL_INTERVAL):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._entries = {}  # {编号: 书籍}
+        self._by_name = {}  # {存储文件名: 编号}
+        self._books = []  # 排好序的书单
+        self._search_index = TitleSearchIndex()
+        self._dir_mtime = None
+        self._lock = None
+        self._task = None
+
+        # 统计信息
+        self._scans = 0
+        self._updates = 0
+        self._imported = 0
+        self._last_scan_ms = 0.0
+        self._searches = 0
+        self._search_ms = 0.0
+
+    def _in_directory(self, path):
+        return os.path.abspath(os.path.dirname(path)) == os.path.abspath(self.directory)
+
+    def _set_entry(self, row, path):
+        """把表中的一行加入索引"""
+        book = {
+            'id': row['id'],
+            'original_name': row['original_name'],
+            'stored_name': row['stored_name'],
+            'size': row['file_size'],
+            'uploader_id': row['uploader_id'],
+            'uploaded_at': row['uploaded_at'],
+            'md5': row['md5'],
+            'file_id': row.get('tg_file_id'),
+            'path': path
+        }
+        self._entries[book['id']] = book
+        self._by_name[book['stored_name']] = book['id']
+        self._set_path(book, path)
+        return book
+
+    def _set_path(self, book, path):
+        """更新书籍文件路径，文件不存在（path为None）的书籍不参与搜索"""
+        book['path'] = path
+        if path is None:
+            self._search_index.remove(book['id'])
+        else:
+            # 同样匹配程度时新书排在前面
+            self._search_index.add(book['id'], book['original_name'], (book['uploaded_at'], book['id']))
+
+    async def refresh(self, force=False):
+        """目录有变化时与目录核对（force为True时无条件核对），返回是否核对"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                dir_mtime = os.stat(self.directory).st_mtime_ns
+            except FileNotFoundError:
+                return False
+            if not force and dir_mtime == self._dir_mtime:
+                return False
+
+            start = time.monotonic()
+            # 核对期间主动加入的书籍不在快照中，不能当作已删除
+            known = dict(self._by_name)
+            files = await asyncio.to_thread(list_book_files, self.directory)
+
+            # 更新路径：被压缩的书籍换成压缩文件，文件不存在的书籍暂不列出，文件恢复后沿用原编号
+            for stored_name, book_id in known.items():
+                book = self._entries[book_id]
+                path = files.get(stored_name)
+                if path != book['path']:
+                    self._set_path(book, path)
+
+            # 直接放进目录的书籍（包括旧版带.info信息文件的书籍）登记到表中
+            new_files = [path for stored_name, path in files.items() if stored_name not in self._by_name]
+            if new_files:
+                await self._import(new_files)
+
+            self._dir_mtime = dir_mtime
+            self._rebuild()
+            self._scans += 1
+            self._last_scan_ms = round((time.monotonic() - start) * 1000, 1)
+            return True
+
+    async def _import(self, paths):
+        """登记表中还没有的书籍文件，按上传时间先后分配编号"""
+        def read_books():
+            books = []
+            for path in paths:
+                try:
+                    books.append((read_sidecar_book(path), path))
+                except OSError as e:
+                    # 登记期间文件被压缩或删除，下次核对再处理
+                    print(f"读取精品书籍 {path} 失败: {e}")
+            books.sort(key=lambda item: item[0]['uploaded_at'])
+            return books
+
+        for row, path in await asyncio.to_thread(read_books):
+            row['id'] = await async_db_service.add_premium_book(
+                row['original_name'], row['stored_name'], row['file_size'],
+                row['uploader_id'], row['uploaded_at'], row['md5'], overwrite=False
+            )
+            # 登记期间上传流程已经加入了这本书，以上传流程的信息为准
+            if row['stored_name'] in self._by_name:
+                continue
+            self._set_entry(row, path)
+            self._imported += 1
+
+    async def add_uploaded(self, path, original_name, uploader_id, file_id=None):
+        """管理员上传完成后登记书籍，返回书籍信息（包括编号）；file_id为管理员上传消息中文件的file_id"""
+        row = {
+            'original_name': original_name,
+            'stored_name': os.path.basename(original_path(path)),
+            'file_size': get_original_size(path),
+            'uploader_id': uploader_id,
+            'uploaded_at': datetime.now().replace(microsecond=0),
+            'md5': None,
+            'tg_file_id': file_id
+        }
+        row['id'] = await async_db_service.add_premium_book(
+            row['original_name'], row['stored_name'], row['file_size'], row['uploader_id'], row['uploaded_at'],
+            file_id=file_id
+        )
+        book = self._set_entry(row, path)
+        self._rebuild()
+        self._updates += 1
+        return book
+
+    async def set_md5(self, path, md5):
+        """元数据提取后记录精品书籍的MD5，不在书库目录中的文件忽略"""
+        if not self._in_directory(path):
+            return
+        book = self._entries.get(self._by_name.get(os.path.basename(original_path(path))))
+        if book is None or book['md5'] == md5:
+            return
+        await async_db_service.set_premium_book_md5(book['id'], md5)
+        book['md5'] = md5
+        self._updates += 1
+
+    async def set_file_id(self, book_id, file_id):
+        """记录书籍在Telegram的file_id，之后兑换直接发送，不重新上传文件；file_id失效时传入None"""
+        book = self._entries.get(book_id)
+        if book is None or book['file_id'] == file_id:
+            return
+        await async_db_service.set_premium_book_file_id(book_id, file_id)
+        book['file_id'] = file_id
+
+    def _rebuild(self):
+        """重新排序并生成显示名称"""
+        # 按上传时间排序，新书在前
+        books = sorted(
+            (book for book in self._entries.values() if book['path']),
+            key=lambda x: (x['uploaded_at'], x['id']), reverse=True
+        )
+
+        # 同名书籍在名称后附加编号以便区分
+        book_count = {}
+        for book in books:
+            book_count[book['original_name']] = book_count.get(book['original_name'], 0) + 1
+        for book in books:
+            name = book['original_name']
+            book['display_name'] = f"{name} (#{book['id']})" if book_count[name] > 1 else name
+
+        self._books = books
+
+    def get_books(self):
+        """获取全部精品书籍（已排序，调用方不要修改）"""
+        return self._books
+
+    def get(self, book_id):
+        """按编号获取一本书，文件不存在时返回None"""
+        book = self._entries.get(book_id)
+        return book if book and book['path'] else None
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS):
+        """按书名搜索，按匹配程度和上传时间排序，最多返回limit本"""
+        start = time.monotonic()
+        results = [self._entries[book_id] for book_id in self._search_index.search(query, limit)]
+        self._searches += 1
+        self._search_ms += (time.monotonic() - start) * 1000
+        return results
+
+    def get_page(self, page, per_page):
+        """获取一页书籍，页码超出范围时自动修正，返回(本页书籍, 修正后的页码, 总页数)"""
+        total_pages = max(math.ceil(len(self._books) / per_page), 1)
+        page = min(max(page, 1), total_pages)
+        start_idx = (page - 1) * per_page
+        return self._books[start_idx:start_idx + per_page], page, total_pages
+
+    async def load(self):
+        """启动时从表中加载全部书籍，再与书库目录核对"""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        for row in await async_db_service.get_premium_books():
+            self._set_entry(row, None)
+        await self.refresh(force=True)
+        print(f"精品书籍目录已加载 {len(self._books)} 本 ({self._last_scan_ms}ms)")
+
+    async def _run(self):
+        """后台轮询：每隔poll_interval检查目录是否有变化"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"刷新精品书籍目录失败: {e}")
+
+    def start(self):
+        """启动后台轮询任务（需要在事件循环中调用）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台轮询任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self):
+        """获取精品书籍目录统计"""
+        return {
+            'books': len(self._books),
+            'scans': self._scans,
+            'updates': self._updates,
+            'imported': self._imported,
+            'missing': len(self._entries) - len(self._books),
+            'cached_file_ids': sum(1 for book in self._books if book['file_id']),
+            'last_scan_ms': self._last_scan_ms,
+            'searches': self._searches,
+            'avg_search_ms': round(self._search_ms / self._searches, 2) if self._searches else 0.0
+        }
+
+# 创建全局精品书籍目录实例
+catalog_index = CatalogIndex()
@@ -0,0 +1,192 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from bot.config.config import (
+    BOOK_DOWNLOAD_PATH, PREMIUM_BOOKS_DIR, BOOK_COMPRESSION_ENABLED, BOOK_COMPRESS_EXTENSIONS,
+    BOOK_COMPRESS_BATCH_SIZE, BOOK_COMPRESS_MIN_RATIO
+)
+from bot.services.async_db_service import async_db_service
+
+# 压缩文件的后缀，如 xxx.txt.gz
+COMPRESSED_SUFFIX = '.gz'
+# 流式压缩/解压时每次处理的字节数
+CHUNK_SIZE = 1024 * 1024
+
+def is_compressed(path):
+    """检查文件是否为压缩存储"""
+    return path.endswith(COMPRESSED_SUFFIX)
+
+def original_path(path):
+    """去掉压缩后缀，得到原始文件路径"""
+    return path[:-len(COMPRESSED_SUFFIX)] if is_compressed(path) else path
+
+def get_original_size(path):
+    """获取文件原始大小，压缩文件从gzip尾部读取（不需要解压）"""
+    if not is_compressed(path):
+        return os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', f.read(4))[0]
+
+def compress_file(path, min_ratio):
+    """流式压缩文件，同时计算原始MD5
+
+    返回(原始MD5, 原始大小, 压缩后大小)；压缩后没有小于原大小的min_ratio时保留原文件并返回None。
+    先写入临时文件，完成后原子重命名，再删除原文件，任何时刻都至少有一份完整的文件。
+    """
+    target = path + COMPRESSED_SUFFIX
+    temp_path = f"{target}.{uuid.uuid4().hex}.part"
+    md5_hash = hashlib.md5()
+    size = 0
+    try:
+        with open(path, 'rb') as src, open(temp_path, 'wb') as raw:
+            with gzip.GzipFile(filename=os.path.basename(path), mode='wb', fileobj=raw, mtime=0) as gz:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    md5_hash.update(chunk)
+                    size += len(chunk)
+                    gz.write(chunk)
+        compressed_size = os.path.getsize(temp_path)
+        if compressed_size >= size * min_ratio:
+            os.remove(temp_path)
+            return None
+        os.replace(temp_path, target)
+        os.remove(path)
+        return md5_hash.hexdigest(), size, compressed_size
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def decompress_file(path, target):
+    """流式解压文件到目标路径"""
+    with gzip.open(path, 'rb') as src, open(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+class CompressionService:
+    """书籍压缩存储
+
+    开启后，新收录的文本书籍会压缩保存（gzip），发送时再临时解压；
+    后台任务分批把已有书库转换为压缩存储，不需要停机。
+    """
+
+    def __init__(self):
+        self.enabled = BOOK_COMPRESSION_ENABLED
+        self.directories = [BOOK_DOWNLOAD_PATH, PREMIUM_BOOKS_DIR]
+        self._walker = None  # 遍历书库的生成器，分多批继续上次的位置
+        self._skipped = set()  # 压缩效果不明显、保留原样的文件
+        self._lock = None
+
+        # 统计信息
+        self._compressed = 0
+        self._bytes_before = 0
+        self._bytes_after = 0
+        self._served = 0
+        self._failures = 0
+
+    def _should_compress(self, path):
+        return (
+            os.path.splitext(path)[1].lower() in BOOK_COMPRESS_EXTENSIONS
+            and path not in self._skipped
+        )
+
+    async def compress(self, path):
+        """压缩一个书籍文件，返回压缩后的路径；未开启或不需要压缩时返回原路径"""
+        if not self.enabled or not self._should_compress(path):
+            return path
+        try:
+            result = await asyncio.to_thread(compress_file, path, BOOK_COMPRESS_MIN_RATIO)
+        except Exception as e:
+            print(f"压缩书籍 {path} 失败: {e}")
+            self._failures += 1
+            return path
+        if result is None:
+            self._skipped.add(path)
+            return path
+
+        original_md5, original_size, compressed_size = result
+        self._compressed += 1
+        self._bytes_before += original_size
+        self._bytes_after += compressed_size
+        target = path + COMPRESSED_SUFFIX
+        await async_db_service.add_compressed_file(target, original_md5, original_size, compressed_size)
+        return target
+
+    def _iter_uncompressed(self):
+        """遍历书库中还没有压缩的文本书籍"""
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            for root, dirs, files in os.walk(directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if self._should_compress(path):
+                        yield path
+
+    def _next_batch(self, size):
+        """取出下一批待压缩的文件，遍历完一遍后从头开始"""
+        batch = []
+        if self._walker is None:
+            self._walker = self._iter_uncompressed()
+        for path in self._walker:
+            batch.append(path)
+            if len(batch) >= size:
+                break
+        else:
+            self._walker = None
+        return batch
+
+    async def convert_batch(self, size=BOOK_COMPRESS_BATCH_SIZE):
+        """压缩已有书库中的一批文件（由定时任务调用），返回压缩的文件数"""
+        if not self.enabled:
+            return 0
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self._lock.locked():
+            return 0
+
+        async with self._lock:
+            batch = await asyncio.to_thread(self._next_batch, size)
+            converted = 0
+            for path in batch:
+                if os.path.exists(path) and await self.compress(path) != path:
+                    converted += 1
+            if converted:
+                print(f"后台压缩了 {converted} 本书籍")
+            return converted
+
+    @asynccontextmanager
+    async def open_for_sending(self, path):
+        """得到可以直接发送的文件路径，压缩的文件会临时解压，用完自动清理"""
+        if not is_compressed(path):
+            yield path
+            return
+
+        temp_dir = tempfile.mkdtemp(prefix="book_")
+        target = os.path.join(temp_dir, os.path.basename(original_path(path)))
+        try:
+            await asyncio.to_thread(decompress_file, path, target)
+            self._served += 1
+            yield target
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def get_stats(self):
+        """获取压缩存储统计"""
+        return {
+            'enabled': self.enabled,
+            'compressed': self._compressed,
+            'bytes_before': self._bytes_before,
+            'bytes_after': self._bytes_after,
+            'saved_bytes': self._bytes_before - self._bytes_after,
+            'served': self._served,
+            'failures': self._failures
+        }
+
+# 创建全局压缩存储服务实例
+compression_service = CompressionService()
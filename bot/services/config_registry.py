@@ -0,0 +1,159 @@
+import threading
+import time
+from datetime import date, datetime
+from bot.services.db_service import db_service
+
+class ConfigRegistry:
+    """热配置注册表
+
+    授权群组、管理员、大乐透奖池、今日号码和公告消息ID常驻内存：
+    - 启动时加载一次
+    - 本进程内的修改直接更新内存，并通知订阅者
+    - 定时重新加载，获取其他进程（如脚本）直接修改数据库的结果
+    """
+
+    def __init__(self):
+        self.db = db_service
+        self._lock = threading.RLock()
+        self._values = {
+            'authorized_groups': {},  # {群组ID: 群组信息}
+            'admins': frozenset(),
+            'lottery_pool': None,
+            'lottery_numbers': None,
+            'today_lottery': None,
+            'lottery_message_id': None
+        }
+        # 各配置项的加载函数，管理员列表由admin_service注册
+        self._loaders = {
+            'authorized_groups': self._load_authorized_groups,
+            'lottery_pool': self.db.get_lottery_pool,
+            'lottery_numbers': self.db.get_lottery_numbers,
+            'today_lottery': self.db.get_today_lottery,
+            'lottery_message_id': self.db.get_lottery_message_id
+        }
+        self._subscribers = []
+
+        # 统计信息
+        self.reload_count = 0
+        self.last_reload = None
+
+    def _load_authorized_groups(self):
+        """从数据库加载授权群组"""
+        return {group['group_id']: group for group in self.db.get_all_authorized_groups()}
+
+    def register_loader(self, key, loader):
+        """注册配置项的加载函数"""
+        self._loaders[key] = loader
+
+    def subscribe(self, callback):
+        """订阅配置变更，callback(key, value)"""
+        self._subscribers.append(callback)
+
+    def reload(self, keys=None):
+        """从数据源重新加载配置（阻塞调用，需在线程池中执行）"""
+        for key in keys or list(self._loaders):
+            try:
+                value = self._loaders[key]()
+            except Exception as e:
+                print(f"加载配置 {key} 失败: {e}")
+                continue
+            self.set(key, value)
+        self.reload_count += 1
+        self.last_reload = time.time()
+
+    def get(self, key):
+        """获取配置项"""
+        return self._values.get(key)
+
+    def set(self, key, value):
+        """更新配置项，有变化时通知订阅者"""
+        with self._lock:
+            if self._values.get(key) == value:
+                return
+            self._values[key] = value
+
+        for callback in self._subscribers:
+            try:
+                callback(key, value)
+            except Exception as e:
+                print(f"通知配置变更 {key} 失败: {e}")
+
+    # ========== 授权群组 ==========
+    def is_group_authorized(self, group_id):
+        """检查群组是否已授权"""
+        return group_id in self._values['authorized_groups']
+
+    def get_authorized_groups(self):
+        """获取所有授权的群组"""
+        return list(self._values['authorized_groups'].values())
+
+    def add_authorized_group(self, group_id, group_name):
+        """记录新授权的群组"""
+        with self._lock:
+            groups = dict(self._values['authorized_groups'])
+            groups.setdefault(group_id, {'group_id': group_id, 'group_name': group_name})
+            self.set('authorized_groups', groups)
+
+    # ========== 管理员 ==========
+    def is_admin(self, user_id):
+        """检查用户是否是管理员"""
+        return user_id in self._values['admins']
+
+    def get_admins(self):
+        """获取所有管理员ID"""
+        return list(self._values['admins'])
+
+    def set_admins(self, admins):
+        """更新管理员列表"""
+        self.set('admins', frozenset(admins))
+
+    # ========== 大乐透 ==========
+    def get_lottery_pool(self):
+        """获取大乐透奖池信息"""
+        pool_info = self._values['lottery_pool']
+        return dict(pool_info) if pool_info else None
+
+    def set_lottery_pool(self, amount):
+        """更新大乐透奖池金额"""
+        with self._lock:
+            pool_info = dict(self._values['lottery_pool'] or {'id': 1})
+            pool_info['amount'] = amount
+            self.set('lottery_pool', pool_info)
+
+    def get_lottery_numbers(self):
+        """获取最新的大乐透中奖号码"""
+        numbers = self._values['lottery_numbers']
+        return list(numbers) if numbers else None
+
+    def set_lottery_numbers(self, numbers):
+        """更新大乐透中奖号码，同时记为今天的大乐透"""
+        with self._lock:
+            self.set('lottery_numbers', list(numbers))
+            self.set('today_lottery', {'numbers': ''.join(map(str, numbers)), 'created_at': datetime.now()})
+
+    def get_today_lottery(self):
+        """获取今天的大乐透记录，跨天后自动失效"""
+        today_lottery = self._values['today_lottery']
+        if not today_lottery or today_lottery['created_at'].date() != date.today():
+            return None
+        return dict(today_lottery)
+
+    def get_lottery_message_id(self):
+        """获取大乐透公告消息ID"""
+        return self._values['lottery_message_id']
+
+    def set_lottery_message_id(self, message_id):
+        """更新大乐透公告消息ID"""
+        self.set('lottery_message_id', message_id)
+
+    def get_stats(self):
+        """获取注册表统计信息"""
+        return {
+            'groups': len(self._values['authorized_groups']),
+            'admins': len(self._values['admins']),
+            'reload_count': self.reload_count,
+            'last_reload': self.last_reload
+        }
+
+# 创建全局配置注册表实例
+config_registry = ConfigRegistry()
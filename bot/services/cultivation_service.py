@@ -1,7 +1,6 @@
 import random
 from bot.services.db_service import db_service
 from bot.config.config import CULTIVATION_STAGES
-from bot.utils.helpers import roll_random_event
 
 class CultivationService:
     def __init__(self):
@@ -20,18 +19,13 @@ class CultivationService:
             'next_cost': cultivation['next_cost']
         }
     
-    def process_message(self, user_id, message_text):
-        """处理用户消息，可能触发随机事件"""
+    def process_event(self, user_id, event):
+        """处理用户消息掷出的随机事件
+        
+        事件由调用方先用roll_random_event掷出，没有事件的消息不会走到这里，
+        只有真正触发事件时才读写数据库。
+        """
         try:
-            # 记录用户事件
-            self.db.record_user_event(user_id)
-            
-            # 随机生成事件
-            event = roll_random_event()
-            
-            if not event:
-                return None
-                
             # 获取用户当前信息
             user_points = self.db.get_user_points(user_id)
             cultivation = self.db.get_cultivation(user_id)
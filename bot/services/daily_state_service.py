@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime
+import pytz
+from bot.config.config import CULTIVATION_STAGES
+from bot.services.db_service import db_service
+from bot.services.async_db_service import async_db_service
+
+class DailyStateService:
+    """地仙每日首次发言的内存状态
+
+    - 地仙用户集合：启动时加载，境界变化时更新
+    - 当天已欢迎的地仙集合：每天0点（北京时间）清空，欢迎记录异步写入immortal_daily_chat
+    非地仙用户的消息不需要任何数据库查询。
+    """
+
+    def __init__(self):
+        self.timezone = pytz.timezone('Asia/Shanghai')
+        self.immortals = set()  # 地仙用户ID
+        self.greeted = set()  # 当天已欢迎过的地仙用户ID
+        self._day = None
+        self._tasks = set()  # 正在写库的任务，防止被回收
+        db_service.add_stage_listener(self.on_stage_change)
+
+    def today(self):
+        """北京时间的今天"""
+        return datetime.now(self.timezone).date()
+
+    async def load(self):
+        """从数据库加载地仙用户和今天已欢迎的记录"""
+        self._day = self.today()
+        self.immortals = set(await async_db_service.get_immortal_user_ids())
+        self.greeted = set(await async_db_service.get_greeted_immortals(self._day))
+        print(f"已加载 {len(self.immortals)} 位地仙，今日已欢迎 {len(self.greeted)} 位")
+
+    def on_stage_change(self, user_id, new_stage):
+        """境界变化时更新地仙集合"""
+        if new_stage >= len(CULTIVATION_STAGES):
+            self.immortals.add(user_id)
+        else:
+            self.immortals.discard(user_id)
+
+    def is_immortal(self, user_id):
+        """检查用户是否为地仙"""
+        return user_id in self.immortals
+
+    def _roll_day(self):
+        """跨天后清空当天已欢迎的集合"""
+        today = self.today()
+        if today != self._day:
+            self._day = today
+            self.greeted = set()
+
+    def try_greet(self, user_id):
+        """地仙今天首次发言时返回True并记录（异步写库），否则返回False"""
+        if user_id not in self.immortals:
+            return False
+
+        self._roll_day()
+        if user_id in self.greeted:
+            return False
+
+        self.greeted.add(user_id)
+        task = asyncio.create_task(async_db_service.mark_immortal_greeted(user_id, self._day))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+# 创建全局每日状态服务实例
+daily_state_service = DailyStateService()
@@ -1,24 +1,103 @@
 import pymysql
 from datetime import datetime, date, timedelta
 import random
-from bot.config.config import DB_CONFIG, CULTIVATION_STAGES
+from bot.config.config import (
+    DB_CONFIG, CULTIVATION_STAGES, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    DB_POOL_MAX_LIFETIME, DB_POOL_PING_INTERVAL, DB_POOL_TIMEOUT
+)
 from bot.utils.db_config_helper import get_optimized_connection
+from bot.utils.db_pool import ConnectionPool
+from bot.services.profile_cache import profile_cache
 import time
 import aiohttp
 import json
 
+# 用户信息与修仙信息的联表查询，同时检查事件、打劫记录是否存在
+PROFILE_QUERY = """
+    SELECT u.*, c.stage, c.pills, c.next_cost,
+           e.user_id IS NOT NULL AS has_events,
+           r.user_id IS NOT NULL AS has_rob_record
+    FROM users u
+    LEFT JOIN user_cultivation c ON c.user_id = u.user_id
+    LEFT JOIN user_events e ON e.user_id = u.user_id
+    LEFT JOIN rob_records r ON r.user_id = u.user_id
+    WHERE u.user_id = %s
+"""
+
+def initial_breakthrough_cost():
+    """计算初始境界所需的突破成本，与attempt_breakthrough方法保持一致"""
+    initial_stage = 0
+    base_cost = 200
+    major_level = initial_stage // 3
+    minor_level = initial_stage % 3
+    major_linear = (major_level + 1) * 200
+    major_exp = 1.25 ** major_level
+    minor_multiplier = 1 + (minor_level * 0.5)
+    return int((base_cost + major_linear) * major_exp * minor_multiplier)
+
+def profile_upsert_statements(user_id, username, first_name, last_name):
+    """新用户需要创建的所有记录（已存在的记录会被忽略）"""
+    return [
+        # 创建用户基本信息
+        ("""
+            INSERT IGNORE INTO users (user_id, username, first_name, last_name, points)
+            VALUES (%s, %s, %s, %s, 100)
+        """, (user_id, username, first_name, last_name)),
+        # 初始化用户的修仙记录
+        ("""
+            INSERT IGNORE INTO user_cultivation (user_id, stage, pills, next_cost)
+            VALUES (%s, 0, 0, %s)
+        """, (user_id, initial_breakthrough_cost())),
+        # 初始化用户事件记录
+        ("""
+            INSERT IGNORE INTO user_events (user_id)
+            VALUES (%s)
+        """, (user_id,)),
+        # 初始化打劫记录
+        ("""
+            INSERT IGNORE INTO rob_records (user_id, last_rob, count)
+            VALUES (%s, NULL, 0)
+        """, (user_id,))
+    ]
+
+def is_profile_complete(profile):
+    """检查联表查询结果中各项记录是否齐全"""
+    return bool(profile) and profile['stage'] is not None and profile['has_events'] and profile['has_rob_record']
+
+def clean_profile(profile):
+    """去掉联表查询中仅用于检查的字段"""
+    if profile:
+        profile.pop('has_events', None)
+        profile.pop('has_rob_record', None)
+    return profile
+
 class DBService:
     def __init__(self):
         self.config = DB_CONFIG
+        self.pool = ConnectionPool(
+            self.config,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_lifetime=DB_POOL_MAX_LIFETIME,
+            ping_interval=DB_POOL_PING_INTERVAL,
+            timeout=DB_POOL_TIMEOUT
+        )
+        self._stage_listeners = []  # 境界变化的回调 callback(user_id, new_stage)
         # 尝试初始化数据库
         try:
             self.initialize_database()
         except Exception as e:
             print(f"初始化数据库时出错: {e}")
+        # 预先建立连接
+        try:
+            self.pool.fill()
+        except Exception as e:
+            print(f"初始化数据库连接池时出错: {e}")
 
     def initialize_database(self):
         """初始化数据库，创建必要的表"""
-        connection = self.get_connection()
+        # 建表会修改会话参数，使用独立连接而不是连接池中的连接
+        connection = get_optimized_connection(self.config)
         try:
             with connection.cursor() as cursor:
                 # 首先创建数据库
@@ -107,6 +186,89 @@ class DBService:
                     ) ENGINE=InnoDB
                 """)
                 
+                # 创建Telegram文件索引表（file_unique_id -> md5），已知文件无需下载即可判重
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS file_index (
+                        file_unique_id VARCHAR(64) PRIMARY KEY,
+                        md5 CHAR(32) NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        INDEX idx_md5 (md5)
+                    ) ENGINE=InnoDB
+                """)
+                
+                # 创建书籍文件名表（文件名 -> MD5，文件本身按MD5分片存储）
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS book_files (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        md5 CHAR(32) NOT NULL,
+                        file_name VARCHAR(255) NOT NULL,
+                        file_ext VARCHAR(16) NOT NULL,
+                        file_size BIGINT DEFAULT 0,
+                        user_id BIGINT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE KEY uk_md5_name (md5, file_name),
+                        INDEX idx_file_name (file_name)
+                    ) ENGINE=InnoDB
+                """)
+                
+                # 创建书籍指纹表（MinHash签名，用于近似重复检测）
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS book_fingerprints (
+                        md5 CHAR(32) PRIMARY KEY,
+                        signature VARBINARY(512) NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    ) ENGINE=InnoDB
+                """)
+                
+                # 创建压缩存储记录表（原始文件的大小和MD5）
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS compressed_files (
+                        path VARCHAR(512) PRIMARY KEY,
+                        original_md5 CHAR(32) NOT NULL,
+                        original_size BIGINT NOT NULL,
+                        compressed_size BIGINT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    ) ENGINE=InnoDB
+                """)
+                
+                # 创建书籍元数据表（后台提取，书单和搜索直接读取）
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS book_metadata (
+                        md5 CHAR(32) PRIMARY KEY,
+                        encoding VARCHAR(32) NULL,
+                        word_count INT DEFAULT 0,
+                        chapter_count INT DEFAULT 0,
+                        title VARCHAR(255) NULL,
+                        author VARCHAR(255) NULL,
+                        preview TEXT NULL,
+                        extracted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    ) ENGINE=InnoDB
+                """)
+                
+                # 创建精品书籍表（编号即id，删除书籍后其他书的编号不变）
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS premium_books (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        original_name VARCHAR(255) NOT NULL,
+                        stored_name VARCHAR(255) NOT NULL,
+                        file_size BIGINT DEFAULT 0,
+                        uploader_id BIGINT NULL,
+                        uploaded_at DATETIME NOT NULL,
+                        md5 CHAR(32) NULL,
+                        tg_file_id VARCHAR(255) NULL,
+                        UNIQUE KEY uk_stored_name (stored_name),
+                        INDEX idx_uploaded_at (uploaded_at),
+                        INDEX idx_original_name (original_name),
+                        INDEX idx_md5 (md5)
+                    ) ENGINE=InnoDB
+                """)
+                
+                # 精品书籍表添加Telegram file_id字段（兑换时直接发送已上传过的文件）
+                cursor.execute("""
+                    ALTER TABLE premium_books
+                    ADD COLUMN IF NOT EXISTS tg_file_id VARCHAR(255) NULL
+                """)
+                
                 # 创建保护罩记录表
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS shield_records (
@@ -287,21 +449,46 @@ class DBService:
             connection.close()
 
     def get_connection(self):
-        """获取数据库连接"""
-        return get_optimized_connection(self.config)
+        """从连接池获取数据库连接，用完调用close()归还"""
+        return self.pool.get_connection()
+
+    def get_pool_stats(self):
+        """获取连接池统计信息"""
+        return self.pool.get_stats()
+
+    def add_stage_listener(self, callback):
+        """注册境界变化的回调"""
+        self._stage_listeners.append(callback)
+
+    def _notify_stage_change(self, user_id, new_stage):
+        """通知境界变化"""
+        for callback in self._stage_listeners:
+            try:
+                callback(user_id, new_stage)
+            except Exception as e:
+                print(f"通知境界变化出错: {e}")
 
     # ========== 用户管理 ==========
     def get_user(self, user_id):
         """获取用户信息"""
+        cached = profile_cache.get_user(user_id)
+        if cached is not None:
+            return cached
+            
+        token = profile_cache.begin_read()
         connection = self.get_connection()
         try:
             with connection.cursor(pymysql.cursors.DictCursor) as cursor:
                 cursor.execute("""
                     SELECT * FROM users WHERE user_id = %s
                 """, (user_id,))
-                return cursor.fetchone()
+                user = cursor.fetchone()
         finally:
             connection.close()
+            
+        if user:
+            profile_cache.put_user(user_id, user, token)
+        return user
 
     def create_user(self, user_id, username, first_name=None, last_name=None):
         """创建新用户"""
@@ -312,43 +499,59 @@ class DBService:
         connection = self.get_connection()
         try:
             with connection.cursor() as cursor:
-                # 创建用户基本信息
-                cursor.execute("""
-                    INSERT IGNORE INTO users (user_id, username, first_name, last_name, points)
-                    VALUES (%s, %s, %s, %s, 100)
-                """, (user_id, username, first_name, last_name))
-                
-                # 计算初始境界所需的突破成本，与attempt_breakthrough方法保持一致
-                initial_stage = 0
-                base_cost = 200
-                major_level = initial_stage // 3
-                minor_level = initial_stage % 3
-                major_linear = (major_level + 1) * 200
-                major_exp = 1.25 ** major_level
-                minor_multiplier = 1 + (minor_level * 0.5)
-                initial_cost = int((base_cost + major_linear) * major_exp * minor_multiplier)
-                
-                # 初始化用户的修仙记录
-                cursor.execute("""
-                    INSERT IGNORE INTO user_cultivation (user_id, stage, pills, next_cost)
-                    VALUES (%s, 0, 0, %s)
-                """, (user_id, initial_cost))
-                
-                # 初始化用户事件记录
-                cursor.execute("""
-                    INSERT IGNORE INTO user_events (user_id)
-                    VALUES (%s)
-                """, (user_id,))
-                
-                # 初始化打劫记录
-                cursor.execute("""
-                    INSERT IGNORE INTO rob_records (user_id, last_rob, count)
-                    VALUES (%s, NULL, 0)
-                """, (user_id,))
+                for query, params in profile_upsert_statements(user_id, username, first_name, last_name):
+                    cursor.execute(query, params)
                 
             connection.commit()
         finally:
             connection.close()
+            profile_cache.invalidate(user_id)
+
+    def ensure_user_profile(self, user_id, username, first_name=None, last_name=None, update_names=False):
+        """确保用户的基本信息、修仙、事件、打劫记录都存在，返回用户信息和修仙信息合并后的一行
+        
+        老用户只需一次联表查询；缺少记录时在同一个事务中补齐。
+        update_names为True时，如果昵称有变化则顺便更新。
+        """
+        # 如果username为None，使用默认值
+        if username is None:
+            username = "无名修士"
+            
+        cached = profile_cache.get_profile(user_id)
+        if cached is not None and (not update_names or (cached['username'], cached['first_name'], cached['last_name']) == (username, first_name, last_name)):
+            return cached
+            
+        token = profile_cache.begin_read()
+        connection = self.get_connection()
+        try:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(PROFILE_QUERY, (user_id,))
+                profile = cursor.fetchone()
+                
+                if not is_profile_complete(profile):
+                    # 在同一个事务中补齐缺失的记录
+                    for query, params in profile_upsert_statements(user_id, username, first_name, last_name):
+                        cursor.execute(query, params)
+                    cursor.execute(PROFILE_QUERY, (user_id,))
+                    profile = cursor.fetchone()
+                    connection.commit()
+                elif update_names and (profile['username'], profile['first_name'], profile['last_name']) != (username, first_name, last_name):
+                    cursor.execute("""
+                        UPDATE users 
+                        SET username = %s, first_name = %s, last_name = %s 
+                        WHERE user_id = %s
+                    """, (username, first_name, last_name, user_id))
+                    connection.commit()
+                    # 改名很少发生，直接让缓存失效，本次不回填
+                    profile_cache.invalidate(user_id)
+                    profile.update(username=username, first_name=first_name, last_name=last_name)
+                
+                profile = clean_profile(profile)
+        finally:
+            connection.close()
+            
+        profile_cache.put_profile(user_id, profile, token)
+        return profile
 
     def update_username(self, user_id, username, first_name=None, last_name=None):
         """更新用户名和姓名"""
@@ -365,6 +568,7 @@ class DBService:
                     WHERE user_id = %s
                 """, (username, first_name, last_name, user_id))
             connection.commit()
+            profile_cache.patch_user(user_id, username=username, first_name=first_name, last_name=last_name)
         finally:
             connection.close()
 
@@ -436,18 +640,13 @@ class DBService:
                         WHERE user_id = %s
                     """, (points_change, user_id))
                 connection.commit()
+                profile_cache.add_points(user_id, points_change)
                 
                 # 获取更新后的积分
                 with connection.cursor() as cursor:
                     cursor.execute("SELECT points FROM users WHERE user_id = %s", (user_id,))
                     result = cursor.fetchone()
                     new_points = result[0] if result else 0
-                    
-                    # 如果积分为负数，记录首次负分时间
-                    if new_points < 0:
-                        self.record_negative_points(user_id)
-                        
-                    return new_points
             except pymysql.err.OperationalError as e:
                 # 如果是锁等待超时，尝试重试
                 if e.args[0] == 1205:  # Lock wait timeout exceeded
@@ -456,6 +655,7 @@ class DBService:
                         print(f"锁等待超时，正在重试 ({retries}/{max_retries})...")
                         # 等待一小段时间后重试
                         time.sleep(0.5)
+                        continue
                     else:
                         print("达到最大重试次数，操作失败")
                         raise
@@ -463,6 +663,12 @@ class DBService:
                     raise
             finally:
                 connection.close()
+            
+            # 如果积分为负数，记录首次负分时间（先归还连接，避免同时占用两个连接）
+            if new_points < 0:
+                self.record_negative_points(user_id)
+                
+            return new_points
 
     def record_negative_points(self, user_id):
         """记录用户积分首次变为负数的时间"""
@@ -525,14 +731,8 @@ class DBService:
 
     def get_user_points(self, user_id):
         """获取用户积分"""
-        connection = self.get_connection()
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT points FROM users WHERE user_id = %s", (user_id,))
-                result = cursor.fetchone()
-                return result[0] if result else 0
-        finally:
-            connection.close()
+        user = self.get_user(user_id)
+        return user['points'] if user else 0
 
     # ========== 签到系统 ==========
     def check_in(self, user_id, max_retries=3):
@@ -612,8 +812,9 @@ class DBService:
                     
                     # 提交事务，确保签到记录保存成功
                     connection.commit()
-                
-                # 使用单独的连接更新积分，避免长事务
+
+                # 先归还连接，再使用单独的连接更新积分，避免长事务
+                connection.close()
                 new_points = self.update_points(user_id, total_points)
                 
                 result = {
@@ -713,6 +914,11 @@ class DBService:
     # ========== 修仙系统 ==========
     def get_cultivation(self, user_id):
         """获取用户修仙信息"""
+        cached = profile_cache.get_cultivation(user_id)
+        if cached is not None:
+            return cached
+            
+        token = profile_cache.begin_read()
         connection = self.get_connection()
         try:
             with connection.cursor(pymysql.cursors.DictCursor) as cursor:
@@ -720,9 +926,13 @@ class DBService:
                     SELECT * FROM user_cultivation 
                     WHERE user_id = %s
                 """, (user_id,))
-                return cursor.fetchone()
+                cultivation = cursor.fetchone()
         finally:
             connection.close()
+            
+        if cultivation:
+            profile_cache.put_cultivation(user_id, cultivation, token)
+        return cultivation
     
     def initialize_user_cultivation(self, user_id):
         """初始化用户修仙信息"""
@@ -748,110 +958,115 @@ class DBService:
             return False
         finally:
             connection.close()
+            profile_cache.invalidate(user_id, user=False)
     
     def update_cultivation_stage(self, user_id, new_stage, max_retries=3):
         """更新修炼阶段"""
         connection = self.get_connection()
         retry_count = 0
         
-        while retry_count < max_retries:
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute("""
-                        UPDATE user_cultivation 
-                        SET stage = %s
-                        WHERE user_id = %s
-                    """, (new_stage, user_id))
-                connection.commit()
-                return True
-            except pymysql.err.OperationalError as e:
-                if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
-                    retry_count += 1
-                    if retry_count >= max_retries:
-                        print(f"更新修炼阶段失败，已达到最大重试次数: {e}")
+        try:
+            while retry_count < max_retries:
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute("""
+                            UPDATE user_cultivation 
+                            SET stage = %s
+                            WHERE user_id = %s
+                        """, (new_stage, user_id))
+                    connection.commit()
+                    profile_cache.patch_cultivation(user_id, stage=new_stage)
+                    self._notify_stage_change(user_id, new_stage)
+                    return True
+                except pymysql.err.OperationalError as e:
+                    if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
+                        retry_count += 1
+                        if retry_count >= max_retries:
+                            print(f"更新修炼阶段失败，已达到最大重试次数: {e}")
+                            return False
+                        time.sleep(0.5)  # 短暂延迟后重试
+                    else:
+                        print(f"更新修炼阶段时发生错误: {e}")
                         return False
-                    time.sleep(0.5)  # 短暂延迟后重试
-                else:
+                except Exception as e:
                     print(f"更新修炼阶段时发生错误: {e}")
                     return False
-            except Exception as e:
-                print(f"更新修炼阶段时发生错误: {e}")
-                return False
-            finally:
-                if retry_count >= max_retries - 1:  # 只在最后一次尝试后关闭连接
-                    connection.close()
+        finally:
+            connection.close()
     
     def update_cultivation_pills(self, user_id, pills_change, max_retries=3):
         """更新用户丹药数量"""
         connection = self.get_connection()
         retry_count = 0
         
-        while retry_count < max_retries:
-            try:
-                with connection.cursor() as cursor:
-                    if pills_change >= 0:
-                        cursor.execute("""
-                            UPDATE user_cultivation 
-                            SET pills = pills + %s
-                            WHERE user_id = %s
-                        """, (pills_change, user_id))
+        try:
+            while retry_count < max_retries:
+                try:
+                    with connection.cursor() as cursor:
+                        if pills_change >= 0:
+                            cursor.execute("""
+                                UPDATE user_cultivation 
+                                SET pills = pills + %s
+                                WHERE user_id = %s
+                            """, (pills_change, user_id))
+                        else:
+                            # 确保不会减到负数
+                            cursor.execute("""
+                                UPDATE user_cultivation 
+                                SET pills = GREATEST(0, pills + %s)
+                                WHERE user_id = %s
+                            """, (pills_change, user_id))
+                    connection.commit()
+                    profile_cache.invalidate(user_id, user=False)
+                    return True
+                except pymysql.err.OperationalError as e:
+                    if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
+                        retry_count += 1
+                        if retry_count >= max_retries:
+                            print(f"更新丹药数量失败，已达到最大重试次数: {e}")
+                            return False
+                        time.sleep(0.5)  # 短暂延迟后重试
                     else:
-                        # 确保不会减到负数
-                        cursor.execute("""
-                            UPDATE user_cultivation 
-                            SET pills = GREATEST(0, pills + %s)
-                            WHERE user_id = %s
-                        """, (pills_change, user_id))
-                connection.commit()
-                return True
-            except pymysql.err.OperationalError as e:
-                if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
-                    retry_count += 1
-                    if retry_count >= max_retries:
-                        print(f"更新丹药数量失败，已达到最大重试次数: {e}")
+                        print(f"更新丹药数量时发生错误: {e}")
                         return False
-                    time.sleep(0.5)  # 短暂延迟后重试
-                else:
+                except Exception as e:
                     print(f"更新丹药数量时发生错误: {e}")
                     return False
-            except Exception as e:
-                print(f"更新丹药数量时发生错误: {e}")
-                return False
-            finally:
-                if retry_count >= max_retries - 1:  # 只在最后一次尝试后关闭连接
-                    connection.close()
+        finally:
+            connection.close()
     
     def update_next_cost(self, user_id, next_cost, max_retries=3):
         """更新下次突破所需丹药数量"""
         connection = self.get_connection()
         retry_count = 0
         
-        while retry_count < max_retries:
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute("""
-                        UPDATE user_cultivation 
-                        SET next_cost = %s
-                        WHERE user_id = %s
-                    """, (next_cost, user_id))
-                connection.commit()
-                return True
-            except pymysql.err.OperationalError as e:
-                if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
-                    retry_count += 1
-                    if retry_count >= max_retries:
-                        print(f"更新突破花费失败，已达到最大重试次数: {e}")
+        try:
+            while retry_count < max_retries:
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute("""
+                            UPDATE user_cultivation 
+                            SET next_cost = %s
+                            WHERE user_id = %s
+                        """, (next_cost, user_id))
+                    connection.commit()
+                    profile_cache.patch_cultivation(user_id, next_cost=next_cost)
+                    return True
+                except pymysql.err.OperationalError as e:
+                    if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
+                        retry_count += 1
+                        if retry_count >= max_retries:
+                            print(f"更新突破花费失败，已达到最大重试次数: {e}")
+                            return False
+                        time.sleep(0.5)  # 短暂延迟后重试
+                    else:
+                        print(f"更新突破花费时发生错误: {e}")
                         return False
-                    time.sleep(0.5)  # 短暂延迟后重试
-                else:
+                except Exception as e:
                     print(f"更新突破花费时发生错误: {e}")
                     return False
-            except Exception as e:
-                print(f"更新突破花费时发生错误: {e}")
-                return False
-            finally:
-                if retry_count >= max_retries - 1:  # 只在最后一次尝试后关闭连接
-                    connection.close()
+        finally:
+            connection.close()
     
     def attempt_breakthrough(self, user_id, max_retries=3):
         """尝试突破修为"""
@@ -904,65 +1119,67 @@ class DBService:
         connection = self.get_connection()
         retry_count = 0
         
-        while retry_count < max_retries:
-            try:
-                with connection.cursor() as cursor:
-                    # 更新用户积分
-                    cursor.execute("""
-                        UPDATE users SET points = points - %s WHERE user_id = %s
-                    """, (next_cost, user_id))
+        try:
+            while retry_count < max_retries:
+                try:
+                    with connection.cursor() as cursor:
+                        # 更新用户积分
+                        cursor.execute("""
+                            UPDATE users SET points = points - %s WHERE user_id = %s
+                        """, (next_cost, user_id))
                     
-                    # 更新修为
-                    new_stage = current_stage + 1
+                        # 更新修为
+                        new_stage = current_stage + 1
                     
-                    # 计算下一次突破所需灵石 - 基于新境界
-                    new_major_level = new_stage // 3
-                    new_minor_level = new_stage % 3
-                    new_major_linear = (new_major_level + 1) * 200
-                    new_major_exp = 1.25 ** new_major_level
-                    new_minor_multiplier = 1 + (new_minor_level * 0.5)
-                    next_breakthrough_cost = int((base_cost + new_major_linear) * new_major_exp * new_minor_multiplier)
+                        # 计算下一次突破所需灵石 - 基于新境界
+                        new_major_level = new_stage // 3
+                        new_minor_level = new_stage % 3
+                        new_major_linear = (new_major_level + 1) * 200
+                        new_major_exp = 1.25 ** new_major_level
+                        new_minor_multiplier = 1 + (new_minor_level * 0.5)
+                        next_breakthrough_cost = int((base_cost + new_major_linear) * new_major_exp * new_minor_multiplier)
                     
-                    # 如果是大境界突破，减少突破丹
-                    if is_major_breakthrough:
-                        cursor.execute("""
-                            UPDATE user_cultivation 
-                            SET stage = %s, pills = pills - %s, next_cost = %s
-                            WHERE user_id = %s
-                        """, (new_stage, pills_needed, next_breakthrough_cost, user_id))
-                    else:
-                        cursor.execute("""
-                            UPDATE user_cultivation 
-                            SET stage = %s, next_cost = %s
-                            WHERE user_id = %s
-                        """, (new_stage, next_breakthrough_cost, user_id))
+                        # 如果是大境界突破，减少突破丹
+                        if is_major_breakthrough:
+                            cursor.execute("""
+                                UPDATE user_cultivation 
+                                SET stage = %s, pills = pills - %s, next_cost = %s
+                                WHERE user_id = %s
+                            """, (new_stage, pills_needed, next_breakthrough_cost, user_id))
+                        else:
+                            cursor.execute("""
+                                UPDATE user_cultivation 
+                                SET stage = %s, next_cost = %s
+                                WHERE user_id = %s
+                            """, (new_stage, next_breakthrough_cost, user_id))
                 
-                connection.commit()
+                    connection.commit()
+                    profile_cache.invalidate(user_id)
+                    self._notify_stage_change(user_id, new_stage)
                 
-                return {
-                    "success": True,
-                    "message": f"突破成功！消耗了{next_cost}灵石" + 
-                              (f"和{pills_needed}个突破丹" if is_major_breakthrough else "") + 
-                              f"，修为提升到了{CULTIVATION_STAGES[new_stage]}",
-                    "new_stage": CULTIVATION_STAGES[new_stage],
-                    "next_cost": next_breakthrough_cost
-                }
-            except pymysql.err.OperationalError as e:
-                if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
-                    retry_count += 1
-                    if retry_count >= max_retries:
-                        print(f"尝试突破修为失败，已达到最大重试次数: {e}")
-                        return {"success": False, "message": "突破过程中遇到了障碍，请稍后再试"}
-                    time.sleep(0.5)  # 短暂延迟后重试
-                else:
+                    return {
+                        "success": True,
+                        "message": f"突破成功！消耗了{next_cost}灵石" + 
+                                  (f"和{pills_needed}个突破丹" if is_major_breakthrough else "") + 
+                                  f"，修为提升到了{CULTIVATION_STAGES[new_stage]}",
+                        "new_stage": CULTIVATION_STAGES[new_stage],
+                        "next_cost": next_breakthrough_cost
+                    }
+                except pymysql.err.OperationalError as e:
+                    if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
+                        retry_count += 1
+                        if retry_count >= max_retries:
+                            print(f"尝试突破修为失败，已达到最大重试次数: {e}")
+                            return {"success": False, "message": "突破过程中遇到了障碍，请稍后再试"}
+                        time.sleep(0.5)  # 短暂延迟后重试
+                    else:
+                        print(f"尝试突破修为时发生错误: {e}")
+                        return {"success": False, "message": "突破过程中遇到了意外，请稍后再试"}
+                except Exception as e:
                     print(f"尝试突破修为时发生错误: {e}")
-                    return {"success": False, "message": "突破过程中遇到了意外，请稍后再试"}
-            except Exception as e:
-                print(f"尝试突破修为时发生错误: {e}")
-                return {"success": False, "message": "突破过程中遇到了错误，请稍后再试"}
-            finally:
-                if retry_count >= max_retries - 1:  # 只在最后一次尝试后关闭连接
-                    connection.close()
+                    return {"success": False, "message": "突破过程中遇到了错误，请稍后再试"}
+        finally:
+            connection.close()
     
     # ========== 奇遇系统 ==========
     def record_user_event(self, user_id, max_retries=3):
@@ -970,49 +1187,49 @@ class DBService:
         connection = self.get_connection()
         retry_count = 0
         
-        while retry_count < max_retries:
-            try:
-                now = datetime.now()
-                with connection.cursor() as cursor:
-                    # 先检查记录是否存在
-                    cursor.execute("""
-                        SELECT COUNT(*) as count FROM user_events 
-                        WHERE user_id = %s
-                    """, (user_id,))
-                    result = cursor.fetchone()
-                    
-                    if result and result[0] > 0:
-                        # 更新已有记录
+        try:
+            while retry_count < max_retries:
+                try:
+                    now = datetime.now()
+                    with connection.cursor() as cursor:
+                        # 先检查记录是否存在
                         cursor.execute("""
-                            UPDATE user_events 
-                            SET last_trigger = %s, event_count = event_count + 1
+                            SELECT COUNT(*) as count FROM user_events 
                             WHERE user_id = %s
-                        """, (now, user_id))
-                    else:
-                        # 创建新记录
-                        cursor.execute("""
-                            INSERT INTO user_events (user_id, last_trigger, event_count)
-                            VALUES (%s, %s, 1)
-                        """, (user_id, now))
+                        """, (user_id,))
+                        result = cursor.fetchone()
+                    
+                        if result and result[0] > 0:
+                            # 更新已有记录
+                            cursor.execute("""
+                                UPDATE user_events 
+                                SET last_trigger = %s, event_count = event_count + 1
+                                WHERE user_id = %s
+                            """, (now, user_id))
+                        else:
+                            # 创建新记录
+                            cursor.execute("""
+                                INSERT INTO user_events (user_id, last_trigger, event_count)
+                                VALUES (%s, %s, 1)
+                            """, (user_id, now))
                 
-                connection.commit()
-                return True
-            except pymysql.err.OperationalError as e:
-                if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
-                    retry_count += 1
-                    if retry_count >= max_retries:
-                        print(f"记录用户事件失败，已达到最大重试次数: {e}")
+                    connection.commit()
+                    return True
+                except pymysql.err.OperationalError as e:
+                    if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
+                        retry_count += 1
+                        if retry_count >= max_retries:
+                            print(f"记录用户事件失败，已达到最大重试次数: {e}")
+                            return False
+                        time.sleep(0.5)  # 短暂延迟后重试
+                    else:
+                        print(f"记录用户事件时发生错误: {e}")
                         return False
-                    time.sleep(0.5)  # 短暂延迟后重试
-                else:
+                except Exception as e:
                     print(f"记录用户事件时发生错误: {e}")
                     return False
-            except Exception as e:
-                print(f"记录用户事件时发生错误: {e}")
-                return False
-            finally:
-                if retry_count >= max_retries - 1:  # 只在最后一次尝试后关闭连接
-                    connection.close()
+        finally:
+            connection.close()
     
     # ========== 打劫系统 ==========
     def update_rob_record(self, user_id, max_retries=3):
@@ -1020,49 +1237,49 @@ class DBService:
         connection = self.get_connection()
         retry_count = 0
         
-        while retry_count < max_retries:
-            try:
-                now = datetime.now()
-                with connection.cursor() as cursor:
-                    # 先检查记录是否存在
-                    cursor.execute("""
-                        SELECT COUNT(*) as count FROM rob_records 
-                        WHERE user_id = %s
-                    """, (user_id,))
-                    result = cursor.fetchone()
-                    
-                    if result and result[0] > 0:
-                        # 更新现有记录
+        try:
+            while retry_count < max_retries:
+                try:
+                    now = datetime.now()
+                    with connection.cursor() as cursor:
+                        # 先检查记录是否存在
                         cursor.execute("""
-                            UPDATE rob_records 
-                            SET last_rob = %s, count = count + 1
+                            SELECT COUNT(*) as count FROM rob_records 
                             WHERE user_id = %s
-                        """, (now, user_id))
-                    else:
-                        # 创建新记录
-                        cursor.execute("""
-                            INSERT INTO rob_records (user_id, last_rob, count)
-                            VALUES (%s, %s, 1)
-                        """, (user_id, now))
+                        """, (user_id,))
+                        result = cursor.fetchone()
+                    
+                        if result and result[0] > 0:
+                            # 更新现有记录
+                            cursor.execute("""
+                                UPDATE rob_records 
+                                SET last_rob = %s, count = count + 1
+                                WHERE user_id = %s
+                            """, (now, user_id))
+                        else:
+                            # 创建新记录
+                            cursor.execute("""
+                                INSERT INTO rob_records (user_id, last_rob, count)
+                                VALUES (%s, %s, 1)
+                            """, (user_id, now))
                         
-                connection.commit()
-                return True
-            except pymysql.err.OperationalError as e:
-                if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
-                    retry_count += 1
-                    if retry_count >= max_retries:
-                        print(f"更新打劫记录失败，已达到最大重试次数: {e}")
+                    connection.commit()
+                    return True
+                except pymysql.err.OperationalError as e:
+                    if "Deadlock" in str(e) or "Lock wait timeout" in str(e):
+                        retry_count += 1
+                        if retry_count >= max_retries:
+                            print(f"更新打劫记录失败，已达到最大重试次数: {e}")
+                            return False
+                        time.sleep(0.5)  # 短暂延迟后重试
+                    else:
+                        print(f"更新打劫记录时发生错误: {e}")
                         return False
-                    time.sleep(0.5)  # 短暂延迟后重试
-                else:
+                except Exception as e:
                     print(f"更新打劫记录时发生错误: {e}")
                     return False
-            except Exception as e:
-                print(f"更新打劫记录时发生错误: {e}")
-                return False
-            finally:
-                if retry_count >= max_retries - 1:  # 只在最后一次尝试后关闭连接
-                    connection.close()
+        finally:
+            connection.close()
     
     def get_rob_record(self, user_id):
         """获取打劫记录"""
@@ -1695,6 +1912,7 @@ class DBService:
                 """, (increment, user_id))
                     
             connection.commit()
+            profile_cache.invalidate(user_id, cultivation=False)
             return books_uploaded
         except Exception as e:
             print(f"更新书籍上传数量出错: {e}")
@@ -1821,26 +2039,16 @@ class DBService:
             
     def is_immortal(self, user_id):
         """检查用户是否为地仙"""
-        connection = self.get_connection()
         try:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT stage FROM user_cultivation
-                    WHERE user_id = %s
-                """, (user_id,))
-                result = cursor.fetchone()
-                
-                if not result:
-                    return False
-                
-                # 检查是否已达到地仙境界
-                from bot.config.config import CULTIVATION_STAGES
-                return result[0] >= len(CULTIVATION_STAGES)
+            cultivation = self.get_cultivation(user_id)
+            if not cultivation:
+                return False
+            
+            # 检查是否已达到地仙境界
+            return cultivation['stage'] >= len(CULTIVATION_STAGES)
         except Exception as e:
             print(f"检查用户是否为地仙出错: {e}")
             return False
-        finally:
-            connection.close()
 
     def get_all_pending_catgirls(self):
         """获取所有处于等待确认状态的猫娘记录"""
@@ -2229,6 +2437,19 @@ class DBService:
         finally:
             connection.close()
 
+    def get_today_lottery_count(self):
+        """获取今天已经开了几期大乐透"""
+        connection = self.get_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM lottery_numbers
+                    WHERE DATE(created_at) = CURDATE()
+                """)
+                return cursor.fetchone()[0]
+        finally:
+            connection.close()
+
     # 兑换码相关方法
     def add_redemption_code(self, code, creator_id):
         """添加新的兑换码"""
@@ -0,0 +1,178 @@
+import asyncio
+import heapq
+import itertools
+import shutil
+import time
+from collections import deque
+from bot.config.config import BOOK_DOWNLOAD_PATH, DOWNLOAD_WORKERS, DOWNLOAD_MIN_FREE_MB
+
+class DownloadJob:
+    """一个排队中的下载任务"""
+
+    def __init__(self, user_id, file_size, func, on_rejected=None):
+        self.user_id = user_id
+        self.file_size = file_size or 0
+        self.func = func  # 无参数的协程函数，执行实际的下载处理
+        self.on_rejected = on_rejected  # 磁盘空间不足时调用，参数为原因
+        self.queued_at = time.monotonic()
+        self.seq = 0
+
+class DownloadScheduler:
+    """全局下载调度器
+
+    - 固定数量的下载worker，总并发不随上传人数增长
+    - 用户之间轮询，一个人一次丢几十本书不会堵住其他人
+    - 同一用户的文件按大小从小到大处理
+    - 开始下载前检查磁盘剩余空间
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, min_free_mb=DOWNLOAD_MIN_FREE_MB):
+        self.workers = workers
+        self.min_free_bytes = min_free_mb * 1024 * 1024
+        self._queues = {}  # {用户ID: [(文件大小, 序号, DownloadJob)]}，按文件大小排序的堆
+        self._rotation = deque()  # 有排队任务的用户，按轮询顺序排列
+        self._seq = itertools.count()
+        self._tasks = []
+        self._wakeup = None
+
+        # 统计信息
+        self._running = 0
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._disk_rejected = 0
+        self._max_depth = 0
+        self._total_wait = 0.0
+
+    def submit(self, user_id, file_size, func, on_rejected=None):
+        """提交下载任务，返回任务前面还在排队的文件数"""
+        job = DownloadJob(user_id, file_size, func, on_rejected)
+        job.seq = next(self._seq)
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = []
+            self._rotation.append(user_id)
+        heapq.heappush(queue, (job.file_size, job.seq, job))
+
+        self._submitted += 1
+        self._max_depth = max(self._max_depth, self.queue_depth())
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return self.get_position(job)
+
+    def get_position(self, job):
+        """估算任务前面还有多少个文件（不考虑之后新加入的任务）"""
+        queue = self._queues.get(job.user_id)
+        if not queue:
+            return 0
+        # 在自己的队列中排第几个
+        rank = sum(1 for size, seq, _ in queue if (size, seq) < (job.file_size, job.seq))
+        position = rank
+        # 轮询中排在前面的用户每轮多处理一个
+        before = True
+        for user_id in self._rotation:
+            if user_id == job.user_id:
+                before = False
+                continue
+            position += min(len(self._queues[user_id]), rank + 1 if before else rank)
+        return position
+
+    def queue_depth(self):
+        """排队中的文件总数"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _next_job(self):
+        """按轮询顺序取出下一个任务"""
+        if not self._rotation:
+            return None
+        user_id = self._rotation.popleft()
+        queue = self._queues[user_id]
+        _, _, job = heapq.heappop(queue)
+        if queue:
+            self._rotation.append(user_id)
+        else:
+            del self._queues[user_id]
+        return job
+
+    def _has_disk_space(self, file_size):
+        """检查下载该文件后磁盘剩余空间是否仍不低于下限"""
+        try:
+            free = shutil.disk_usage(BOOK_DOWNLOAD_PATH).free
+        except OSError as e:
+            print(f"检查磁盘空间失败: {e}")
+            return True
+        return free - file_size >= self.min_free_bytes
+
+    async def _run_job(self, job):
+        """执行一个任务"""
+        self._started += 1
+        self._total_wait += time.monotonic() - job.queued_at
+
+        if not self._has_disk_space(job.file_size):
+            self._disk_rejected += 1
+            if job.on_rejected:
+                try:
+                    await job.on_rejected("服务器磁盘空间不足，暂时无法收录书籍")
+                except Exception as e:
+                    print(f"通知下载任务被拒绝时出错: {e}")
+            return
+
+        self._running += 1
+        try:
+            await job.func()
+            self._completed += 1
+        except Exception as e:
+            self._failed += 1
+            print(f"下载任务执行出错: {e}")
+        finally:
+            self._running -= 1
+
+    async def _worker(self):
+        """下载worker：不断取出任务执行，没有任务时等待"""
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run_job(job)
+
+    def start(self):
+        """启动下载worker（需要在事件循环中调用）"""
+        if not self._tasks:
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            print(f"下载调度器已启动，worker数 {self.workers}")
+
+    async def stop(self):
+        """停止下载worker，正在下载的任务会被取消"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        pending = self.queue_depth()
+        if pending:
+            print(f"下载调度器已停止，丢弃 {pending} 个排队中的文件")
+
+    def get_stats(self):
+        """获取调度统计信息"""
+        return {
+            'workers': self.workers,
+            'running': self._running,
+            'queued': self.queue_depth(),
+            'users_waiting': len(self._queues),
+            'max_depth': self._max_depth,
+            'submitted': self._submitted,
+            'completed': self._completed,
+            'failed': self._failed,
+            'disk_rejected': self._disk_rejected,
+            'avg_wait_ms': round(self._total_wait / self._started * 1000, 1) if self._started else 0.0
+        }
+
+# 创建全局下载调度器实例
+download_scheduler = DownloadScheduler()
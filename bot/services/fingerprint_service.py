@@ -0,0 +1,143 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from bot.config.config import NEAR_DUP_ENABLED, NEAR_DUP_THRESHOLD, FINGERPRINT_MAX_CHARS, FINGERPRINT_WORKERS
+from bot.services.async_db_service import async_db_service
+from bot.utils.fingerprint import SIGNATURE_SIZE, compute_file_signature, signature_similarity
+
+# LSH分段：签名分成LSH_BANDS段，任意一段完全相同的书籍才会进入候选
+LSH_BANDS = 8
+LSH_ROWS = SIGNATURE_SIZE // LSH_BANDS
+# 签名中每个值占的字节数（array('I')）
+_VALUE_BYTES = 4
+
+class FingerprintService:
+    """书籍近似重复检测
+
+    为每本收录的书计算MinHash签名，并在内存中维护LSH索引：
+    新书只和LSH命中的少量候选比较相似度，不需要和整个书库逐一比较。
+    """
+
+    def __init__(self, threshold=NEAR_DUP_THRESHOLD, workers=FINGERPRINT_WORKERS):
+        self.threshold = threshold
+        self.workers = workers
+        self._executor = None
+        self._signatures = {}  # {MD5: 签名}
+        self._bands = {}  # {(段号, 段内容): {MD5}}
+        self._pending = set()  # 已加入索引、所在批次还未提交的MD5
+
+        # 统计信息
+        self._checks = 0
+        self._candidates = 0
+        self._near_duplicates = 0
+
+    async def load(self):
+        """从数据库加载所有书籍签名并建立LSH索引"""
+        if not NEAR_DUP_ENABLED:
+            return
+        rows = await async_db_service.get_book_fingerprints()
+        for md5, signature in rows:
+            self._add_to_index(md5, bytes(signature))
+        print(f"已加载 {len(self._signatures)} 个书籍指纹")
+
+    def _band_keys(self, signature):
+        step = LSH_ROWS * _VALUE_BYTES
+        return [(band, signature[band * step:(band + 1) * step]) for band in range(LSH_BANDS)]
+
+    def _add_to_index(self, md5, signature):
+        if md5 in self._signatures:
+            return
+        self._signatures[md5] = signature
+        for key in self._band_keys(signature):
+            self._bands.setdefault(key, set()).add(md5)
+
+    async def compute(self, file_path, file_ext):
+        """在子进程中计算书籍签名，未启用或无法计算时返回None
+
+        签名计算是纯Python的CPU密集循环，放在线程中会一直占用GIL，批量上传时拖慢所有命令的响应。
+        """
+        if not NEAR_DUP_ENABLED:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, compute_file_signature, file_path, file_ext, FINGERPRINT_MAX_CHARS
+            )
+        except BrokenProcessPool as e:
+            # 子进程异常退出，下次计算时重建进程池，这本书跳过近似重复检测
+            print(f"计算书籍指纹的进程池异常: {e}")
+            self._executor = None
+            return None
+
+    def shutdown(self):
+        """关闭计算签名的进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def find_similar(self, signature):
+        """查找与签名最相似的已收录书籍，相似度达到阈值时返回(MD5, 相似度)，否则返回None"""
+        if signature is None:
+            return None
+        self._checks += 1
+
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._bands.get(key, ()))
+        self._candidates += len(candidates)
+
+        best = None
+        for md5 in candidates:
+            similarity = signature_similarity(signature, self._signatures[md5])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (md5, similarity)
+        if best:
+            self._near_duplicates += 1
+        return best
+
+    def add(self, md5, signature):
+        """把新书加入内存索引，同一批上传中的近似副本也能被识别；批次提交成功后再调用save保存签名"""
+        if signature is None or md5 in self._signatures:
+            return
+        self._add_to_index(md5, signature)
+        self._pending.add(md5)
+
+    def is_pending(self, md5):
+        """书籍所在的批次是否还未提交"""
+        return md5 in self._pending
+
+    async def save(self, md5_list):
+        """批次提交成功后保存这些书籍的签名"""
+        for md5 in md5_list:
+            if md5 in self._pending:
+                self._pending.discard(md5)
+                await async_db_service.add_book_fingerprint(md5, self._signatures[md5])
+
+    def remove(self, md5_list):
+        """批次提交失败时把这些书籍移出索引"""
+        for md5 in md5_list:
+            if md5 not in self._pending:
+                continue
+            self._pending.discard(md5)
+            signature = self._signatures.pop(md5)
+            for key in self._band_keys(signature):
+                band = self._bands[key]
+                band.discard(md5)
+                if not band:
+                    del self._bands[key]
+
+    def get_stats(self):
+        """获取近似重复检测统计"""
+        return {
+            'enabled': NEAR_DUP_ENABLED,
+            'threshold': self.threshold,
+            'indexed': len(self._signatures),
+            'checks': self._checks,
+            'avg_candidates': round(self._candidates / self._checks, 1) if self._checks else 0.0,
+            'near_duplicates': self._near_duplicates
+        }
+
+# 创建全局近似重复检测服务实例
+fingerprint_service = FingerprintService()
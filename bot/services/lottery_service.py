@@ -1,6 +1,7 @@
 import random
 from datetime import datetime
 from bot.services.db_service import db_service
+from bot.services.config_registry import config_registry
 
 # 大乐透游戏状态
 class LotteryService:
@@ -16,9 +17,21 @@ class LotteryService:
         self._ensure_lottery_tables()
         
         # 从数据库加载当前奖池金额
-        pool_info = self.get_lottery_pool()
+        pool_info = db_service.get_lottery_pool()
         if pool_info:
             self.current_pool_amount = pool_info['amount']
+        
+        # 其他进程修改奖池或号码后，定时重新加载时同步到本服务
+        config_registry.subscribe(self._on_config_change)
+    
+    def _on_config_change(self, key, value):
+        """配置注册表变更通知"""
+        if key == 'lottery_pool' and value:
+            self.current_pool_amount = value['amount']
+        elif key == 'lottery_numbers' and value:
+            self.current_numbers = list(value)
+        elif key == 'lottery_message_id':
+            self.lottery_message_id = value
     
     def _ensure_lottery_tables(self):
         """确保数据库中有大乐透相关的表"""
@@ -36,6 +49,7 @@ class LotteryService:
         
         # 保存到数据库
         db_service.save_lottery_numbers(self.current_numbers)
+        config_registry.set_lottery_numbers(self.current_numbers)
         
         return self.current_numbers
     
@@ -92,6 +106,7 @@ class LotteryService:
         
         # 更新奖池金额到数据库
         db_service.update_lottery_pool(self.current_pool_amount)
+        config_registry.set_lottery_pool(self.current_pool_amount)
         
         # 添加到下注记录
         if user_id not in self.bets:
@@ -179,6 +194,7 @@ class LotteryService:
         
         # 更新数据库中的奖池金额
         db_service.update_lottery_pool(self.current_pool_amount)
+        config_registry.set_lottery_pool(self.current_pool_amount)
         
         # 重置当前游戏状态
         db_service.reset_lottery_bets()
@@ -196,26 +212,31 @@ class LotteryService:
         """设置大乐透公告消息ID"""
         self.lottery_message_id = message_id
         db_service.save_lottery_message_id(message_id)
+        config_registry.set_lottery_message_id(message_id)
     
     def get_lottery_message_id(self):
         """获取当前大乐透公告消息ID"""
         if not self.lottery_message_id:
-            # 从数据库加载
-            self.lottery_message_id = db_service.get_lottery_message_id()
+            # 从配置注册表加载
+            self.lottery_message_id = config_registry.get_lottery_message_id()
         return self.lottery_message_id
     
     def get_lottery_pool(self):
         """获取当前奖池信息"""
-        return db_service.get_lottery_pool()
+        return config_registry.get_lottery_pool()
     
     def get_current_numbers(self):
         """获取当前的中奖号码"""
         if not self.current_numbers:
-            # 从数据库加载
-            numbers = db_service.get_lottery_numbers()
+            # 从配置注册表加载
+            numbers = config_registry.get_lottery_numbers()
             if numbers:
                 self.current_numbers = numbers
         return self.current_numbers
+    
+    def get_today_lottery(self):
+        """获取今天的大乐透记录"""
+        return config_registry.get_today_lottery()
 
 # 创建全局服务实例
 lottery_service = LotteryService() 
\ No newline at end of file
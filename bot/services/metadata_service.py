@@ -0,0 +1,92 @@
+import asyncio
+import os
+from bot.config.config import METADATA_WORKERS
+from bot.services.async_db_service import async_db_service
+from bot.services.compression_service import original_path
+from bot.services.catalog_index import catalog_index
+from bot.utils.book_metadata import extract_metadata
+
+class MetadataService:
+    """书籍元数据后台提取
+
+    书籍收录后加入队列，由后台worker提取编码、字数、章节数、标题、作者和开头几行并写入book_metadata表；
+    书单和搜索只读表中预先算好的数据，不在请求中读取书籍文件。
+    """
+
+    def __init__(self, workers=METADATA_WORKERS):
+        self.workers = workers
+        self._queue = None
+        self._pending = set()  # 排队中的路径，避免重复加入
+        self._tasks = []
+
+        # 统计信息
+        self._extracted = 0
+        self._failures = 0
+
+    def enqueue(self, path):
+        """把书籍加入提取队列"""
+        if self._queue is None or path in self._pending:
+            return
+        self._pending.add(path)
+        self._queue.put_nowait(path)
+
+    async def _extract(self, path):
+        """提取一本书的元数据并保存"""
+        file_ext = os.path.splitext(original_path(path))[1].lower()
+        metadata = await asyncio.to_thread(extract_metadata, path, file_ext)
+        await async_db_service.add_book_metadata(metadata)
+        # 精品书籍把MD5记到premium_books表中，书单按MD5查询元数据
+        await catalog_index.set_md5(path, metadata['md5'])
+
+    async def _worker(self):
+        """提取worker：不断从队列中取出书籍处理"""
+        while True:
+            path = await self._queue.get()
+            try:
+                if os.path.exists(path):
+                    await self._extract(path)
+                    self._extracted += 1
+            except Exception as e:
+                print(f"提取书籍元数据失败 {path}: {e}")
+                self._failures += 1
+            finally:
+                self._pending.discard(path)
+                self._queue.task_done()
+
+    async def scan_premium_books(self):
+        """把还没有元数据的精品书籍加入队列（启动时在目录索引加载后执行一次）"""
+        known = set(await async_db_service.get_book_metadata_md5s())
+        missing = [book['path'] for book in catalog_index.get_books() if book['md5'] not in known]
+        for path in missing:
+            self.enqueue(path)
+        if missing:
+            print(f"{len(missing)} 本精品书籍等待提取元数据")
+
+    def start(self):
+        """启动提取worker（需要在事件循环中调用）"""
+        if not self._tasks:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            print(f"书籍元数据提取已启动，worker数 {self.workers}")
+
+    async def stop(self):
+        """停止提取worker，未处理的书籍下次启动时重新扫描"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def get_stats(self):
+        """获取元数据提取统计"""
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'extracted': self._extracted,
+            'failures': self._failures
+        }
+
+# 创建全局元数据提取服务实例
+metadata_service = MetadataService()
@@ -0,0 +1,116 @@
+import threading
+from bot.config.config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+from bot.utils.cache import LRUTTLCache
+
+# 联表查询结果中属于user_cultivation表的字段
+CULTIVATION_FIELDS = ('stage', 'pills', 'next_cost')
+
+class ProfileCache:
+    """用户信息(users)和修仙信息(user_cultivation)的进程内读缓存
+
+    - 读方法未命中时查询数据库并回填
+    - 所有修改这两张表的方法都要调用patch或invalidate
+    - 回填前检查读取期间是否发生过写入，避免把旧数据写回缓存
+    """
+
+    def __init__(self, max_size=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self._cache = LRUTTLCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self._epoch = 0  # 每次写入都会递增
+
+    def begin_read(self):
+        """开始一次数据库读取，返回回填时需要的版本号"""
+        return self._epoch
+
+    def _get(self, kind, user_id):
+        value = self._cache.get((kind, user_id))
+        return dict(value) if value is not None else None
+
+    def _put(self, kind, user_id, row, token):
+        with self._lock:
+            # 读取期间有写入，放弃回填
+            if token != self._epoch:
+                return
+            self._cache.set((kind, user_id), dict(row))
+
+    def get_user(self, user_id):
+        """获取缓存的users行"""
+        return self._get('user', user_id)
+
+    def put_user(self, user_id, row, token):
+        """回填users行"""
+        self._put('user', user_id, row, token)
+
+    def get_cultivation(self, user_id):
+        """获取缓存的user_cultivation行"""
+        return self._get('cultivation', user_id)
+
+    def put_cultivation(self, user_id, row, token):
+        """回填user_cultivation行"""
+        self._put('cultivation', user_id, row, token)
+
+    def get_profile(self, user_id):
+        """获取ensure_user_profile的结果（用户信息和修仙信息都已缓存，且已确认各项记录齐全）"""
+        if not self._cache.peek(('ensured', user_id)):
+            return None
+        user = self.get_user(user_id)
+        cultivation = self.get_cultivation(user_id)
+        if user is None or cultivation is None:
+            return None
+        user.update({field: cultivation[field] for field in CULTIVATION_FIELDS})
+        return user
+
+    def put_profile(self, user_id, profile, token):
+        """回填ensure_user_profile的结果"""
+        user = {key: value for key, value in profile.items() if key not in CULTIVATION_FIELDS}
+        cultivation = {'user_id': user_id}
+        cultivation.update({field: profile[field] for field in CULTIVATION_FIELDS})
+        with self._lock:
+            if token != self._epoch:
+                return
+            self._cache.set(('user', user_id), user)
+            self._cache.set(('cultivation', user_id), cultivation)
+            self._cache.set(('ensured', user_id), True)
+
+    def patch_user(self, user_id, **fields):
+        """更新缓存中users行的字段"""
+        with self._lock:
+            self._epoch += 1
+            self._cache.update(('user', user_id), lambda row: row.update(fields))
+
+    def add_points(self, user_id, delta):
+        """缓存中的积分累加delta"""
+        def apply(row):
+            row['points'] = (row.get('points') or 0) + delta
+        with self._lock:
+            self._epoch += 1
+            self._cache.update(('user', user_id), apply)
+
+    def patch_cultivation(self, user_id, **fields):
+        """更新缓存中user_cultivation行的字段"""
+        with self._lock:
+            self._epoch += 1
+            self._cache.update(('cultivation', user_id), lambda row: row.update(fields))
+
+    def invalidate(self, user_id, user=True, cultivation=True):
+        """删除用户的缓存"""
+        with self._lock:
+            self._epoch += 1
+            if user:
+                self._cache.pop(('user', user_id))
+            if cultivation:
+                self._cache.pop(('cultivation', user_id))
+            self._cache.pop(('ensured', user_id))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._epoch += 1
+            self._cache.clear()
+
+    def get_stats(self):
+        """获取缓存命中统计"""
+        return self._cache.get_stats()
+
+# 创建全局用户缓存实例
+profile_cache = ProfileCache()
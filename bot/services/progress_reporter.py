@@ -0,0 +1,170 @@
+import asyncio
+import time
+import pyrogram
+from bot.config.config import PROGRESS_UPDATE_INTERVAL
+
+# 状态消息中最多显示多少个已完成的文件
+MAX_FINISHED_LINES = 20
+
+def format_speed(speed):
+    """格式化下载速度"""
+    if speed < 1024:
+        return f"{speed:.2f} B/s"
+    elif speed < 1024 * 1024:
+        return f"{speed/1024:.2f} KB/s"
+    return f"{speed/(1024*1024):.2f} MB/s"
+
+class _ChatProgress:
+    """一个聊天中正在进行的下载及其共用的状态消息"""
+
+    def __init__(self, client, chat_id, reply_to_message_id):
+        self.client = client
+        self.chat_id = chat_id
+        self.reply_to_message_id = reply_to_message_id
+        self.items = {}  # {任务ID: 进度}，按开始顺序排列
+        self.message = None
+        self.last_text = None
+        self.next_edit = 0.0
+        self.dirty = False
+        self.task = None
+
+    def all_finished(self):
+        return all(item['result'] is not None for item in self.items.values())
+
+    def render(self):
+        """生成状态消息文本"""
+        active = [item for item in self.items.values() if item['result'] is None]
+        finished = [item for item in self.items.values() if item['result'] is not None]
+
+        if active:
+            lines = [f"⏳ 正在下载 {len(active)} 个文件（已完成 {len(finished)} 个）"]
+        else:
+            lines = [f"📥 下载结束，共 {len(finished)} 个文件"]
+
+        if len(finished) > MAX_FINISHED_LINES:
+            lines.append(f"……省略较早完成的 {len(finished) - MAX_FINISHED_LINES} 个文件")
+        lines.extend(item['result'] for item in finished[-MAX_FINISHED_LINES:])
+
+        now = time.monotonic()
+        for item in active:
+            total = max(item['total'], 1)
+            percent = item['current'] * 100 / total
+            speed = item['current'] / max(now - item['start'], 0.1)
+            lines.append(f"⏳ {item['name']}: {percent:.0f}% ({format_speed(speed)})")
+        return "\n".join(lines)
+
+class ProgressReporter:
+    """下载进度汇报
+
+    同一个聊天中同时进行的下载共用一条状态消息；
+    每个聊天按时间限频（PROGRESS_UPDATE_INTERVAL秒最多编辑一次），文本没有变化时不编辑。
+    """
+
+    def __init__(self, interval=PROGRESS_UPDATE_INTERVAL):
+        self.interval = interval
+        self._chats = {}  # {聊天ID: _ChatProgress}
+
+        # 统计信息
+        self._updates = 0
+        self._edits = 0
+        self._unchanged = 0
+        self._flood_waits = 0
+
+    def start(self, client, chat_id, item_id, name, total=0, reply_to_message_id=None):
+        """开始汇报一个下载"""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _ChatProgress(client, chat_id, reply_to_message_id)
+        chat.items[item_id] = {
+            'name': name,
+            'current': 0,
+            'total': total or 0,
+            'start': time.monotonic(),
+            'result': None
+        }
+        self._schedule(chat)
+
+    async def update(self, current, total, chat_id, item_id):
+        """下载进度回调（作为pyrogram的progress参数），只记录进度，由后台任务限频编辑"""
+        chat = self._chats.get(chat_id)
+        if chat is None or item_id not in chat.items:
+            return
+        item = chat.items[item_id]
+        item['current'] = current
+        item['total'] = total
+        self._updates += 1
+        self._schedule(chat)
+
+    def finish(self, chat_id, item_id, result):
+        """结束一个下载，result为显示在状态消息中的结果"""
+        chat = self._chats.get(chat_id)
+        if chat is None or item_id not in chat.items:
+            return
+        chat.items[item_id]['result'] = result
+        self._schedule(chat)
+
+    def _schedule(self, chat):
+        chat.dirty = True
+        if chat.task is None:
+            chat.task = asyncio.create_task(self._flush(chat))
+
+    async def _flush(self, chat):
+        """编辑状态消息，直到没有新的进度"""
+        try:
+            while chat.dirty:
+                # 全部结束时立即显示结果，否则等到允许编辑的时间
+                wait = chat.next_edit - time.monotonic()
+                if wait > 0 and not chat.all_finished():
+                    await asyncio.sleep(wait)
+
+                chat.dirty = False
+                await self._edit(chat)
+
+                if chat.all_finished() and not chat.dirty:
+                    # 这一组下载已结束，之后的下载使用新的状态消息
+                    if self._chats.get(chat.chat_id) is chat:
+                        del self._chats[chat.chat_id]
+                    break
+        finally:
+            chat.task = None
+
+    async def _edit(self, chat):
+        text = chat.render()
+        if text == chat.last_text:
+            self._unchanged += 1
+            return
+
+        try:
+            if chat.message is None:
+                chat.message = await chat.client.send_message(
+                    chat.chat_id, text, reply_to_message_id=chat.reply_to_message_id
+                )
+            else:
+                await chat.message.edit_text(text)
+            chat.last_text = text
+            self._edits += 1
+            chat.next_edit = time.monotonic() + self.interval
+        except pyrogram.errors.exceptions.flood_420.FloodWait as e:
+            print(f"FloodWait: 需要等待 {e.value} 秒以更新下载进度")
+            self._flood_waits += 1
+            chat.dirty = True
+            chat.next_edit = time.monotonic() + e.value
+            if chat.all_finished():
+                await asyncio.sleep(e.value)
+        except pyrogram.errors.MessageNotModified:
+            chat.last_text = text
+        except Exception as e:
+            print(f"更新进度消息失败: {e}")
+
+    def get_stats(self):
+        """获取进度汇报统计"""
+        return {
+            'active_chats': len(self._chats),
+            'updates': self._updates,
+            'edits': self._edits,
+            'unchanged': self._unchanged,
+            'flood_waits': self._flood_waits
+        }
+
+# 创建全局进度汇报实例
+progress_reporter = ProgressReporter()
@@ -0,0 +1,32 @@
+import secrets
+from bot.config.config import SEARCH_CURSOR_SIZE, SEARCH_CURSOR_TTL
+from bot.utils.cache import LRUTTLCache
+
+class SearchCursorCache:
+    """搜索结果游标
+
+    /sou 的结果（书籍编号列表）按短ID缓存一段时间，翻页按钮只携带“游标ID:页码”，
+    翻页时直接切片，不再重新搜索，也不受Telegram回调数据64字节的限制。
+    """
+
+    def __init__(self, max_size=SEARCH_CURSOR_SIZE, ttl=SEARCH_CURSOR_TTL):
+        self._cache = LRUTTLCache(max_size, ttl)
+
+    def create(self, search_term, book_ids):
+        """保存一次搜索结果，返回游标ID"""
+        cursor_id = secrets.token_hex(4)
+        while self._cache.peek(cursor_id) is not None:
+            cursor_id = secrets.token_hex(4)
+        self._cache.set(cursor_id, (search_term, list(book_ids)))
+        return cursor_id
+
+    def get(self, cursor_id):
+        """获取游标对应的(搜索关键词, 书籍编号列表)，过期时返回None"""
+        return self._cache.get(cursor_id)
+
+    def get_stats(self):
+        """获取游标缓存统计"""
+        return self._cache.get_stats()
+
+# 创建全局搜索结果游标实例
+search_cursors = SearchCursorCache()
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from datetime import datetime
+from bot.config.config import (
+    POINTS_FLUSH_INTERVAL_MS, POINTS_FLUSH_THRESHOLD, EVENT_FLUSH_INTERVAL_MS, EVENT_FLUSH_THRESHOLD
+)
+from bot.services.async_db_service import async_db_service
+
+class WriteBehindBuffer:
+    """写回缓冲：在内存中按键合并增量，定时或积攒到一定数量后一次性批量写入数据库"""
+
+    def __init__(self, name, flush_interval_ms, flush_threshold):
+        self.name = name
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_threshold = flush_threshold
+        self._pending = {}  # {键: 累计增量}
+        self._task = None
+        self._wakeup = None
+        self._flush_lock = None
+
+        # 统计信息
+        self._increments = 0
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._failures = 0
+        self._last_flush_ms = 0.0
+
+    def _merge(self, pending, key, delta):
+        """合并增量，子类可覆盖以支持非数值的增量"""
+        pending[key] = pending.get(key, 0) + delta
+
+    async def _write(self, batch):
+        """把一批合并后的增量写入数据库，由子类实现"""
+        raise NotImplementedError
+
+    def add(self, key, delta):
+        """记录一次增量（不访问数据库）"""
+        self._merge(self._pending, key, delta)
+        self._increments += 1
+        if len(self._pending) >= self.flush_threshold and self._wakeup is not None:
+            self._wakeup.set()
+
+    def get_pending(self, key, default=0):
+        """获取某个键尚未写入数据库的增量"""
+        return self._pending.get(key, default)
+
+    async def flush(self, keys=None):
+        """立即写入缓冲的增量，keys为空时写入全部"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if keys is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {key: self._pending.pop(key) for key in keys if key in self._pending}
+            if not batch:
+                return 0
+
+            start = time.monotonic()
+            try:
+                await self._write(batch)
+            except Exception as e:
+                # 写入失败，把增量放回缓冲等待下次重试
+                for key, delta in batch.items():
+                    self._merge(self._pending, key, delta)
+                self._failures += 1
+                print(f"批量写入{self.name}失败，{len(batch)} 条记录将在下次重试: {e}")
+                return 0
+
+            self._flushes += 1
+            self._rows_flushed += len(batch)
+            self._last_flush_ms = round((time.monotonic() - start) * 1000, 1)
+            return len(batch)
+
+    async def _run(self):
+        """后台循环：每隔flush_interval或缓冲达到阈值时写入"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """启动后台写入任务（需要在事件循环中调用）"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            print(f"{self.name}写回缓冲已启动，间隔 {int(self.flush_interval * 1000)}ms，阈值 {self.flush_threshold}")
+
+    async def stop(self):
+        """停止后台任务并写入剩余的增量"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        flushed = await self.flush()
+        if flushed:
+            print(f"{self.name}写回缓冲已在关闭前写入 {flushed} 条记录")
+
+    def get_stats(self):
+        """获取缓冲统计信息"""
+        return {
+            'pending': len(self._pending),
+            'increments': self._increments,
+            'flushes': self._flushes,
+            'rows_flushed': self._rows_flushed,
+            'failures': self._failures,
+            'last_flush_ms': self._last_flush_ms
+        }
+
+class PointsBuffer(WriteBehindBuffer):
+    """水群奖励积分的写回缓冲
+
+    只用于不需要立即知道余额的加分；扣分等需要准确余额的操作前应先调用flush_user。
+    """
+
+    def __init__(self):
+        super().__init__("积分", POINTS_FLUSH_INTERVAL_MS, POINTS_FLUSH_THRESHOLD)
+
+    async def _write(self, batch):
+        await async_db_service.add_points_batch(batch)
+
+    async def flush_user(self, user_id):
+        """写入某个用户缓冲中的积分，之后读到的余额是准确的"""
+        if user_id in self._pending:
+            await self.flush([user_id])
+
+class EventCounterBuffer(WriteBehindBuffer):
+    """奇遇计数（user_events）的写回缓冲，增量为(次数, 最后触发时间)"""
+
+    def __init__(self):
+        super().__init__("奇遇计数", EVENT_FLUSH_INTERVAL_MS, EVENT_FLUSH_THRESHOLD)
+
+    def _merge(self, pending, key, delta):
+        count, last_trigger = delta
+        if key in pending:
+            pending_count, pending_trigger = pending[key]
+            pending[key] = (pending_count + count, max(pending_trigger, last_trigger))
+        else:
+            pending[key] = (count, last_trigger)
+
+    async def _write(self, batch):
+        await async_db_service.add_event_counts_batch(batch)
+
+    def record(self, user_id):
+        """记录用户一次事件触发"""
+        self.add(user_id, (1, datetime.now()))
+
+# 创建全局积分写回缓冲实例
+points_buffer = PointsBuffer()
+
+# 创建全局奇遇计数写回缓冲实例
+event_counter_buffer = EventCounterBuffer()
@@ -0,0 +1,174 @@
+import codecs
+import gzip
+import hashlib
+import io
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from bot.utils.fingerprint import HTML_TAG_RE, candidate_encodings
+
+# 检测编码时读取的字节数
+ENCODING_SAMPLE_BYTES = 256 * 1024
+# 分块读取txt时每块的字节数
+READ_CHUNK_BYTES = 1024 * 1024
+# 预览保留的行数和每行最大长度
+PREVIEW_LINES = 5
+PREVIEW_LINE_CHARS = 80
+# 章节标题，如“第一章”“第12回”“卷三”
+CHAPTER_RE = re.compile(r"^\s*(第[零一二三四五六七八九十百千万两〇\d]+[章回节卷集部篇]|卷[零一二三四五六七八九十百千万两〇\d]+)", re.MULTILINE)
+# 字数：汉字按字计，英文和数字按词计
+CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+WORD_RE = re.compile(r"[A-Za-z0-9]+")
+# txt开头常见的书名和作者写法
+TXT_TITLE_RE = re.compile(r"《([^》\n]{1,100})》")
+TXT_AUTHOR_RE = re.compile(r"作者\s*[：:]\s*([^\s\n]{1,50})")
+# 在开头多少个字符内查找书名和作者
+TXT_HEADER_CHARS = 2000
+OPF_NS = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+    'dc': 'http://purl.org/dc/elements/1.1/'
+}
+
+def detect_encoding(sample):
+    """按常见编码依次尝试解码样本，返回第一个能解码的编码"""
+    for encoding in candidate_encodings(sample):
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            # final=False：样本末尾被截断的多字节字符不算解码失败
+            decoder.decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+def count_words(text):
+    """统计字数（不为每个字生成字符串，长文本也不额外占用内存）"""
+    return len(text) - len(CJK_RE.sub("", text)) + sum(1 for _ in WORD_RE.finditer(text))
+
+class TextStats:
+    """分块统计正文的字数和章节数，只保留开头一段用于识别书名、作者和预览"""
+
+    def __init__(self):
+        self.word_count = 0
+        self.chapter_count = 0
+        self.header = ""
+        self._tail = ""
+
+    def feed(self, text):
+        """加入一段正文"""
+        if len(self.header) < TXT_HEADER_CHARS:
+            self.header += text[:TXT_HEADER_CHARS - len(self.header)]
+        text = self._tail + text
+        # 只统计到最后一个换行，剩下的半行留到下一块，词和章节标题不会被切开（超长的单行直接统计）
+        cut = text.rfind("\n") + 1
+        if cut == 0 and len(text) >= READ_CHUNK_BYTES:
+            cut = len(text)
+        self._count(text[:cut])
+        self._tail = text[cut:]
+
+    def close(self):
+        """统计最后剩下的半行"""
+        self._count(self._tail)
+        self._tail = ""
+
+    def _count(self, text):
+        if text:
+            self.word_count += count_words(text)
+            self.chapter_count += sum(1 for _ in CHAPTER_RE.finditer(text))
+
+def preview_lines(text):
+    """取正文开头的几行非空内容"""
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            lines.append(line[:PREVIEW_LINE_CHARS])
+            if len(lines) >= PREVIEW_LINES:
+                break
+    return "\n".join(lines)
+
+def _open_book(file_path):
+    """打开书籍文件，压缩存储的文件自动解压"""
+    opener = gzip.open if file_path.endswith('.gz') else open
+    return opener(file_path, 'rb')
+
+def _extract_txt(file_path):
+    """分块读取txt，同时计算MD5并统计，不把整本书读进内存"""
+    md5_hash = hashlib.md5()
+    stats = TextStats()
+    encoding = 'utf-8'
+    decoder = None
+    with _open_book(file_path) as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b""):
+            md5_hash.update(chunk)
+            if decoder is None:
+                encoding = detect_encoding(chunk[:ENCODING_SAMPLE_BYTES]) or 'utf-8'
+                decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            stats.feed(decoder.decode(chunk))
+    if decoder is not None:
+        stats.feed(decoder.decode(b"", final=True))
+    stats.close()
+
+    title = TXT_TITLE_RE.search(stats.header)
+    author = TXT_AUTHOR_RE.search(stats.header)
+    return {
+        'md5': md5_hash.hexdigest(),
+        'encoding': encoding,
+        'title': title.group(1).strip() if title else None,
+        'author': author.group(1).strip() if author else None,
+        'word_count': stats.word_count,
+        'chapter_count': stats.chapter_count,
+        'preview': preview_lines(stats.header)
+    }
+
+def _extract_epub(file_path):
+    """epub逐章统计，不拼接全书正文"""
+    with _open_book(file_path) as f:
+        data = f.read()
+    with zipfile.ZipFile(io.BytesIO(data)) as book:
+        # 从container.xml找到OPF文件，读取标题、作者和阅读顺序
+        container = ET.fromstring(book.read('META-INF/container.xml'))
+        rootfile = container.find('.//container:rootfile', OPF_NS)
+        opf_path = rootfile.get('full-path')
+        opf = ET.fromstring(book.read(opf_path))
+        opf_dir = posixpath.dirname(opf_path)
+
+        title = opf.findtext('.//dc:title', default=None, namespaces=OPF_NS)
+        author = opf.findtext('.//dc:creator', default=None, namespaces=OPF_NS)
+
+        manifest = {
+            item.get('id'): item.get('href')
+            for item in opf.findall('.//opf:manifest/opf:item', OPF_NS)
+        }
+        spine = [
+            manifest[itemref.get('idref')]
+            for itemref in opf.findall('.//opf:spine/opf:itemref', OPF_NS)
+            if itemref.get('idref') in manifest
+        ]
+
+        stats = TextStats()
+        for href in spine:
+            try:
+                content = book.read(posixpath.normpath(posixpath.join(opf_dir, href)))
+            except KeyError:
+                continue
+            stats.feed(HTML_TAG_RE.sub("\n", content.decode('utf-8', errors='replace')) + "\n")
+        stats.close()
+
+    return {
+        'md5': hashlib.md5(data).hexdigest(),
+        'encoding': 'utf-8',
+        'title': title.strip() if title else None,
+        'author': author.strip() if author else None,
+        'word_count': stats.word_count,
+        'chapter_count': len(spine),
+        'preview': preview_lines(stats.header)
+    }
+
+def extract_metadata(file_path, file_ext):
+    """提取书籍元数据：MD5、编码、字数、章节数、标题、作者和开头几行"""
+    if file_ext == '.epub':
+        return _extract_epub(file_path)
+    return _extract_txt(file_path)
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUTTLCache:
+    """线程安全的LRU缓存，每个条目有过期时间
+
+    超过容量时淘汰最久未使用的条目；条目写入ttl秒后过期。
+    """
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # {键: (过期时间, 值)}
+        self._lock = threading.RLock()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """获取缓存值，不存在或已过期时返回default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """获取缓存值但不计入命中统计、不调整LRU顺序"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= time.monotonic():
+                return default
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        """写入缓存"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, key, func):
+        """对已缓存的值原地修改（不改变过期时间），键不存在时不做任何事"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                func(item[1])
+                return True
+            return False
+
+    def pop(self, key, default=None):
+        """删除并返回缓存值"""
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits * 100 / total, 1) if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
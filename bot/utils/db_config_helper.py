@@ -23,4 +23,17 @@ def get_optimized_connection(db_config):
     """获取优化后的数据库连接"""
     connection = pymysql.connect(**db_config)
     optimize_mysql_connection(connection)
-    return connection 
\ No newline at end of file
+    return connection 
+
+def get_async_pool_config(db_config):
+    """把DB_CONFIG转换为aiomysql连接池参数，会话设置通过init_command在建连时执行一次"""
+    config = dict(db_config)
+    # aiomysql使用db而不是database
+    if 'database' in config:
+        config['db'] = config.pop('database')
+    config.setdefault('charset', 'utf8mb4')
+    # 读多写少，默认自动提交；需要原子性的多语句写入显式开启事务
+    config['autocommit'] = True
+    # 设置锁等待超时为5秒，并使用READ COMMITTED隔离级别减少锁定
+    config['init_command'] = "SET SESSION innodb_lock_wait_timeout = 5, SESSION tx_isolation = 'READ-COMMITTED'"
+    return config
@@ -0,0 +1,239 @@
+import threading
+import time
+from collections import deque
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from bot.utils.db_config_helper import optimize_mysql_connection
+
+class _PoolEntry:
+    """连接池中的一条物理连接"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+class PooledConnection:
+    """从连接池借出的连接，close() 时归还连接池而不是断开物理连接"""
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def close(self):
+        """归还连接，可重复调用"""
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry)
+
+    def __getattr__(self, name):
+        entry = self.__dict__.get('_entry')
+        if entry is None:
+            raise pymysql.err.InterfaceError(0, "连接已归还连接池")
+        return getattr(entry.raw, name)
+
+    def __del__(self):
+        # 兜底：调用方忘记close时由垃圾回收归还连接
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    """线程安全的MySQL连接池
+
+    - 会话参数只在建立物理连接时设置一次
+    - 借出时对空闲过久的连接做存活检查
+    - 超过最大存活时间的连接会被回收重建
+    """
+
+    def __init__(self, db_config, min_size=2, max_size=10, max_lifetime=3600,
+                 ping_interval=30, timeout=10):
+        self.db_config = db_config
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+
+        self._idle = deque()
+        self._size = 0  # 当前物理连接总数（空闲+借出）
+        self._cond = threading.Condition()
+
+        # 统计信息
+        self._waiters = 0
+        self._checkouts = 0
+        self._wait_count = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._created = 0
+        self._recycled = 0
+        self._broken = 0
+        self._timeouts = 0
+
+    def _connect(self):
+        """建立一条新的物理连接并设置会话参数"""
+        raw = pymysql.connect(**self.db_config)
+        optimize_mysql_connection(raw)
+        with self._cond:
+            self._created += 1
+        return _PoolEntry(raw)
+
+    def _discard(self, entry):
+        """关闭物理连接并释放名额"""
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _is_expired(self, entry, now):
+        return self.max_lifetime and now - entry.created_at > self.max_lifetime
+
+    def _is_alive(self, entry, now):
+        """空闲超过ping_interval的连接在借出前先ping一次"""
+        if now - entry.last_used < self.ping_interval:
+            return True
+        try:
+            entry.raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def fill(self):
+        """预先建立min_size条连接"""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def get_connection(self):
+        """借出一条连接，连接池已满时等待最多timeout秒"""
+        start = time.monotonic()
+        waited = False
+
+        while True:
+            entry = None
+            create = False
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise pymysql.err.OperationalError(
+                            0, f"获取数据库连接超时（{self.timeout}秒），连接池已满"
+                        )
+                    waited = True
+                    self._waiters += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    entry = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                now = time.monotonic()
+                if self._is_expired(entry, now):
+                    with self._cond:
+                        self._recycled += 1
+                    self._discard(entry)
+                    continue
+                if not self._is_alive(entry, now):
+                    with self._cond:
+                        self._broken += 1
+                    self._discard(entry)
+                    continue
+
+            wait_time = time.monotonic() - start
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._wait_count += 1
+                    self._total_wait += wait_time
+                    self._max_wait = max(self._max_wait, wait_time)
+            return PooledConnection(self, entry)
+
+    def _release(self, entry):
+        """归还连接：回滚未提交的事务，失效或过期的连接直接关闭"""
+        raw = entry.raw
+        if not raw.open:
+            with self._cond:
+                self._broken += 1
+            self._discard(entry)
+            return
+
+        if raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                raw.rollback()
+            except Exception:
+                with self._cond:
+                    self._broken += 1
+                self._discard(entry)
+                return
+
+        now = time.monotonic()
+        if self._is_expired(entry, now):
+            with self._cond:
+                self._recycled += 1
+            self._discard(entry)
+            return
+
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def close_all(self):
+        """关闭所有空闲连接（借出中的连接归还时仍会进入池中）"""
+        with self._cond:
+            entries = list(self._idle)
+            self._idle.clear()
+        for entry in entries:
+            self._discard(entry)
+
+    def get_stats(self):
+        """获取连接池统计信息"""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'waiters': self._waiters,
+                'checkouts': self._checkouts,
+                'wait_count': self._wait_count,
+                'total_wait_ms': round(self._total_wait * 1000, 1),
+                'avg_wait_ms': round(self._total_wait * 1000 / self._wait_count, 1) if self._wait_count else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 1),
+                'created': self._created,
+                'recycled': self._recycled,
+                'broken': self._broken,
+                'timeouts': self._timeouts
+            }
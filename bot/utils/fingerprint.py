@@ -0,0 +1,105 @@
+import codecs
+import re
+import zlib
+import zipfile
+from array import array
+
+# 签名由多少个桶组成（单次哈希分桶的MinHash）
+SIGNATURE_SIZE = 64
+# 每个分片多少个字节（UTF-8下约5个汉字）
+SHINGLE_BYTES = 15
+# 只保留汉字、字母和数字，去掉空白、标点和换行，换行方式、排版不同不影响签名
+NORMALIZE_RE = re.compile(r"[^0-9a-z\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+TEXT_ENCODINGS = ("utf-8-sig", "gb18030", "big5")
+# UTF-16几乎能解码任意偶数长度的数据，只在有BOM时使用
+UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+_BUCKET_SHIFT = 32 - (SIGNATURE_SIZE - 1).bit_length()
+_VALUE_MASK = (1 << _BUCKET_SHIFT) - 1
+_EMPTY = _VALUE_MASK + 1
+
+def candidate_encodings(data):
+    """数据可能的编码，按尝试顺序排列"""
+    if data.startswith(UTF16_BOMS):
+        return ("utf-16",) + TEXT_ENCODINGS
+    return TEXT_ENCODINGS
+
+def decode_text(data, partial=False):
+    """按常见编码依次尝试解码，GBK和UTF-8的同一本书解码后内容相同
+
+    partial为True表示数据是截取的开头部分，末尾被截断的多字节字符直接丢弃。
+    """
+    for encoding in candidate_encodings(data):
+        try:
+            return codecs.getincrementaldecoder(encoding)().decode(data, final=not partial)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="ignore")
+
+def extract_text(file_path, file_ext, max_chars):
+    """读取书籍正文，.txt直接解码，.epub取出所有html章节并去掉标签"""
+    if file_ext == ".epub":
+        parts = []
+        length = 0
+        with zipfile.ZipFile(file_path) as book:
+            for name in sorted(book.namelist()):
+                if not name.lower().endswith((".html", ".htm", ".xhtml")):
+                    continue
+                text = HTML_TAG_RE.sub(" ", decode_text(book.read(name)))
+                parts.append(text)
+                length += len(text)
+                if length >= max_chars:
+                    break
+        return "".join(parts)[:max_chars]
+
+    with open(file_path, "rb") as f:
+        # 多读一些，因为解码后字符数少于字节数
+        return decode_text(f.read(max_chars * 4), partial=True)[:max_chars]
+
+def normalize_text(text):
+    """统一大小写并去掉非正文字符"""
+    return NORMALIZE_RE.sub("", text.lower())
+
+def compute_signature(text):
+    """计算文本的MinHash签名，返回bytes
+
+    对每个字符分片只做一次crc32：高位决定分到哪个桶，低位作为值，每个桶保留最小值；
+    空桶用后面第一个非空桶的值填充。两个签名相同位置相等的比例近似于分片集合的Jaccard相似度。
+    """
+    data = normalize_text(text).encode("utf-8")
+    buckets = [_EMPTY] * SIGNATURE_SIZE
+    view = memoryview(data)
+    crc32 = zlib.crc32
+    shift = _BUCKET_SHIFT
+    mask = _VALUE_MASK
+    for i in range(max(len(data) - SHINGLE_BYTES + 1, 0)):
+        h = crc32(view[i:i + SHINGLE_BYTES])
+        bucket = h >> shift
+        value = h & mask
+        if value < buckets[bucket]:
+            buckets[bucket] = value
+
+    if all(value == _EMPTY for value in buckets):
+        return None
+    signature = list(buckets)
+    for i in range(SIGNATURE_SIZE):
+        j = i
+        while buckets[j % SIGNATURE_SIZE] == _EMPTY:
+            j += 1
+        signature[i] = buckets[j % SIGNATURE_SIZE]
+    return array("I", signature).tobytes()
+
+def compute_file_signature(file_path, file_ext, max_chars):
+    """计算书籍文件的签名，无法读取或没有正文时返回None"""
+    try:
+        return compute_signature(extract_text(file_path, file_ext, max_chars))
+    except Exception as e:
+        print(f"计算书籍指纹失败 {file_path}: {e}")
+        return None
+
+def signature_similarity(a, b):
+    """估算两个签名对应文本的相似度（0~1）"""
+    values_a = array("I", a)
+    values_b = array("I", b)
+    return sum(1 for x, y in zip(values_a, values_b) if x == y) / len(values_a)
@@ -3,11 +3,24 @@ import hashlib
 import random
 import asyncio
 import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from bot.config.config import CULTIVATION_STAGES
+from bot.config.config import (
+    CULTIVATION_STAGES, PILL_DROP_RATE, GOOD_EVENT_RATE, BAD_EVENT_RATE,
+    BREAKTHROUGH_EVENT_RATE, CULTIVATION_DEVIATION_RATE
+)
 from typing import List, Union
 from pyrogram.types import Message
 
+# 随机事件及其概率，按顺序累加
+RANDOM_EVENT_RATES = [
+    ("pill", PILL_DROP_RATE),  # 获得突破丹
+    ("good", GOOD_EVENT_RATE),  # 获得灵石
+    ("bad", BAD_EVENT_RATE),  # 丢失灵石
+    ("breakthrough", BREAKTHROUGH_EVENT_RATE),  # 直接突破
+    ("deviation", CULTIVATION_DEVIATION_RATE)  # 走火入魔
+]
+
 def calculate_md5(file_path):
     """计算文件的MD5值"""
     md5_hash = hashlib.md5()
@@ -17,6 +30,10 @@ def calculate_md5(file_path):
             md5_hash.update(byte_block)
     return md5_hash.hexdigest()
 
+def get_book_storage_path(base_dir, md5, file_ext):
+    """按MD5计算书籍的存储路径（两级分片目录，如 ab/cd/abcd...txt）"""
+    return os.path.join(base_dir, md5[:2], md5[2:4], f"{md5}{file_ext.lower()}")
+
 def ensure_dir(directory):
     """确保目录存在，不存在则创建"""
     if not os.path.exists(directory):
@@ -87,20 +104,14 @@ def format_leaderboard(players):
     return result
 
 def roll_random_event():
-    """随机生成事件类型"""
+    """随机生成事件类型（概率见配置文件）"""
     rand = random.random()
-    if rand < 0.02:  # 2%概率获得突破丹
-        return "pill"
-    elif rand < 0.05:  # 3%概率获得灵石
-        return "good"
-    elif rand < 0.07:  # 2%概率丢失灵石
-        return "bad"
-    elif rand < 0.09:  # 2%概率直接突破
-        return "breakthrough"
-    elif rand < 0.10:  # 1%概率走火入魔
-        return "deviation"
-    else:
-        return None
+    threshold = 0
+    for event, rate in RANDOM_EVENT_RATES:
+        threshold += rate
+        if rand < threshold:
+            return event
+    return None
 
 def is_allowed_file(filename, allowed_extensions):
     """检查文件是否是允许的类型"""
@@ -188,4 +199,18 @@ def auto_delete(delay=10):
             
             return result
         return wrapper
-    return decorator 
\ No newline at end of file
+    return decorator
+
+# 服务层同步调用在单独的线程中依次执行：不阻塞事件循环，
+# 同时保持与原先直接在事件循环中调用时一样的串行语义（服务内部的读-改-写不会互相穿插）
+_service_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="service")
+
+async def run_blocking(func, *args, **kwargs):
+    """在后台线程中执行同步的服务方法（如访问数据库的游戏、修仙逻辑），避免阻塞事件循环
+    
+    Args:
+        func: 同步函数
+        *args, **kwargs: 传给函数的参数
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_service_executor, functools.partial(func, *args, **kwargs))
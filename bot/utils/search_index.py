@@ -0,0 +1,146 @@
+import bisect
+import re
+import unicodedata
+
+# 英文和数字按整词索引，其他文字（中文等）按单字和相邻两字索引
+TOKEN_RE = re.compile(r"[a-z0-9]+|[^\x00-\x7f\W]+")
+ASCII_RE = re.compile(r"[a-z0-9]+")
+
+# 匹配程度：书名完全相同 > 书名以关键词开头 > 书名包含关键词 > 包含所有关键字但不连续
+MATCH_EXACT = 3
+MATCH_PREFIX = 2
+MATCH_SUBSTRING = 1
+MATCH_TERMS = 0
+
+def normalize(text):
+    """统一全角半角和大小写"""
+    return unicodedata.normalize('NFKC', text).lower()
+
+def _text_terms(text):
+    """书名中需要索引的词：英文词、中文单字和相邻两字"""
+    terms = set()
+    for token in TOKEN_RE.findall(text):
+        if ASCII_RE.fullmatch(token):
+            terms.add(token)
+            continue
+        terms.update(token)
+        terms.update(token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+def _query_terms(query):
+    """关键词中需要查找的词，返回(完整的词, 英文词前缀)
+
+    中文只取相邻两字（只有一个字时取单字）；最后一个英文词可能还没输完，按前缀匹配。
+    """
+    terms = set()
+    prefix = None
+    tokens = TOKEN_RE.findall(query)
+    for position, token in enumerate(tokens):
+        if ASCII_RE.fullmatch(token):
+            if position == len(tokens) - 1 and query.endswith(token):
+                prefix = token
+            else:
+                terms.add(token)
+        elif len(token) == 1:
+            terms.add(token)
+        else:
+            terms.update(token[i:i + 2] for i in range(len(token) - 1))
+    return terms, prefix
+
+class TitleSearchIndex:
+    """书名倒排索引
+
+    中文按单字和相邻两字、英文按整词建立倒排表，查询时只求几个倒排表的交集，
+    不需要逐本比较书名；增删书籍时只更新这本书涉及的词。
+    """
+
+    def __init__(self):
+        self._postings = {}  # {词: {书籍ID}}
+        self._ascii_terms = []  # 排好序的英文词，用于前缀查找
+        self._docs = {}  # {书籍ID: (规范化的书名, 排序键, 词集合)}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id, title, sort_key):
+        """加入或更新一本书，sort_key越大越新"""
+        text = normalize(title)
+        doc = self._docs.get(doc_id)
+        if doc is not None:
+            # 书名没有变化时只更新排序键
+            if doc[0] == text:
+                self._docs[doc_id] = (text, sort_key, doc[2])
+                return
+            self.remove(doc_id)
+
+        terms = _text_terms(text)
+        self._docs[doc_id] = (text, sort_key, terms)
+        for term in terms:
+            docs = self._postings.get(term)
+            if docs is None:
+                docs = self._postings[term] = set()
+                if ASCII_RE.fullmatch(term):
+                    bisect.insort(self._ascii_terms, term)
+            docs.add(doc_id)
+
+    def remove(self, doc_id):
+        """删除一本书"""
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc[2]:
+            docs = self._postings[term]
+            docs.discard(doc_id)
+            if not docs:
+                del self._postings[term]
+                if ASCII_RE.fullmatch(term):
+                    del self._ascii_terms[bisect.bisect_left(self._ascii_terms, term)]
+
+    def _prefix_docs(self, prefix):
+        """包含以prefix开头的英文词的书籍"""
+        docs = set()
+        start = bisect.bisect_left(self._ascii_terms, prefix)
+        for term in self._ascii_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            docs |= self._postings[term]
+        return docs
+
+    def _candidates(self, query):
+        terms, prefix = _query_terms(query)
+        if not terms and prefix is None:
+            # 关键词中没有可索引的文字（如只有标点），逐本比较
+            return {doc_id for doc_id, doc in self._docs.items() if query in doc[0]}
+
+        # 从最短的倒排表开始求交集
+        postings = sorted((self._postings.get(term, set()) for term in terms), key=len)
+        if prefix is not None:
+            postings.append(self._prefix_docs(prefix))
+        candidates = set(postings[0])
+        for docs in postings[1:]:
+            candidates &= docs
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, query, limit):
+        """搜索书名，按匹配程度和新旧排序，最多返回limit个书籍ID"""
+        query = normalize(query).strip()
+        if not query:
+            return []
+
+        scored = []
+        for doc_id in self._candidates(query):
+            text, sort_key, _ = self._docs[doc_id]
+            if text == query:
+                quality = MATCH_EXACT
+            elif text.startswith(query):
+                quality = MATCH_PREFIX
+            elif query in text:
+                quality = MATCH_SUBSTRING
+            else:
+                quality = MATCH_TERMS
+            scored.append((quality, sort_key, doc_id))
+
+        scored.sort(reverse=True)
+        return [doc_id for _, _, doc_id in scored[:limit]]